@@ -0,0 +1,304 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import ctypes
+import gc
+import glob
+import json
+import logging
+import subprocess
+import time
+from datetime import datetime
+import faiss
+import numpy as np
+from models.indexing import SongIndexer
+from models.sharded_index import ShardedSongIndex
+from benchmark_playlists import synthetic_indexer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results')
+
+FEATURES = [
+    'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
+    'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo',
+    'duration_ms', 'time_signature'
+]
+
+SYNTHETIC_SIZES = [10000, 100000, 1000000, 10000000]
+
+
+def index_configs(n_songs, dimension):
+    """
+    Parameter sets to benchmark for a catalog of the given size and dimension.
+
+    IVF cluster counts follow the usual 4 * sqrt(n) rule, capped so that every
+    cluster keeps at least 39 training points, and PQ sizes divide the dimension.
+    """
+    num_clusters = int(max(4, min(4 * np.sqrt(n_songs), n_songs // 39)))
+    pq_sizes = sorted({n for n in (dimension // 2, dimension) if n > 0 and dimension % n == 0})
+
+    configs = [('FlatL2', {}), ('FlatIP', {})]
+    configs += [('HNSWFlat', {'m': m}) for m in (16, 32)]
+    for nprobe in (1, 10, 32):
+        configs.append(('IVFFlat', {'num_clusters': num_clusters, 'nprobe': min(nprobe, num_clusters)}))
+    for n_pq in pq_sizes:
+        for nprobe in (10, 32):
+            configs.append(('IVFPQ', {'num_clusters': num_clusters, 'n_pq': n_pq, 'nprobe': min(nprobe, num_clusters)}))
+    return configs
+
+
+def recall_at_k(approx, ground_truth):
+    """Mean fraction of the exact top-k neighbours found in the approximate top-k."""
+    k = ground_truth.shape[1]
+    hits = (approx[:, :, None] == ground_truth[:, None, :]).any(axis=2) & (approx != -1)
+    return float(hits.sum() / (len(ground_truth) * k))
+
+
+def resident_set_bytes():
+    """
+    Return the resident set size of this process in bytes, or None where /proc is not available.
+
+    Freed heap memory is handed back to the OS first (glibc malloc_trim), so the difference
+    of two calls counts the memory still allocated, not what the allocator kept cached.
+    """
+    gc.collect()
+    try:
+        ctypes.CDLL(None).malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def exact_neighbours(vectors, query_ids, k, metric='l2'):
+    """
+    Find the exact k nearest neighbours of some rows by brute force.
+
+    Args:
+        vectors (np.ndarray): Catalog vectors
+        query_ids (np.ndarray): Rows used as queries
+        k (int): Number of neighbours per query
+        metric (str): 'l2' for Euclidean distance or 'cosine' for cosine similarity
+
+    Returns:
+        np.ndarray: (len(query_ids), k) neighbour rows
+    """
+    vectors = np.array(vectors, dtype=np.float32)
+    if metric == 'cosine':
+        faiss.normalize_L2(vectors)
+        exact = faiss.IndexFlatIP(vectors.shape[1])
+    else:
+        exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, neighbours = exact.search(np.ascontiguousarray(vectors[query_ids]), k)
+    return neighbours
+
+
+def benchmark_index(indexer, index_type, params, query_ids, ground_truth, k=10, n_single=200):
+    """
+    Build one index and measure its quality, speed and size.
+
+    Args:
+        indexer (SongIndexer): Indexer holding the unmodified reduced data
+        index_type (str): Index type passed to create_index
+        params (dict): Index parameters passed to create_index
+        query_ids (np.ndarray): Rows used as queries
+        ground_truth (np.ndarray): Exact neighbours of the queries under the metric of index_type
+        k (int): Number of neighbours per query
+        n_single (int): Number of queries timed one at a time
+
+    Returns:
+        dict: recall@k, single-query and batched QPS, p50/p99 latency, build time, the
+            on-disk size of the serialized index and the resident set growth of building
+            and filling it (None without /proc), both in bytes
+    """
+    original_data = indexer.reduced_data
+    # The previous index is released first, so it is not part of the resident baseline
+    indexer.index = None
+    indexer.quantizers = {}
+    rss_before = resident_set_bytes()
+    try:
+        start = time.perf_counter()
+        index = indexer.create_index(index_type=index_type, **params)
+        build_time = time.perf_counter() - start
+
+        # FlatIP searches with the normalized copy that create_index stored
+        queries = np.ascontiguousarray(indexer.reduced_data[query_ids])
+    finally:
+        indexer.reduced_data = original_data
+    # Measured once the normalized FlatIP copy is released again
+    rss_after = resident_set_bytes()
+
+    latencies = []
+    for query in queries[:n_single]:
+        start = time.perf_counter()
+        index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    distances, approx = index.search(queries, k)
+    batched_time = time.perf_counter() - start
+
+    return {
+        'index_type': index_type,
+        'params': params,
+        'recall_at_k': recall_at_k(approx, ground_truth),
+        'single_qps': len(latencies) / sum(latencies),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'batched_qps': len(queries) / batched_time,
+        'build_time_s': build_time,
+        'serialized_bytes': int(faiss.serialize_index(index).nbytes),
+        'resident_bytes': None if rss_before is None else rss_after - rss_before,
+    }
+
+
+def benchmark_catalog(name, indexer, k=10, n_queries=1000, seed=0):
+    """
+    Benchmark every index configuration on one catalog against exact search results.
+
+    FlatIP ranks by cosine similarity, so its recall is measured against exact cosine
+    neighbours and every other index type against exact L2 neighbours.
+
+    Args:
+        name (str): Catalog label written to the results
+        indexer (SongIndexer): Indexer with reduced data
+        k (int): Number of neighbours per query
+        n_queries (int): Number of catalog songs used as queries
+        seed (int): Seed for the query sample
+
+    Returns:
+        list: One result dict per index configuration
+    """
+    n_songs, dimension = indexer.reduced_data.shape
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(n_songs, size=min(n_queries, n_songs), replace=False)
+
+    ground_truths = {metric: exact_neighbours(indexer.reduced_data, query_ids, k, metric)
+                     for metric in ('l2', 'cosine')}
+
+    results = []
+    for index_type, params in index_configs(n_songs, dimension):
+        try:
+            metric = 'cosine' if index_type == 'FlatIP' else 'l2'
+            result = benchmark_index(indexer, index_type, params, query_ids, ground_truths[metric], k=k)
+        except Exception as e:
+            logging.error(f"Benchmark of {index_type} {params} on {name} failed: {str(e)}")
+            continue
+        result.update({'catalog': name, 'n_songs': n_songs, 'dimension': dimension, 'ground_truth': metric})
+        results.append(result)
+        print(f"{name:24s} {index_type:9s} {json.dumps(params):48s} "
+              f"recall@{k}: {result['recall_at_k']:.3f}  "
+              f"qps: {result['single_qps']:9.1f} / {result['batched_qps']:10.1f}  "
+              f"p99: {result['p99_ms']:7.3f} ms  "
+              f"build: {result['build_time_s']:7.2f} s  "
+              f"on disk: {result['serialized_bytes'] / 2**20:8.1f} MiB"
+              + (f"  resident: {result['resident_bytes'] / 2**20:8.1f} MiB" if result['resident_bytes'] is not None else ""))
+    return results
+
+
+def benchmark_sharded_search(n_shards=8, shard_size=100000, n_components=10, k=10, n_queries=1000,
+                             index_type='FlatL2', seed=0):
+    """
+    Measure how fan-out search over genre shards scales with the number of search threads.
+
+    Synthetic shards are attached to a ShardedSongIndex in memory. Every query batch is
+    searched with one thread (shards one after another) and with one thread per shard,
+    next to a single index over all songs.
+
+    Returns:
+        dict: Batched QPS per configuration and whether both fan-outs returned the same songs
+    """
+    shards = {}
+    for i in range(n_shards):
+        indexer = synthetic_indexer(n_songs=shard_size, n_components=n_components, seed=seed + i)
+        indexer.create_index(index_type=index_type)
+        shards[f'shard{i}'] = indexer
+    queries = np.random.default_rng(seed).standard_normal((n_queries, n_components)).astype(np.float32)
+
+    combined = SongIndexer(n_components=n_components)
+    combined.reduced_data = np.concatenate([indexer.reduced_data for indexer in shards.values()])
+    index = combined.create_index(index_type=index_type)
+    start = time.perf_counter()
+    index.search(queries, k)
+    results = {'single_index_qps': n_queries / (time.perf_counter() - start)}
+
+    merged = {}
+    for name, workers in (('sequential', 1), ('parallel', n_shards)):
+        sharded = ShardedSongIndex(None, [], n_components=n_components, max_workers=workers, index_type=index_type)
+        sharded.shards = shards
+        start = time.perf_counter()
+        merged[name] = sharded.search(queries, k)
+        results[f'{name}_qps'] = n_queries / (time.perf_counter() - start)
+        sharded.close()
+    results['matching'] = bool(
+        (merged['sequential'][1] == merged['parallel'][1]).all() and (merged['sequential'][2] == merged['parallel'][2]).all()
+    )
+    return results
+
+
+def git_revision():
+    """Return the current git commit of the repository, if available."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/QPS/memory benchmark for the SongIndexer index types")
+    parser.add_argument('--csv', nargs='*', default=sorted(glob.glob('data/*_songs_features.csv')),
+                        help="Song CSV files to benchmark (default: data/*_songs_features.csv)")
+    parser.add_argument('--sizes', nargs='*', type=int, default=SYNTHETIC_SIZES,
+                        help="Synthetic catalog sizes to benchmark")
+    parser.add_argument('--n-components', type=int, default=10)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--shards', type=int, default=8, help="Shards of the fan-out search benchmark (0 to skip)")
+    parser.add_argument('--shard-size', type=int, default=100000, help="Songs per shard")
+    parser.add_argument('--output', default=None, help="Results JSON file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output = args.output or os.path.join(RESULTS_DIR, f'index_benchmark_{timestamp}.json')
+
+    results = []
+    for filepath in args.csv:
+        indexer = SongIndexer(n_components=args.n_components)
+        indexer.load_and_preprocess(filepath, FEATURES)
+        results += benchmark_catalog(os.path.basename(filepath), indexer, k=args.k, n_queries=args.queries)
+    for n_songs in args.sizes:
+        indexer = synthetic_indexer(n_songs=n_songs, n_components=args.n_components)
+        results += benchmark_catalog(f'synthetic_{n_songs}', indexer, k=args.k, n_queries=args.queries)
+
+    sharded = None
+    if args.shards:
+        sharded = benchmark_sharded_search(args.shards, args.shard_size, args.n_components, k=args.k,
+                                           n_queries=args.queries)
+        print(f"sharded fan-out ({args.shards} x {args.shard_size}) single index: {sharded['single_index_qps']:9.1f} qps  "
+              f"sequential: {sharded['sequential_qps']:9.1f} qps  parallel: {sharded['parallel_qps']:9.1f} qps  "
+              f"identical: {sharded['matching']}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'timestamp': timestamp,
+            'git_revision': git_revision(),
+            'faiss_version': faiss.__version__,
+            'k': args.k,
+            'n_queries': args.queries,
+            'results': results,
+            'sharded_search': sharded,
+        }, f, indent=2)
+    print(f"\nResults saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
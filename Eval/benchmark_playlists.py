@@ -0,0 +1,295 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import logging
+import numpy as np
+from models.indexing import SongIndexer
+
+
+def synthetic_indexer(n_songs=100000, n_components=10, n_clusters=None, seed=0):
+    """
+    Create a SongIndexer over random vectors, for benchmarking without the CSV files.
+
+    With n_clusters set, songs are drawn around that many centres with a small spread,
+    which reproduces the dense clusters where every top-10 neighbour is already taken.
+    """
+    rng = np.random.default_rng(seed)
+    indexer = SongIndexer(n_components=n_components)
+    if n_clusters is None:
+        indexer.reduced_data = rng.standard_normal((n_songs, n_components)).astype(np.float32)
+    else:
+        centres = rng.standard_normal((n_clusters, n_components)) * 10
+        noise = rng.standard_normal((n_songs, n_components)) * 0.01
+        indexer.reduced_data = (centres[rng.integers(0, n_clusters, n_songs)] + noise).astype(np.float32)
+    return indexer
+
+
+class CountingIndex:
+    """Wrap a FAISS index and count the search calls made through it."""
+
+    def __init__(self, index):
+        self.index = index
+        self.ntotal = index.ntotal
+        self.searches = 0
+
+    def search(self, x, k):
+        self.searches += 1
+        return self.index.search(x, k)
+
+
+def benchmark_batched_playlists(indexer, index, n_playlists=1000, playlist_size=20, seed=0):
+    """
+    Compare build_playlist in a loop against one build_playlists call.
+
+    Args:
+        indexer (SongIndexer): Indexer with reduced data
+        index (faiss.Index): Index to search
+        n_playlists (int): Number of playlists to generate
+        playlist_size (int): Length of each playlist
+        seed (int): Seed for the random start songs
+
+    Returns:
+        dict: Timings, throughput and the number of playlists identical in both paths
+    """
+    rng = np.random.default_rng(seed)
+    start_indices = rng.integers(0, len(indexer.reduced_data), n_playlists)
+
+    start = time.perf_counter()
+    single = [indexer.build_playlist(index, int(s), playlist_size) for s in start_indices]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = indexer.build_playlists(index, start_indices, playlist_size)
+    batched_time = time.perf_counter() - start
+
+    return {
+        'single_time': single_time,
+        'batched_time': batched_time,
+        'single_playlists_per_sec': n_playlists / single_time,
+        'batched_playlists_per_sec': n_playlists / batched_time,
+        'speedup': single_time / batched_time,
+        'matching': sum(a == b for a, b in zip(single, batched)),
+    }
+
+
+def benchmark_playlist_latency(indexer, index, playlist_sizes=(100, 1000), n_playlists=20, seed=0):
+    """
+    Measure build_playlist latency and search calls per added song for long playlists.
+
+    Args:
+        indexer (SongIndexer): Indexer with reduced data
+        index (faiss.Index): Index to search
+        playlist_sizes (tuple): Playlist lengths to measure
+        n_playlists (int): Number of playlists generated per length
+        seed (int): Seed for the random start songs
+
+    Returns:
+        dict: Per playlist length, the p50/p99/mean latency in ms and the searches per song
+    """
+    rng = np.random.default_rng(seed)
+    counting_index = CountingIndex(index)
+    results = {}
+    for playlist_size in playlist_sizes:
+        latencies = []
+        counting_index.searches = 0
+        added = 0
+        for start_index in rng.integers(0, len(indexer.reduced_data), n_playlists):
+            start = time.perf_counter()
+            playlist = indexer.build_playlist(counting_index, int(start_index), playlist_size)
+            latencies.append((time.perf_counter() - start) * 1000)
+            added += len(playlist) - 1
+        results[playlist_size] = {
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'mean_ms': float(np.mean(latencies)),
+            'searches_per_song': counting_index.searches / max(added, 1),
+        }
+    return results
+
+
+def playlist_spread(indexer, playlist):
+    """Return the mean distance of a playlist's songs to its start song and to each other."""
+    vectors = indexer.reduced_data[playlist].astype(np.float64)
+    to_start = np.linalg.norm(vectors[1:] - vectors[0], axis=1).mean()
+    pairwise = np.linalg.norm(vectors[:, None, :] - vectors[None, :, :], axis=2)
+    n = len(playlist)
+    return to_start, pairwise.sum() / (n * (n - 1))
+
+
+def benchmark_diverse_playlists(indexer, index, playlist_size=50, diversities=(0.0, 0.3, 0.7),
+                                n_playlists=20, seed=0):
+    """
+    Compare the greedy chain of build_playlist with build_diverse_playlist.
+
+    Args:
+        indexer (SongIndexer): Indexer with reduced data
+        index (faiss.Index): Index to search
+        playlist_size (int): Length of the playlists
+        diversities (tuple): Diversity settings of build_diverse_playlist to measure
+        n_playlists (int): Number of playlists generated per method
+        seed (int): Seed for the random start songs
+
+    Returns:
+        dict: Per method, the p50 latency in ms, searches per playlist and the mean
+            distance of the songs to the start song and to each other
+    """
+    rng = np.random.default_rng(seed)
+    start_indices = rng.integers(0, len(indexer.reduced_data), n_playlists)
+    counting_index = CountingIndex(index)
+    methods = {'greedy chain': lambda i: indexer.build_playlist(counting_index, i, playlist_size)}
+    for diversity in diversities:
+        methods[f'mmr {diversity:.1f}'] = (
+            lambda i, d=diversity: indexer.build_diverse_playlist(counting_index, i, playlist_size, diversity=d))
+
+    results = {}
+    for name, build in methods.items():
+        latencies, spreads = [], []
+        counting_index.searches = 0
+        for start_index in start_indices:
+            start = time.perf_counter()
+            playlist = build(int(start_index))
+            latencies.append((time.perf_counter() - start) * 1000)
+            spreads.append(playlist_spread(indexer, playlist))
+        to_start, pairwise = np.mean(spreads, axis=0)
+        results[name] = {
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'searches_per_playlist': counting_index.searches / n_playlists,
+            'distance_to_start': float(to_start),
+            'pairwise_distance': float(pairwise),
+        }
+    return results
+
+
+def benchmark_neighbour_cache(indexer, index, n_playlists=2000, playlist_size=20, zipf_exponent=1.3, seed=0):
+    """
+    Measure build_playlist with and without the neighbour cache on skewed seed traffic.
+
+    Start songs are drawn from a Zipf distribution, so a few popular seeds come back
+    again and again, as in serving traffic.
+
+    Args:
+        indexer (SongIndexer): Indexer whose index is index
+        index (faiss.Index): The indexer's own index (the cache only serves indexer.index)
+        n_playlists (int): Number of playlists generated per run
+        playlist_size (int): Songs per playlist
+        zipf_exponent (float): Skew of the start song popularity
+        seed (int): Seed for the start songs
+
+    Returns:
+        dict: Playlists per second without and with the cache, the speedup, the cache
+            statistics of the cached run and whether both runs built the same playlists
+    """
+    rng = np.random.default_rng(seed)
+    n_songs = len(indexer.reduced_data)
+    start_indices = (rng.zipf(zipf_exponent, n_playlists) - 1) % n_songs
+    capacity = indexer.neighbour_cache.capacity
+
+    results, playlists = {}, {}
+    for name, cache_size in (('uncached', 0), ('cached', capacity)):
+        indexer.neighbour_cache.capacity = cache_size
+        indexer.invalidate_neighbours()
+        before = indexer.neighbour_cache.stats()
+        start = time.perf_counter()
+        playlists[name] = [indexer.build_playlist(index, int(i), playlist_size) for i in start_indices]
+        results[f'{name}_playlists_per_sec'] = n_playlists / (time.perf_counter() - start)
+    stats = indexer.neighbour_cache.stats()
+    lookups = stats['hits'] + stats['misses'] - before['hits'] - before['misses']
+    results['hit_rate'] = (stats['hits'] - before['hits']) / lookups if lookups else 0.0
+    results['evictions'] = stats['evictions'] - before['evictions']
+    results['speedup'] = results['cached_playlists_per_sec'] / results['uncached_playlists_per_sec']
+    results['matching'] = playlists['cached'] == playlists['uncached']
+    return results
+
+
+def benchmark_knn_graph(indexer, index, playlist_size=100, n_playlists=200, seed=0):
+    """
+    Compare build_playlist with live searches against walking a precomputed kNN graph.
+
+    Args:
+        indexer (SongIndexer): Indexer whose index is index, without a kNN graph
+        index (faiss.Index): Index to search
+        playlist_size (int): Songs per playlist
+        n_playlists (int): Number of playlists generated per mode
+        seed (int): Seed for the start songs
+
+    Returns:
+        dict: Graph build time, playlists per second and searches per playlist of both
+            modes, and the share of identical playlists
+    """
+    rng = np.random.default_rng(seed)
+    start_indices = rng.integers(0, len(indexer.reduced_data), n_playlists)
+    counting_index = CountingIndex(index)
+    results, playlists = {}, {}
+    for mode in ('live', 'graph'):
+        if mode == 'graph':
+            start = time.perf_counter()
+            indexer.build_knn_graph(index)
+            results['build_time_s'] = time.perf_counter() - start
+        counting_index.searches = 0
+        start = time.perf_counter()
+        playlists[mode] = [indexer.build_playlist(counting_index, int(i), playlist_size) for i in start_indices]
+        results[f'{mode}_playlists_per_sec'] = n_playlists / (time.perf_counter() - start)
+        results[f'{mode}_searches_per_playlist'] = counting_index.searches / n_playlists
+    results['matching'] = float(np.mean([a == b for a, b in zip(playlists['live'], playlists['graph'])]))
+    indexer.knn_neighbours = indexer.knn_distances = None
+    return results
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    indexer = synthetic_indexer()
+    n_playlists = 1000
+    index_configs = {
+        "FlatL2": {},
+        "HNSWFlat": {"m": 32},
+        "IVFFlat": {"num_clusters": 100, "nprobe": 10},
+    }
+
+    print("\n=== Batched playlist generation ===")
+    for name, config in index_configs.items():
+        index = indexer.create_index(index_type=name, **config)
+        result = benchmark_batched_playlists(indexer, index, n_playlists=n_playlists)
+        print(f"{name:10s} single: {result['single_playlists_per_sec']:9.1f} playlists/s  "
+              f"batched: {result['batched_playlists_per_sec']:9.1f} playlists/s  "
+              f"speedup: {result['speedup']:5.1f}x  "
+              f"identical: {result['matching']}/{n_playlists}")
+
+    # Tight clusters of ~50 songs force the search to widen k for long playlists
+    clustered = synthetic_indexer(n_songs=20000, n_clusters=400)
+    print("\n=== Long playlist latency (clustered catalog) ===")
+    for name, config in index_configs.items():
+        index = clustered.create_index(index_type=name, **config)
+        for playlist_size, result in benchmark_playlist_latency(clustered, index).items():
+            print(f"{name:10s} size {playlist_size:5d}  p50: {result['p50_ms']:8.2f} ms  "
+                  f"p99: {result['p99_ms']:8.2f} ms  searches/song: {result['searches_per_song']:.2f}")
+
+    print("\n=== Precomputed kNN graph (clustered catalog, 100-song playlists) ===")
+    for name, config in index_configs.items():
+        index = clustered.create_index(index_type=name, **config)
+        result = benchmark_knn_graph(clustered, index)
+        print(f"{name:10s} build: {result['build_time_s']:6.2f} s  "
+              f"live: {result['live_playlists_per_sec']:8.1f} playlists/s ({result['live_searches_per_playlist']:6.1f} searches)  "
+              f"graph: {result['graph_playlists_per_sec']:8.1f} playlists/s ({result['graph_searches_per_playlist']:5.2f} searches)  "
+              f"identical: {result['matching']:.2f}")
+
+    print("\n=== Neighbour cache (Zipf distributed start songs) ===")
+    for name, config in index_configs.items():
+        index = indexer.create_index(index_type=name, **config)
+        result = benchmark_neighbour_cache(indexer, index)
+        print(f"{name:10s} uncached: {result['uncached_playlists_per_sec']:8.1f} playlists/s  "
+              f"cached: {result['cached_playlists_per_sec']:8.1f} playlists/s  speedup: {result['speedup']:4.1f}x  "
+              f"hit rate: {result['hit_rate']:.2f}  evictions: {result['evictions']}  identical: {result['matching']}")
+
+    print("\n=== Diversity reranked playlists (single candidate pool) ===")
+    for name, config in index_configs.items():
+        index = indexer.create_index(index_type=name, **config)
+        for method, result in benchmark_diverse_playlists(indexer, index).items():
+            print(f"{name:10s} {method:13s} p50: {result['p50_ms']:7.2f} ms  "
+                  f"searches: {result['searches_per_playlist']:6.1f}  "
+                  f"to start: {result['distance_to_start']:.3f}  pairwise: {result['pairwise_distance']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
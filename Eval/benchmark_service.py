@@ -0,0 +1,177 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from urllib.parse import urlparse
+import numpy as np
+from models.indexing import NeighbourCache, SongIndexer
+from models.playlist_service import BATCH_WINDOW, PlaylistService
+from benchmark_playlists import synthetic_indexer
+
+
+class Connection:
+    """Keep-alive HTTP/1.1 connection sending JSON requests."""
+
+    def __init__(self, reader, writer, host):
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+
+    @classmethod
+    async def open(cls, url):
+        parsed = urlparse(url)
+        reader, writer = await asyncio.open_connection(parsed.hostname, parsed.port)
+        return cls(reader, writer, parsed.netloc)
+
+    async def request(self, method, path, body=None):
+        """Send one request and return (status, decoded JSON response)."""
+        payload = json.dumps(body).encode() if body is not None else b''
+        self.writer.write(
+            f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'.encode() + payload
+        )
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        self.writer.close()
+
+
+async def generate_load(url, n_clients=32, n_requests=2000, playlist_size=20, extend_share=0.2, seed=0):
+    """
+    Send requests from concurrent clients, each on its own connection, and time them.
+
+    Every client sends its next request as soon as the previous one is answered.
+    A share of the requests extends a playlist of five random seeds, the others
+    generate a playlist from a random start song.
+
+    Args:
+        url (str): Base URL of the service
+        n_clients (int): Concurrent connections
+        n_requests (int): Total number of requests
+        playlist_size (int): Songs per playlist
+        extend_share (float): Fraction of /extend requests
+        seed (int): Seed of the random songs
+
+    Returns:
+        dict: Requests, errors, elapsed seconds, requests per second and p50/p99/mean latency in ms
+    """
+    connection = await Connection.open(url)
+    _, health = await connection.request('GET', '/health')
+    connection.close()
+    n_songs = health['songs']
+
+    rng = np.random.default_rng(seed)
+    bodies = []
+    for extend in rng.random(n_requests) < extend_share:
+        if extend:
+            bodies.append(('/extend', {'seed_indices': rng.integers(0, n_songs, 5).tolist(), 'size': playlist_size}))
+        else:
+            bodies.append(('/playlist', {'start_index': int(rng.integers(0, n_songs)), 'size': playlist_size}))
+    queue = deque(bodies)
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        connection = await Connection.open(url)
+        try:
+            while queue:
+                path, body = queue.popleft()
+                start = time.perf_counter()
+                status, _ = await connection.request('POST', path, body)
+                latencies.append(time.perf_counter() - start)
+                errors += status != 200
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(n_clients)))
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+    }
+
+
+async def benchmark_service(indexer, batch_window, **load_params):
+    """
+    Start a PlaylistService on a free local port, put it under load and stop it.
+
+    Every run starts from an empty neighbour cache, so runs with the same requests do
+    not serve each other's neighbour lists.
+
+    Returns:
+        dict: Client side results of generate_load, with the service's own stats under 'service'
+    """
+    indexer.neighbour_cache = NeighbourCache(indexer.neighbour_cache.capacity)
+    service = await PlaylistService(indexer, batch_window=batch_window).start(port=0)
+    try:
+        result = await generate_load(service.url, **load_params)
+        result['service'] = service.stats()
+    finally:
+        await service.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency/throughput load generator for the playlist service")
+    parser.add_argument('--url', default=None, help="Service to load (default: start one in-process)")
+    parser.add_argument('--artifacts', default=None,
+                        help="SongIndexer.save directory served in-process (default: synthetic catalog)")
+    parser.add_argument('--songs', type=int, default=100000, help="Size of the synthetic catalog")
+    parser.add_argument('--index-type', default='IVFFlat', help="Index type of the synthetic catalog")
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=20, help="Songs per playlist")
+    parser.add_argument('--extend-share', type=float, default=0.2)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    load_params = {'n_clients': args.clients, 'n_requests': args.requests, 'playlist_size': args.size,
+                   'extend_share': args.extend_share}
+
+    if args.url:
+        results = {'remote': asyncio.run(generate_load(args.url, **load_params))}
+    else:
+        if args.artifacts:
+            indexer = SongIndexer.load(args.artifacts)
+        else:
+            indexer = synthetic_indexer(n_songs=args.songs)
+            indexer.create_index(index_type=args.index_type)
+        results = {}
+        for name, batch_window in (('unbatched', None), (f'batched {BATCH_WINDOW * 1000:g} ms', BATCH_WINDOW)):
+            results[name] = asyncio.run(benchmark_service(indexer, batch_window, **load_params))
+
+    for name, result in results.items():
+        print(f"{name:18s} {result['requests']:6d} requests ({result['errors']} errors) "
+              f"in {result['elapsed']:6.2f} s: {result['requests_per_second']:8.1f} req/s  "
+              f"p50: {result['p50_ms']:7.2f} ms  p99: {result['p99_ms']:7.2f} ms")
+        for endpoint, batching in result.get('service', {}).get('batching', {}).items():
+            print(f"{'':18s} {endpoint:8s} {batching['requests']} requests in {batching['batches']} batches "
+                  f"({batching['mean_batch_size']:.1f} per batch)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+from models.indexing import SongIndexer
+
+FEATURES = ['danceability', 'energy', 'loudness', 'tempo', 'valence']
+INDEX_CONFIGS = {
+    "FlatL2": {},
+    "HNSWFlat": {"m": 32},
+    "IVFFlat": {"num_clusters": 20, "nprobe": 5},
+    "IVFPQ": {"num_clusters": 20, "nprobe": 5, "n_pq": 2},
+}
+
+
+def synthetic_songs(n_songs, first_id=0, seed=0):
+    """Create a song table with random feature values and track ids t<first_id>, t<first_id + 1>, ..."""
+    rng = np.random.default_rng(seed)
+    songs = pd.DataFrame(rng.random((n_songs, len(FEATURES))), columns=FEATURES)
+    songs.insert(0, 'id', [f't{first_id + i}' for i in range(n_songs)])
+    songs.insert(1, 'name', [f'Song {first_id + i}' for i in range(n_songs)])
+    songs.insert(2, 'artist', 'Artist')
+    return songs
+
+
+def check_update_in_place(filepath, index_type, playlist_size=15, **index_params):
+    """
+    Load saved artifacts memory-mapped, add and remove songs and save them back into the same directory.
+
+    Returns:
+        dict: Whether the reloaded indexer holds the updated songs and builds the same
+            playlist as the updated one, without any removed song
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        indexer = SongIndexer(n_components=4)
+        indexer.load_and_preprocess(filepath, FEATURES)
+        indexer.create_index(index_type=index_type, **index_params)
+        indexer.save(directory)
+
+        updated = SongIndexer.load(directory)
+        added = updated.add_songs(synthetic_songs(100, first_id=len(updated.reduced_data), seed=1))
+        removed = updated.remove_songs(['t1', 't2', f't{len(updated.reduced_data) - 1}'])
+        updated.save(directory)
+
+        reloaded = SongIndexer.load(directory)
+        playlist = reloaded.build_playlist(reloaded.index, 3, playlist_size)
+        return {
+            'songs': len(reloaded.reduced_data) == len(updated.reduced_data) and len(added) == 100,
+            'removed': np.array_equal(np.flatnonzero(reloaded.removed_mask), np.sort(removed)),
+            'playlist': playlist == updated.build_playlist(updated.index, 3, playlist_size),
+            'no_removed_songs': not set(removed.tolist()) & set(playlist),
+        }
+
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, 'songs.csv')
+        synthetic_songs(5000).to_csv(filepath, index=False)
+        failed = False
+        for name, config in INDEX_CONFIGS.items():
+            result = check_update_in_place(filepath, name, **config)
+            failed |= not all(result.values())
+            print(f"{name:10s} " + "  ".join(f"{check}: {'ok' if passed else 'FAILED'}" for check, passed in result.items()))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tracemalloc
+import numpy as np
+from similarity_playlist import calculate_average_pairwise_distance, calculate_centroid_distance, \
+    calculate_cosine_similarity, evaluate_playlist_pairs
+
+# (pairs, songs per first playlist, songs per second playlist, max_chunk_elements)
+CASES = [
+    (20000, 200, 200, 1 << 24),
+    (5000, 50, 7, 1 << 20),
+    (300, 1, 300, 1 << 16),
+]
+# Pairs compared against the single pair functions per case
+N_COMPARED = 200
+
+
+def random_playlists(rng, n_songs, n_playlists, max_len):
+    """Draw playlists as an index array, with every third playlist padded to half its length."""
+    playlists = rng.integers(0, n_songs, (n_playlists, max_len))
+    playlists[::3, max(1, max_len // 2):] = -1
+    return playlists
+
+
+def check_case(reduced_data, n_pairs, len1, len2, max_chunk_elements, seed=0):
+    """
+    Evaluate random playlist pairs and check the peak memory and the metrics.
+
+    Peak memory is traced with tracemalloc. Besides the max_chunk_elements float64 values
+    of a chunk, only the per pair results and playlist lengths may be allocated.
+
+    Returns:
+        dict: Peak MiB, the allowed MiB and whether the memory and the metrics check out
+    """
+    rng = np.random.default_rng(seed)
+    playlists1 = random_playlists(rng, len(reduced_data), n_pairs, len1)
+    playlists2 = random_playlists(rng, len(reduced_data), n_pairs, len2)
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        metrics = evaluate_playlist_pairs(reduced_data, playlists1, playlists2, max_chunk_elements)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    # Three float64 results and two int64 lengths per pair
+    allowed = max_chunk_elements * 8 + n_pairs * 5 * 8
+
+    expected = {'centroid_distance': [], 'centroid_cosine': [], 'pairwise_distance': []}
+    for playlist1, playlist2 in zip(playlists1[:N_COMPARED], playlists2[:N_COMPARED]):
+        playlist1, playlist2 = playlist1[playlist1 != -1], playlist2[playlist2 != -1]
+        expected['centroid_distance'].append(calculate_centroid_distance(reduced_data, playlist1, playlist2))
+        expected['centroid_cosine'].append(calculate_cosine_similarity(reduced_data, playlist1, playlist2)[0][0])
+        expected['pairwise_distance'].append(calculate_average_pairwise_distance(reduced_data, playlist1, playlist2))
+    return {
+        'peak_mib': peak / 2**20,
+        'allowed_mib': allowed / 2**20,
+        'memory': peak <= allowed,
+        'metrics': all(np.allclose(metrics[name][:N_COMPARED], values, rtol=1e-5, atol=1e-5)
+                       for name, values in expected.items()),
+    }
+
+
+def main():
+    reduced_data = np.random.default_rng(0).standard_normal((50000, 10)).astype(np.float32)
+    failed = False
+    for n_pairs, len1, len2, max_chunk_elements in CASES:
+        result = check_case(reduced_data, n_pairs, len1, len2, max_chunk_elements)
+        failed |= not (result['memory'] and result['metrics'])
+        print(f"{n_pairs:6d} pairs of {len1:3d} x {len2:3d} songs  "
+              f"peak: {result['peak_mib']:7.1f} MiB (allowed {result['allowed_mib']:7.1f} MiB)  "
+              f"memory: {'ok' if result['memory'] else 'FAILED'}  metrics: {'ok' if result['metrics'] else 'FAILED'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
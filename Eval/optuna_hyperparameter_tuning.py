@@ -3,11 +3,16 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import optuna
+import faiss
 import numpy as np
 import pandas as pd
 import logging
+import time
 from datetime import datetime
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import StandardScaler
+from sklearn.decomposition import PCA
+from models.feature_store import FeatureStore
 from models.indexing import SongIndexer
 
 # Create logs directory if it doesn't exist
@@ -42,6 +47,73 @@ FAISS_INDEX_TYPES = [
     'IVFPQ'
 ]
 
+DATA_FILE = 'data/rock_songs_features.csv'
+
+# Multi-objective mode trades playlist quality against search latency and index memory
+MULTI_OBJECTIVE = False
+MULTI_OBJECTIVE_DIRECTIONS = ['maximize', 'minimize', 'minimize']  # similarity, latency (ms), index bytes
+WORST_OBJECTIVE_VALUES = (float('-inf'), float('inf'), float('inf'))
+
+# Latency budget (mean ms per query) used to pick an operating point from the Pareto front
+LATENCY_BUDGET_MS = 1.0
+
+FEATURES = [
+    'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
+    'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo',
+    'duration_ms', 'time_signature'
+]
+
+
+class PreprocessingCache:
+    """
+    Preprocessing shared by all trials of a study.
+
+    The data is loaded and standardized once, PCA is fitted once per distinct
+    n_components, and trained IVF coarse quantizers are shared between trials with
+    the same (n_components, num_clusters).
+    """
+
+    def __init__(self, filepath, features):
+        self.filepath = filepath
+        self.features = list(features)
+        self.store = FeatureStore.open(filepath)
+        self.scaler = StandardScaler()
+        self.normalized_data = self.scaler.fit_transform(self.store.features(self.features))
+        self._reductions = {}
+        logging.info(f"Loaded and standardized {len(self.store)} songs from {filepath}")
+
+    def __len__(self):
+        return len(self.store)
+
+    def indexer(self, n_components):
+        """
+        Return a fresh SongIndexer that shares the cached preprocessing for n_components.
+
+        Args:
+            n_components (int): Number of PCA components
+
+        Returns:
+            SongIndexer: Indexer with its data already preprocessed
+        """
+        if n_components not in self._reductions:
+            pca = PCA(n_components=n_components)
+            reduced_data = pca.fit_transform(self.normalized_data).astype(np.float32)
+            self._reductions[n_components] = (pca, reduced_data, {})
+            logging.info(f"Fitted PCA with {n_components} components")
+
+        pca, reduced_data, quantizers = self._reductions[n_components]
+        indexer = SongIndexer(n_components=n_components)
+        indexer.filepath = self.filepath
+        indexer.features = self.features
+        indexer.store = self.store
+        indexer.scaler = self.scaler
+        indexer.pca = pca
+        indexer.reduced_data = reduced_data
+        # Shared dict: quantizers trained in one trial are reused by later trials
+        indexer.quantizers = quantizers
+        return indexer
+
+
 def calculate_playlist_similarity(indexer, playlist1, playlist2):
     """
     Calculate similarity between two playlists using cosine similarity of their vectors.
@@ -67,35 +139,62 @@ def calculate_playlist_similarity(indexer, playlist1, playlist2):
     
     return similarity
 
-def objective(trial):
+def measure_search_cost(indexer, index, n_queries=200, k=10):
+    """
+    Measure single-query search latency and the memory footprint of an index.
+
+    Args:
+        indexer (SongIndexer): The indexer containing the reduced data
+        index (faiss.Index): The index to measure
+        n_queries (int): Number of random songs searched one at a time
+        k (int): Number of neighbours per search
+
+    Returns:
+        dict: Mean, p50 and p99 latency in milliseconds and the serialized index size in bytes
+    """
+    query_ids = np.random.randint(0, len(indexer.reduced_data), n_queries)
+    latencies = []
+    for query_id in query_ids:
+        query = np.ascontiguousarray(indexer.reduced_data[query_id].reshape(1, -1))
+        start = time.perf_counter()
+        index.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'mean_latency_ms': float(np.mean(latencies)),
+        'p50_latency_ms': float(np.percentile(latencies, 50)),
+        'p99_latency_ms': float(np.percentile(latencies, 99)),
+        'index_bytes': int(faiss.serialize_index(index).nbytes),
+    }
+
+def objective(trial, cache, multi_objective=False):
     """
     Objective function for Optuna optimization.
+
+    Args:
+        trial (optuna.Trial): The trial to evaluate
+        cache (PreprocessingCache): Preprocessing shared across trials
+        multi_objective (bool): Also return the search latency and index memory
+
+    Returns:
+        float or tuple: The average similarity, or (similarity, mean latency in ms, index bytes)
     """
-    # Define features first to know the maximum possible components
-    features = [
-        'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
-        'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo',
-        'duration_ms', 'time_signature'
-    ]
+    failed_value = WORST_OBJECTIVE_VALUES if multi_objective else float('inf')
     
     # Calculate max components based on number of features
-    max_components = len(features)
+    max_components = len(cache.features)
     max_components = (max_components // 8) * 8
     
     # First suggest n_components and ensure it's compatible with PQ
     n_components = trial.suggest_int('n_components', 8, max_components, step=8)
     index_type = trial.suggest_categorical('index_type', FAISS_INDEX_TYPES)
     
-    # Initialize SongIndexer
-    indexer = SongIndexer(n_components=n_components)
-    
     try:
-        filepath = 'data/rock_songs_features.csv'
-        reduced_data = indexer.load_and_preprocess(filepath, features)
+        indexer = cache.indexer(n_components)
         logging.info(f"Data preprocessed with {n_components} components")
         
         # Calculate appropriate number of clusters based on dataset size
-        n_data_points = len(indexer.data)
+        n_data_points = len(cache)
         
         # FAISS requires at least 39 training points per cluster
         # For IVFPQ, we also need to consider the PQ centroids (256 by default)
@@ -110,7 +209,7 @@ def objective(trial):
         
     except Exception as e:
         logging.error(f"Data preprocessing failed: {str(e)}")
-        return float('inf')
+        return failed_value
     
     # Define index-specific parameters
     index_params = {
@@ -136,7 +235,7 @@ def objective(trial):
         if possible_n_pq:
             index_params['n_pq'] = trial.suggest_categorical('n_pq', possible_n_pq)
         else:
-            return float('-inf')  # Skip invalid configurations
+            return WORST_OBJECTIVE_VALUES if multi_objective else float('-inf')  # Skip invalid configurations
     
     # Create FAISS index
     try:
@@ -144,7 +243,7 @@ def objective(trial):
         logging.info(f"Created {index_type} index with parameters: {index_params}")
     except Exception as e:
         logging.error(f"Index creation failed: {str(e)}")
-        return float('inf')
+        return failed_value
     
     # Generate multiple playlist pairs and average their similarities
     n_pairs = 5
@@ -154,8 +253,8 @@ def objective(trial):
     try:
         for _ in range(n_pairs):
             # Generate random start indices
-            start_index1 = np.random.randint(0, len(indexer.data))
-            start_index2 = np.random.randint(0, len(indexer.data))
+            start_index1 = np.random.randint(0, n_data_points)
+            start_index2 = np.random.randint(0, n_data_points)
             
             # Build playlists
             playlist1 = indexer.build_playlist(index, start_index1, playlist_size)
@@ -169,49 +268,125 @@ def objective(trial):
         avg_similarity = total_similarity / n_pairs
         logging.info(f"Average similarity score: {avg_similarity}")
         
-        # Return similarity for maximization
-        return avg_similarity
+        if not multi_objective:
+            # Return similarity for maximization
+            return avg_similarity
+        
+        cost = measure_search_cost(indexer, index)
+        trial.set_user_attr('similarity', float(avg_similarity))
+        for key, value in cost.items():
+            trial.set_user_attr(key, value)
+        logging.info(f"Mean search latency: {cost['mean_latency_ms']:.4f} ms, index size: {cost['index_bytes']} bytes")
+        
+        return avg_similarity, cost['mean_latency_ms'], cost['index_bytes']
     
     except Exception as e:
         logging.error(f"Playlist generation or similarity calculation failed: {str(e)}")
-        return float('inf')
+        return failed_value
+
+def select_operating_point(pareto_trials, latency_budget_ms):
+    """
+    Pick the Pareto-optimal trial with the best similarity within a latency budget.
+
+    Args:
+        pareto_trials (list): Trials on the Pareto front
+        latency_budget_ms (float): Maximum mean search latency in milliseconds
+
+    Returns:
+        optuna.trial.FrozenTrial: The chosen trial, or None if no trial meets the budget
+    """
+    affordable = [t for t in pareto_trials if t.values[1] <= latency_budget_ms]
+    if not affordable:
+        return None
+    # Highest similarity first, smaller index as the tie-breaker
+    return max(affordable, key=lambda t: (t.values[0], -t.values[2]))
 
-def main():
-    """Main function to run the optimization."""
+def write_pareto_front(f, pareto_trials, latency_budget_ms):
+    """Write the Pareto front, fastest first, and the operating point chosen for the budget."""
+    f.write(f"Pareto front ({len(pareto_trials)} trials, sorted by mean latency):\n")
+    for t in sorted(pareto_trials, key=lambda t: t.values[1]):
+        f.write(f"\nTrial {t.number}:\n")
+        f.write(f"  Similarity: {t.values[0]:.6f}\n")
+        f.write(f"  Mean latency: {t.values[1]:.4f} ms "
+                f"(p50 {t.user_attrs.get('p50_latency_ms', float('nan')):.4f} ms, "
+                f"p99 {t.user_attrs.get('p99_latency_ms', float('nan')):.4f} ms)\n")
+        f.write(f"  Index size: {t.values[2] / 2**20:.3f} MiB ({int(t.values[2])} bytes)\n")
+        f.write("  Params:\n")
+        for key, value in t.params.items():
+            f.write(f"    {key}: {value}\n")
+
+    chosen = select_operating_point(pareto_trials, latency_budget_ms)
+    f.write(f"\nOperating point for a {latency_budget_ms} ms latency budget: ")
+    if chosen is None:
+        f.write("none of the Pareto-optimal trials meets the budget\n")
+    else:
+        f.write(f"trial {chosen.number} (similarity {chosen.values[0]:.6f}, "
+                f"latency {chosen.values[1]:.4f} ms, size {int(chosen.values[2])} bytes)\n")
+
+def main(multi_objective=MULTI_OBJECTIVE, latency_budget_ms=LATENCY_BUDGET_MS):
+    """
+    Main function to run the optimization.
+
+    Args:
+        multi_objective (bool): Optimize similarity, search latency and index memory together
+            and report the Pareto front instead of a single best trial
+        latency_budget_ms (float): Latency budget used to pick an operating point from the front
+    """
     # Create study with timestamped database
-    study = optuna.create_study(
-        study_name=f"playlist_optimization_{timestamp}",
-        direction="maximize",
-        storage=f"sqlite:///{study_db}",
-        load_if_exists=True
-    )
+    if multi_objective:
+        study = optuna.create_study(
+            study_name=f"playlist_optimization_{timestamp}",
+            directions=MULTI_OBJECTIVE_DIRECTIONS,
+            storage=f"sqlite:///{study_db}",
+            load_if_exists=True
+        )
+    else:
+        study = optuna.create_study(
+            study_name=f"playlist_optimization_{timestamp}",
+            direction="maximize",
+            storage=f"sqlite:///{study_db}",
+            load_if_exists=True
+        )
+    
+    # Load and standardize the data once for all trials
+    cache = PreprocessingCache(DATA_FILE, FEATURES)
     
     # Run optimization
     n_trials = 200
     logging.info(f"Starting optimization with {n_trials} trials")
     
     try:
-        study.optimize(objective, n_trials=n_trials)
+        study.optimize(lambda trial: objective(trial, cache, multi_objective), n_trials=n_trials)
         
         # Log results
         logging.info("\n=== Optimization Results ===")
         logging.info(f"Number of finished trials: {len(study.trials)}")
-        logging.info("\nBest trial:")
-        trial = study.best_trial
-        
-        logging.info(f"  Value: {trial.value}")
-        logging.info("  Params:")
-        for key, value in trial.params.items():
-            logging.info(f"    {key}: {value}")
+        if multi_objective:
+            pareto_trials = study.best_trials
+            logging.info(f"\nPareto front: {len(pareto_trials)} trials")
+            for t in sorted(pareto_trials, key=lambda t: t.values[1]):
+                logging.info(f"  Trial {t.number}: similarity={t.values[0]:.6f}, "
+                             f"latency={t.values[1]:.4f} ms, size={int(t.values[2])} bytes, params={t.params}")
+        else:
+            logging.info("\nBest trial:")
+            trial = study.best_trial
+            
+            logging.info(f"  Value: {trial.value}")
+            logging.info("  Params:")
+            for key, value in trial.params.items():
+                logging.info(f"    {key}: {value}")
         
         # Save results to file
         with open(results_file, 'w') as f:
             f.write("=== Optimization Results ===\n")
             f.write(f"Optimization completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write(f"Best value: {trial.value}\n")
-            f.write("Best parameters:\n")
-            for key, value in trial.params.items():
-                f.write(f"  {key}: {value}\n")
+            if multi_objective:
+                write_pareto_front(f, pareto_trials, latency_budget_ms)
+            else:
+                f.write(f"Best value: {trial.value}\n")
+                f.write("Best parameters:\n")
+                for key, value in trial.params.items():
+                    f.write(f"  {key}: {value}\n")
             
             # Add additional statistics
             f.write("\nOptimization Statistics:\n")
@@ -222,7 +397,7 @@ def main():
             # Add study parameters
             f.write("\nStudy Parameters:\n")
             f.write(f"Study name: {study.study_name}\n")
-            f.write(f"Optimization direction: {study.direction.name}\n")
+            f.write(f"Optimization direction: {', '.join(d.name for d in study.directions)}\n")
             f.write(f"Study database: {study_db}\n")
             f.write(f"Log file: {log_file}\n")
         
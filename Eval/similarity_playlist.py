@@ -1,19 +1,28 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import faiss
 import numpy as np
-import pandas as pd
+from scipy.spatial.distance import cdist
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
+from models.feature_store import FeatureStore
+from models.indexing import next_unused_neighbour
+
+# Upper bound on the float64 values held by the arrays of one evaluate_playlist_pairs chunk (128 MiB)
+EVAL_CHUNK_ELEMENTS = 1 << 24
 
 
 def load_data(filepath):
-    """Load the dataset from a CSV file."""
-    return pd.read_csv(filepath)
+    """Open the columnar feature store of a CSV file, converting it on first use."""
+    return FeatureStore.open(filepath)
 
 
 def preprocess_data(data, features):
     """Normalize the selected features using StandardScaler."""
     scaler = StandardScaler()
-    return scaler.fit_transform(data[features])
+    return scaler.fit_transform(data.features(features))
 
 
 def apply_pca(data, n_components=10):
@@ -40,14 +49,11 @@ def build_playlist(reduced_data, index, start_index, playlist_size):
     added_indices = set(playlist)
 
     while len(playlist) < playlist_size:
-        last_vector = reduced_data[playlist[-1]].reshape(1, -1)
-        distances, indices = index.search(last_vector, 10)
-
-        for idx in indices[0]:
-            if idx not in added_indices:
-                playlist.append(idx)
-                added_indices.add(idx)
-                break
+        idx = next_unused_neighbour(index, reduced_data[playlist[-1]], added_indices)
+        if idx is None:
+            break
+        playlist.append(idx)
+        added_indices.add(idx)
     return playlist
 
 
@@ -66,12 +72,115 @@ def calculate_cosine_similarity(reduced_data, playlist1, playlist2):
 
 
 def calculate_average_pairwise_distance(reduced_data, playlist1, playlist2):
-    """Calculate average pairwise distance between songs in two playlists."""
-    distances = [
-        np.linalg.norm(reduced_data[playlist1[i]] - reduced_data[playlist2[j]])
-        for i in range(len(playlist1)) for j in range(i + 1, len(playlist2))
-    ]
-    return np.mean(distances)
+    """Calculate the average distance over every pair of a song of playlist1 and a song of playlist2."""
+    return cdist(reduced_data[playlist1], reduced_data[playlist2]).mean()
+
+
+def as_index_array(playlists):
+    """
+    Turn playlists into a padded index array.
+
+    Args:
+        playlists: (n_playlists, max_len) integer array padded with -1, or a list of
+            song index lists of any lengths
+
+    Returns:
+        tuple: (n_playlists, max_len) int64 array padded with -1, and the length of every playlist
+    """
+    if isinstance(playlists, np.ndarray):
+        indices = playlists.astype(np.int64, copy=False)
+    else:
+        max_len = max((len(playlist) for playlist in playlists), default=0)
+        indices = np.full((len(playlists), max_len), -1, dtype=np.int64)
+        for i, playlist in enumerate(playlists):
+            indices[i, :len(playlist)] = playlist
+    lengths = (indices != -1).sum(axis=1)
+    if (lengths == 0).any():
+        raise ValueError("Every playlist needs at least one song")
+    return indices, lengths
+
+
+def _evaluate_chunk(reduced_data, indices1, lengths1, indices2, lengths2, buffer):
+    """
+    Compute the metrics of one chunk of evaluate_playlist_pairs.
+
+    Kept in its own function so that the arrays of a chunk are freed before the next
+    chunk allocates its own.
+
+    Returns:
+        tuple: Centroid distances, centroid cosines and mean pairwise distances of the pairs
+    """
+    vectors = []
+    for indices, lengths in ((indices1, lengths1), (indices2, lengths2)):
+        mask = indices != -1
+        songs = reduced_data[np.where(mask, indices, 0)].astype(np.float64)
+        songs *= mask[:, :, None]
+        vectors.append((songs, mask, songs.sum(axis=1) / lengths[:, None]))
+    (songs1, mask1, centroid1), (songs2, mask2, centroid2) = vectors
+
+    centroid_distance = np.linalg.norm(centroid1 - centroid2, axis=1)
+    norms = np.linalg.norm(centroid1, axis=1) * np.linalg.norm(centroid2, axis=1)
+    dots = (centroid1 * centroid2).sum(axis=1)
+    centroid_cosine = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+    # Squared distances and their roots are computed in place in the shared buffer
+    distances = np.matmul(songs1, songs2.transpose(0, 2, 1), out=buffer[:len(songs1)])
+    distances *= -2
+    distances += np.einsum('pid,pid->pi', songs1, songs1)[:, :, None]
+    distances += np.einsum('pjd,pjd->pj', songs2, songs2)[:, None, :]
+    np.maximum(distances, 0.0, out=distances)
+    np.sqrt(distances, out=distances)
+    # Padded songs are zero vectors, so their rows and columns are cleared before summing
+    distances[~mask1] = 0.0
+    distances *= mask2[:, None, :]
+    pairwise_distance = distances.sum(axis=(1, 2)) / (lengths1 * lengths2)
+    return centroid_distance, centroid_cosine, pairwise_distance
+
+
+def evaluate_playlist_pairs(reduced_data, playlists1, playlists2, max_chunk_elements=EVAL_CHUNK_ELEMENTS):
+    """
+    Compute the similarity metrics of many playlist pairs at once.
+
+    Pair i is (playlists1[i], playlists2[i]). Songs are gathered, padded and compared
+    in float64 for a chunk of pairs at a time, with the chunk sized so that all of its
+    arrays together hold at most max_chunk_elements values, so memory stays bounded for
+    any number of pairs. Cross distances use ||a||^2 + ||b||^2 - 2 a.b with one batched
+    matrix product per chunk, updated in place.
+
+    Args:
+        reduced_data (np.ndarray): Song vectors
+        playlists1: First playlist of every pair, see as_index_array
+        playlists2: Second playlist of every pair, see as_index_array
+        max_chunk_elements (int): Bound on the float64 values held by the arrays of a chunk
+
+    Returns:
+        dict: Per pair arrays 'centroid_distance' (Euclidean distance between the playlist
+            centroids), 'centroid_cosine' (cosine similarity of the centroids, 0 for a zero
+            centroid) and 'pairwise_distance' (mean distance over all song pairs across
+            the two playlists)
+    """
+    indices1, lengths1 = as_index_array(playlists1)
+    indices2, lengths2 = as_index_array(playlists2)
+    if len(indices1) != len(indices2):
+        raise ValueError(f"Got {len(indices1)} first and {len(indices2)} second playlists")
+
+    n_pairs = len(indices1)
+    (len1, len2), dimension = (indices1.shape[1], indices2.shape[1]), reduced_data.shape[1]
+    # Per pair: the cross distance buffer, the float64 songs of both playlists with a float32
+    # gather and a transposed copy for the matrix product, and the per-song indices and norms
+    per_pair = len1 * len2 + (len1 + len2) * (2 * dimension + 3)
+    chunk_size = max(1, max_chunk_elements // per_pair)
+
+    results = {name: np.empty(n_pairs) for name in ('centroid_distance', 'centroid_cosine', 'pairwise_distance')}
+    # Reused by every chunk, so a chunk's distances are never allocated next to the previous ones
+    buffer = np.empty((min(chunk_size, n_pairs), len1, len2))
+    for start in range(0, n_pairs, chunk_size):
+        chunk = slice(start, min(start + chunk_size, n_pairs))
+        chunk_results = _evaluate_chunk(reduced_data, indices1[chunk], lengths1[chunk],
+                                        indices2[chunk], lengths2[chunk], buffer)
+        for name, values in zip(('centroid_distance', 'centroid_cosine', 'pairwise_distance'), chunk_results):
+            results[name][chunk] = values
+    return results
 
 
 def main():
@@ -82,6 +191,7 @@ def main():
         'duration_ms', 'time_signature'
     ]
     playlist_size = 10
+    n_pairs = 1000
 
     # Load and preprocess data
     data = load_data(filepath)
@@ -91,26 +201,17 @@ def main():
     # Create FAISS index
     index = create_faiss_index(reduced_data)
 
-    # Generate playlists
-    start_index1 = np.random.randint(0, len(data))
-    start_index2 = np.random.randint(0, len(data))
-    playlist1 = build_playlist(
-        reduced_data, index, start_index1, playlist_size)
-    playlist2 = build_playlist(
-        reduced_data, index, start_index2, playlist_size)
-
-    # Calculate and print metrics
-    centroid_distance = calculate_centroid_distance(
-        reduced_data, playlist1, playlist2)
-    print("Centroid distance between the playlists:", centroid_distance)
-
-    cosine_similarity = calculate_cosine_similarity(
-        reduced_data, playlist1, playlist2)
-    print("Cosine similarity between the playlists:", cosine_similarity[0][0])
-
-    avg_pairwise_distance = calculate_average_pairwise_distance(
-        reduced_data, playlist1, playlist2)
-    print("Average pairwise distance between the playlists:", avg_pairwise_distance)
+    # Generate pairs of playlists from random start songs
+    start_indices = np.random.randint(0, len(data), size=(n_pairs, 2))
+    playlists1 = [build_playlist(reduced_data, index, start, playlist_size) for start in start_indices[:, 0]]
+    playlists2 = [build_playlist(reduced_data, index, start, playlist_size) for start in start_indices[:, 1]]
+
+    # Calculate and print metrics over all pairs
+    metrics = evaluate_playlist_pairs(reduced_data, playlists1, playlists2)
+    print(f"Metrics over {n_pairs} playlist pairs (mean +/- std):")
+    for name, label in (('centroid_distance', "Centroid distance"), ('centroid_cosine', "Cosine similarity"),
+                        ('pairwise_distance', "Average pairwise distance")):
+        print(f"  {label}: {metrics[name].mean():.4f} +/- {metrics[name].std():.4f}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+# Explicit on-disk dtypes for the numeric columns written by the collectors.
+# Every other column (ids, names, artists, ...) goes into the lazily loaded table.
+COLUMN_DTYPES = {
+    'danceability': np.float32,
+    'energy': np.float32,
+    'key': np.int32,
+    'loudness': np.float32,
+    'mode': np.int32,
+    'speechiness': np.float32,
+    'acousticness': np.float32,
+    'instrumentalness': np.float32,
+    'liveness': np.float32,
+    'valence': np.float32,
+    'tempo': np.float32,
+    'duration_ms': np.int32,
+    'time_signature': np.int32,
+    'popularity': np.int32,
+}
+
+META_FILE = 'meta.json'
+TABLE_FILE = 'table.pkl'
+
+
+def replace_file(path, write):
+    """
+    Write a file next to its target and move it over the target.
+
+    Readers that memory-map or hold the old file open keep seeing it unchanged.
+
+    Args:
+        path (str): File to write
+        write (callable): Called with the open binary file object to write the content
+    """
+    with open(path + '.tmp', 'wb') as f:
+        write(f)
+    os.replace(path + '.tmp', path)
+
+
+def default_store_dir(csv_path):
+    """Return the store directory used for a CSV file (next to it, with a .store suffix)."""
+    return os.path.splitext(csv_path)[0] + '.store'
+
+
+def convert_csv(csv_path, store_dir=None, chunksize=100000):
+    """
+    Convert a songs CSV into a columnar store of per-column .npy files.
+
+    Numeric columns listed in COLUMN_DTYPES are written with their explicit dtype,
+    all remaining columns are kept together in a separate table file.
+
+    Args:
+        csv_path (str): Path of the CSV file to convert
+        store_dir (str): Output directory, defaults to default_store_dir(csv_path)
+        chunksize (int): Number of rows parsed at a time
+
+    Returns:
+        FeatureStore: The converted store
+    """
+    store_dir = store_dir or default_store_dir(csv_path)
+    os.makedirs(store_dir, exist_ok=True)
+    # Without meta file the store reads as unconverted until the new one is written
+    meta_path = os.path.join(store_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    header = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    numeric_columns = [col for col in header if col in COLUMN_DTYPES]
+    table_columns = [col for col in header if col not in COLUMN_DTYPES]
+    # Numeric columns are parsed as float64 and narrowed afterwards, so integer
+    # columns written as floats ("4.0") still convert
+    dtypes = {col: np.float64 for col in numeric_columns}
+    dtypes.update({col: str for col in table_columns})
+
+    numeric_chunks = {col: [] for col in numeric_columns}
+    table_chunks = []
+    for chunk in pd.read_csv(csv_path, dtype=dtypes, chunksize=chunksize):
+        for col in numeric_columns:
+            values = chunk[col].to_numpy()
+            if np.issubdtype(COLUMN_DTYPES[col], np.integer) and np.isnan(values).any():
+                raise ValueError(f"Column '{col}' of {csv_path} has missing values and cannot be stored as integers")
+            numeric_chunks[col].append(values.astype(COLUMN_DTYPES[col]))
+        table_chunks.append(chunk[table_columns])
+
+    # Every file is written next to its target and moved over it, so readers that
+    # memory-mapped the columns of the previous conversion keep seeing them unchanged
+    for col, chunks in numeric_chunks.items():
+        values = np.concatenate(chunks) if chunks else np.empty(0, dtype=COLUMN_DTYPES[col])
+        replace_file(os.path.join(store_dir, f'{col}.npy'), lambda f, values=values: np.save(f, values))
+    table = pd.concat(table_chunks, ignore_index=True) if table_chunks else pd.DataFrame(columns=table_columns)
+    replace_file(os.path.join(store_dir, TABLE_FILE), table.to_pickle)
+
+    stat = os.stat(csv_path)
+    meta = {
+        'source': os.path.abspath(csv_path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'n_rows': len(table),
+        'columns': {col: np.dtype(COLUMN_DTYPES[col]).name for col in numeric_columns},
+        'table_columns': table_columns,
+    }
+    # Written last, so an interrupted conversion is redone on the next open
+    replace_file(meta_path, lambda f: f.write(json.dumps(meta, indent=2).encode()))
+
+    logging.info(f"Converted {csv_path} ({len(table)} rows) into feature store {store_dir}")
+    return FeatureStore(store_dir)
+
+
+class FeatureStore:
+    def __init__(self, directory):
+        """Open an existing columnar feature store."""
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as f:
+            self.meta = json.load(f)
+        self._columns = {}
+        self._table = None
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open the store for a CSV file or store directory, converting the CSV if needed.
+
+        The CSV is (re)converted when no store exists yet or when its size or
+        modification time differ from the ones recorded at conversion time.
+
+        Args:
+            path (str): Path of a songs CSV file or of a store directory
+
+        Returns:
+            FeatureStore: The opened store
+        """
+        if os.path.isdir(path):
+            return cls(path)
+
+        store_dir = default_store_dir(path)
+        meta_path = os.path.join(store_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            stat = os.stat(path)
+            if meta['size'] == stat.st_size and meta['mtime'] == stat.st_mtime:
+                return cls(store_dir)
+        return convert_csv(path, store_dir)
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    @property
+    def columns(self):
+        """Names of the numeric columns available in the store."""
+        return list(self.meta['columns'])
+
+    def column(self, name):
+        """Return a single numeric column as a read-only memory-mapped array."""
+        if name not in self.meta['columns']:
+            raise KeyError(f"Column '{name}' is not a numeric column of the store")
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.directory, f'{name}.npy'), mmap_mode='r')
+        return self._columns[name]
+
+    def features(self, columns, dtype=np.float32):
+        """
+        Read the requested feature columns into a (n_rows, len(columns)) matrix.
+
+        Only the requested columns are touched on disk.
+
+        Args:
+            columns (list): Numeric column names
+            dtype: Output dtype of the matrix
+
+        Returns:
+            np.ndarray: Feature matrix
+        """
+        matrix = np.empty((len(self), len(columns)), dtype=dtype)
+        for i, name in enumerate(columns):
+            matrix[:, i] = self.column(name)
+        return matrix
+
+    @property
+    def table(self):
+        """Descriptive columns (ids, names, artists, ...), loaded on first access."""
+        if self._table is None:
+            self._table = pd.read_pickle(os.path.join(self.directory, TABLE_FILE))
+        return self._table
+
+    def save_table(self):
+        """Write the descriptive table back to the store, e.g. after filling in a column."""
+        replace_file(os.path.join(self.directory, TABLE_FILE), self.table.to_pickle)
@@ -1,29 +1,384 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 import faiss
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
+import hashlib
+import inspect
+import json
 import logging
+import pickle
+import threading
+from collections import OrderedDict
+from models.feature_store import FeatureStore, replace_file
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Bump whenever the on-disk artifact layout changes so old stores are rebuilt
+ARTIFACT_VERSION = 2
+
+MANIFEST_FILE = 'manifest.json'
+SCALER_FILE = 'scaler.pkl'
+PCA_FILE = 'pca.pkl'
+VECTORS_FILE = 'reduced_data.npy'
+INDEX_FILE = 'index.faiss'
+REMOVED_FILE = 'removed.npy'
+ADDED_SONGS_FILE = 'added_songs.pkl'
+KNN_NEIGHBOURS_FILE = 'knn_neighbours.npy'
+KNN_DISTANCES_FILE = 'knn_distances.npy'
+
+# Number of neighbours requested per playlist step before widening the search
+SEARCH_K = 10
+
+# Neighbours per song in the precomputed kNN graph, and songs searched per batch to build it
+KNN_GRAPH_K = 64
+KNN_BATCH_SIZE = 16384
+
+# Neighbours (summed over all cached lists) kept by the neighbour cache of a SongIndexer
+NEIGHBOUR_CACHE_SIZE = 1000000
+
+# Candidates retrieved for a diversity reranked playlist, see build_diverse_playlist
+CANDIDATE_POOL_SIZE = 500
+
+# Rank offset of reciprocal rank fusion, larger values flatten the weight of the top ranks
+RRF_K = 60
+
+IVF_INDEX_TYPES = ('IVFFlat', 'IVFPQ')
+# Training vectors sampled to measure the baseline quantization error of an IVF index
+DRIFT_SAMPLE_SIZE = 100000
+# needs_retrain thresholds: quantization error of the added songs relative to the training
+# data, and share of the songs added or removed since training
+DRIFT_ERROR_RATIO = 1.25
+DRIFT_CHANGED_FRACTION = 0.5
+
+
+def file_fingerprint(filepath, chunk_size=1 << 20):
+    """
+    Fingerprint a source file by size, modification time and SHA-256 digest.
+
+    Args:
+        filepath (str): Path of the file to fingerprint
+        chunk_size (int): Number of bytes hashed per read
+
+    Returns:
+        dict: Fingerprint with 'size', 'mtime' and 'sha256' keys
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    stat = os.stat(filepath)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest.hexdigest()}
+
+
+def next_unused_neighbour(index, query, excluded, k=SEARCH_K, removed=None, search=None):
+    """
+    Find the nearest neighbour of a query vector that is not in the excluded set.
+
+    k is doubled after every search whose results are all excluded, so a call makes
+    at most log2(ntotal / k) + 2 searches. The search stops widening once it covers
+    the whole index or the index returns fewer than k results (-1 padding).
+
+    Args:
+        index (faiss.Index): FAISS index to search
+        query (np.ndarray): Query vector
+        excluded (set): Song indices that may not be returned
+        k (int): Number of neighbours requested by the first search
+        removed (np.ndarray): Optional boolean mask of removed song indices, which may
+            not be returned either
+        search (callable): Called as search(queries, k) instead of index.search, e.g.
+            SongIndexer.search to go through its neighbour cache
+
+    Returns:
+        int: Nearest unused song index, or None if every reachable song is excluded
+    """
+    query = np.ascontiguousarray(query, dtype=np.float32).reshape(1, -1)
+    search = search or index.search
+    while True:
+        k = min(k, index.ntotal)
+        distances, indices = search(query, k)
+        for idx in indices[0]:
+            if idx != -1 and idx not in excluded and (removed is None or not removed[idx]):
+                return int(idx)
+        if k >= index.ntotal or indices[0, -1] == -1:
+            return None
+        k *= 2
+
+
+def id_column(table):
+    """Return the Spotify track id column of a song table ('id' or 'track_id')."""
+    return 'id' if 'id' in table.columns else 'track_id'
+
+
+def title_column(table):
+    """Return the song title column of a song table ('name' or 'track_name')."""
+    return 'name' if 'name' in table.columns else 'track_name'
+
+
+def resolve_index_config(**index_params):
+    """Fill in the create_index defaults for the given index parameters."""
+    bound = inspect.signature(SongIndexer.create_index).bind_partial(**index_params)
+    bound.apply_defaults()
+    return {key: value for key, value in bound.arguments.items() if key != 'self'}
+
+
+class NeighbourCache:
+    """
+    Bounded LRU cache of neighbour lists, keyed by index version, k and query vector.
+
+    The query vectors of the playlist builders are the songs' own rows of reduced_data,
+    so every entry is the neighbour list of one song at one k. Entries of an older index
+    version are never returned, and clear drops them all. The least recently used lists
+    are evicted once more than capacity neighbours are stored in total. Safe to share
+    between threads.
+
+    Args:
+        capacity (int): Neighbours kept in total, 0 disables the cache
+    """
+
+    def __init__(self, capacity=NEIGHBOUR_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def search(self, index, queries, k, version):
+        """
+        Search the queries not cached yet in one index.search and answer the rest from the cache.
+
+        Returns:
+            tuple: (distances, indices) as returned by index.search
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, index.d)
+        keys = [(version, k, query.tobytes()) for query in queries]
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    missing.append(i)
+                    continue
+                self._entries.move_to_end(key)
+                distances[i], indices[i] = entry
+            self._counters['hits'] += len(keys) - len(missing)
+            self._counters['misses'] += len(missing)
+        if not missing:
+            return distances, indices
+
+        distances[missing], indices[missing] = index.search(queries[missing], k)
+        with self._lock:
+            for i in missing:
+                if keys[i] not in self._entries:
+                    self._size += k
+                self._entries[keys[i]] = (distances[i].copy(), indices[i].copy())
+            while self._size > self.capacity:
+                key, _ = self._entries.popitem(last=False)
+                self._size -= key[1]
+                self._counters['evictions'] += 1
+        return distances, indices
+
+    def clear(self):
+        """Drop every cached list."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Return the hits, misses, hit rate, evictions, cached lists and cached neighbours so far."""
+        with self._lock:
+            stats = dict(self._counters, lists=len(self._entries), neighbours=self._size)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
 class SongIndexer:
-    def __init__(self, n_components=10):
+    def __init__(self, n_components=10, neighbour_cache_size=NEIGHBOUR_CACHE_SIZE):
         """Initialize the SongIndexer with PCA components."""
         self.n_components = n_components
         self.scaler = StandardScaler()
         self.pca = PCA(n_components=self.n_components)
-        self.data = None
+        self.filepath = None
+        self.features = None
+        self.store = None
+        self._table = None
         self.reduced_data = None
-        
-    def load_and_preprocess(self, filepath, features):
-        """Load and preprocess the data."""
-        self.data = pd.read_csv(filepath)
-        normalized_data = self.scaler.fit_transform(self.data[features])
-        self.reduced_data = self.pca.fit_transform(normalized_data).astype(np.float32)
+        self.index = None
+        self.index_config = None
+        # Trained IVF coarse quantizers by number of clusters, valid while reduced_data is unchanged
+        self.quantizers = {}
+        # Incremental updates: songs appended by add_songs, mask of rows removed by
+        # remove_songs and the IVF drift statistics, see ivf_drift
+        self.added_songs = None
+        self.removed = None
+        self.ivf_stats = None
+        self._track_rows = None
+        # Track ids, names and artists by row, see song_columns
+        self._song_columns = None
+        # Bumped whenever the search results of the index may change, see search
+        self.index_version = 0
+        self.neighbour_cache = NeighbourCache(neighbour_cache_size)
+        # Precomputed (n_songs, K) neighbour table and distances, see build_knn_graph
+        self.knn_neighbours = None
+        self.knn_distances = None
+
+    @property
+    def table(self):
+        """Descriptive song table (ids, names, artists, ...), loaded lazily from the feature store."""
+        if self._table is None and self.filepath is not None:
+            if self.store is None:
+                self.store = FeatureStore.open(self.filepath)
+            self._table = self.store.table
+            if self.added_songs is not None:
+                self._table = pd.concat([self._table, self.added_songs], ignore_index=True)
+        return self._table
+
+    @property
+    def data(self):
+        """
+        Full song table: the descriptive columns of table plus the numeric feature columns.
+
+        Built from the feature store on every access, so code that only needs names or a
+        few features should use table or store.features(columns) instead.
+        """
+        table = self.table
+        if table is None:
+            return None
+        store_songs = pd.concat([self.store.table, pd.DataFrame(
+            {name: np.asarray(self.store.column(name)) for name in self.store.columns})], axis=1)
+        if self.added_songs is None:
+            return store_songs
+        return pd.concat([store_songs, self.added_songs], ignore_index=True)
+
+    def load_and_preprocess(self, filepath, features, fit=True):
+        """
+        Load and preprocess the data.
+
+        The CSV is converted once into a columnar feature store and only the
+        requested feature columns are read from it afterwards. With fit=False the
+        songs are projected with the already fitted scaler and PCA instead, e.g. the
+        shared space of a ShardedSongIndex.
+        """
+        self.filepath = filepath
+        self.features = list(features)
+        self.store = FeatureStore.open(filepath)
+        self._table = None
+        if fit:
+            normalized_data = self.scaler.fit_transform(self.store.features(features))
+            self.reduced_data = self.pca.fit_transform(normalized_data).astype(np.float32)
+        else:
+            normalized_data = self.scaler.transform(self.store.features(features))
+            self.reduced_data = self.pca.transform(normalized_data).astype(np.float32)
+        self.quantizers = {}
+        self.added_songs = None
+        self.removed = None
+        self.ivf_stats = None
+        self._track_rows = None
+        self._song_columns = None
+        self.knn_neighbours = self.knn_distances = None
+        self.invalidate_neighbours()
         return self.reduced_data
 
+    def invalidate_neighbours(self):
+        """Start a new index version, so no neighbour list cached before is used again."""
+        self.index_version += 1
+        self.neighbour_cache.clear()
+
+    def search(self, index, queries, k):
+        """
+        Search an index, going through the neighbour cache if it is this indexer's index.
+
+        Repeated searches for the same songs at the same k, such as popular seeds of
+        build_playlist, are then answered from memory. Searches of any other index
+        (wrappers included) go straight to index.search.
+
+        Args:
+            index (faiss.Index): Index to search
+            queries (np.ndarray): (n, d) query vectors
+            k (int): Number of neighbours per query
+
+        Returns:
+            tuple: (distances, indices) as returned by index.search
+        """
+        if index is not self.index or not self.neighbour_cache.capacity:
+            return index.search(queries, k)
+        return self.neighbour_cache.search(index, queries, k, self.index_version)
+
+    @property
+    def removed_mask(self):
+        """Boolean mask of the rows of reduced_data removed with remove_songs."""
+        if self.removed is None or len(self.removed) != len(self.reduced_data):
+            removed = np.zeros(len(self.reduced_data), dtype=bool)
+            if self.removed is not None:
+                removed[:len(self.removed)] = self.removed[:len(removed)]
+            self.removed = removed
+        return self.removed
+
+    @property
+    def track_rows(self):
+        """
+        Row of every indexed song by Spotify track id, removed songs excluded.
+
+        A track id that appears on several rows (a song in several playlists) maps to its last row.
+        """
+        if self._track_rows is None:
+            track_ids = self.song_columns[0]
+            self._track_rows = dict(zip(track_ids.tolist(), range(len(track_ids))))
+            for row in np.flatnonzero(self.removed_mask):
+                if self._track_rows.get(track_ids[row]) == row:
+                    del self._track_rows[track_ids[row]]
+        return self._track_rows
+
+    @property
+    def song_columns(self):
+        """
+        Track ids, titles and artists by row as three arrays, built once from the song table.
+
+        Results are materialized with one fancy-indexing gather per column instead of a
+        DataFrame lookup per song.
+        """
+        if self._song_columns is None:
+            table = self.table
+            self._song_columns = tuple(
+                table[column].to_numpy(dtype=object)
+                for column in (id_column(table), title_column(table), 'artist')
+            )
+        return self._song_columns
+
+    def rows_of(self, track_ids):
+        """
+        Look up the rows of songs by Spotify track id.
+
+        Raises:
+            KeyError: If a track id is not indexed or was removed
+        """
+        track_rows = self.track_rows
+        return np.fromiter((track_rows[track_id] for track_id in track_ids), dtype=np.int64, count=len(track_ids))
+
+    def get_track_ids(self, rows):
+        """Get the Spotify track ids of the given rows."""
+        return self.song_columns[0][np.asarray(rows, dtype=np.int64)].tolist()
+
+    def get_songs(self, rows):
+        """Get (track_id, title, artist) of the given rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return list(zip(*(column[rows].tolist() for column in self.song_columns)))
+
+    def project(self, features):
+        """Project raw feature rows into the index space with the fitted scaler and PCA."""
+        vectors = self.pca.transform(self.scaler.transform(features)).astype(np.float32)
+        if self.index_config and self.index_config['index_type'] == 'FlatIP':
+            faiss.normalize_L2(vectors)
+        return vectors
+
     def create_index(self, index_type='FlatL2', num_clusters=100, m=32, n_pq=8, nprobe=10):
         """
         Create a FAISS index based on the specified type and parameters.
@@ -43,6 +398,8 @@ class SongIndexer:
 
         dimension = self.reduced_data.shape[1]
         logging.info(f"Creating {index_type} index with dimension {dimension}")
+        removed_rows = np.flatnonzero(self.removed_mask)
+        training_data = np.delete(self.reduced_data, removed_rows, axis=0) if removed_rows.size else self.reduced_data
 
         try:
             if index_type == 'FlatL2':
@@ -54,44 +411,297 @@ class SongIndexer:
                 data_copy = self.reduced_data.copy()
                 faiss.normalize_L2(data_copy)
                 self.reduced_data = data_copy
+                self.quantizers = {}
             
             elif index_type == 'HNSWFlat':
                 index = faiss.IndexHNSWFlat(dimension, m)
                 logging.info(f"Created HNSWFlat index with m={m}")
             
             elif index_type == 'IVFFlat':
-                quantizer = faiss.IndexFlatL2(dimension)
+                quantizer = self._coarse_quantizer(num_clusters)
                 index = faiss.IndexIVFFlat(quantizer, dimension, num_clusters, faiss.METRIC_L2)
-                index.train(self.reduced_data)
+                index.train(training_data)
+                self.quantizers[num_clusters] = quantizer
                 logging.info(f"Created IVFFlat index with {num_clusters} clusters")
             
             elif index_type == 'IVFPQ':
-                quantizer = faiss.IndexFlatL2(dimension)
+                quantizer = self._coarse_quantizer(num_clusters)
                 index = faiss.IndexIVFPQ(quantizer, dimension, num_clusters, n_pq, 8)
-                index.train(self.reduced_data)
+                index.train(training_data)
+                self.quantizers[num_clusters] = quantizer
                 logging.info(f"Created IVFPQ index with {num_clusters} clusters and {n_pq} PQ centroids")
             
             else:
                 raise ValueError(f"Unsupported index type: {index_type}")
 
-            # Add data to index
+            # Add data to index, its ids are the rows of reduced_data
             index.add(self.reduced_data)
             logging.info(f"Added {len(self.reduced_data)} vectors to index")
+            if index_type in IVF_INDEX_TYPES:
+                if removed_rows.size:
+                    index.remove_ids(removed_rows.astype(np.int64))
+                self.ivf_stats = self._ivf_baseline(quantizer, training_data)
+            else:
+                self.ivf_stats = None
 
             # Set nprobe for applicable indices
-            if index_type in ['IVFFlat', 'IVFPQ']:
+            if index_type in IVF_INDEX_TYPES:
                 index.nprobe = nprobe
                 logging.info(f"Set nprobe to {nprobe}")
 
+            self.index = index
+            self.index_config = resolve_index_config(
+                index_type=index_type, num_clusters=num_clusters, m=m, n_pq=n_pq, nprobe=nprobe
+            )
+            self.knn_neighbours = self.knn_distances = None
+            self.invalidate_neighbours()
             return index
 
         except Exception as e:
             logging.error(f"Error creating index: {str(e)}")
             raise
 
+    def _coarse_quantizer(self, num_clusters):
+        """
+        Return the IVF coarse quantizer for num_clusters.
+
+        A quantizer trained by an earlier create_index call on the same reduced data is
+        reused, in which case FAISS skips the k-means step of index.train.
+        """
+        quantizer = self.quantizers.get(num_clusters)
+        if quantizer is not None:
+            logging.info(f"Reusing trained coarse quantizer with {num_clusters} clusters")
+            return quantizer
+        return faiss.IndexFlatL2(self.reduced_data.shape[1])
+
+    def _ivf_baseline(self, quantizer, training_data, seed=0):
+        """Measure the quantization error of (a sample of) the IVF training data."""
+        n_trained = len(training_data)
+        if n_trained > DRIFT_SAMPLE_SIZE:
+            sample = np.random.default_rng(seed).choice(n_trained, DRIFT_SAMPLE_SIZE, replace=False)
+            training_data = training_data[np.sort(sample)]
+        distances, _ = quantizer.search(np.ascontiguousarray(training_data), 1)
+        return {
+            'baseline_error': float(distances.mean()),
+            'n_trained': n_trained,
+            'n_added': 0,
+            'added_error': 0.0,
+            'n_removed': 0,
+        }
+
+    def add_songs(self, songs):
+        """
+        Add new songs to the existing index without refitting or retraining.
+
+        The scaler and PCA stay frozen: the songs are projected with them, appended to
+        reduced_data and added to the index under their row numbers as ids. Songs whose
+        track id is already indexed are skipped.
+
+        Args:
+            songs (pd.DataFrame): New songs with a track id column ('id' or 'track_id'),
+                the descriptive columns of the song table and the indexed feature columns
+
+        Returns:
+            np.ndarray: Rows assigned to the added songs
+        """
+        if self.index is None:
+            raise ValueError("No index. Call create_index or load first.")
+
+        column = id_column(songs)
+        new_songs = songs[~songs[column].isin(self.track_rows.keys())].drop_duplicates(column)
+        if len(new_songs) < len(songs):
+            logging.info(f"Skipping {len(songs) - len(new_songs)} songs that are already indexed")
+        if new_songs.empty:
+            return np.empty(0, dtype=np.int64)
+        new_songs = new_songs.rename(columns={column: id_column(self.table)}).reset_index(drop=True)
+
+        vectors = self.project(new_songs[self.features].to_numpy(dtype=np.float32))
+        self._load_into_memory()
+        rows = np.arange(len(self.reduced_data), len(self.reduced_data) + len(vectors), dtype=np.int64)
+        removed = self.removed_mask
+        if self.index_config['index_type'] in IVF_INDEX_TYPES:
+            ivf = faiss.extract_index_ivf(self.index)
+            distances, _ = ivf.quantizer.search(vectors, 1)
+            self.index.add_with_ids(vectors, rows)
+            self.ivf_stats['n_added'] += len(vectors)
+            self.ivf_stats['added_error'] += float(distances.sum())
+        else:
+            # Flat and HNSW indexes number their vectors sequentially, which matches the rows
+            self.index.add(vectors)
+
+        self.reduced_data = np.concatenate([self.reduced_data, vectors])
+        self.removed = np.concatenate([removed, np.zeros(len(vectors), dtype=bool)])
+        self.added_songs = new_songs if self.added_songs is None else pd.concat(
+            [self.added_songs, new_songs], ignore_index=True)
+        if self._table is not None:
+            self._table = pd.concat([self._table, new_songs], ignore_index=True)
+        self._song_columns = None
+        self._track_rows.update(zip(new_songs[id_column(self.table)], rows.tolist()))
+        self.quantizers = {}
+        # The added songs are in no neighbour list of the graph, so it is rebuilt offline
+        self.knn_neighbours = self.knn_distances = None
+        self.invalidate_neighbours()
+        logging.info(f"Added {len(vectors)} songs to the index")
+        return rows
+
+    def _load_into_memory(self):
+        """
+        Copy memory-mapped vectors and IVF inverted lists into memory before they are changed.
+
+        load memory-maps them read-only from the artifact directory, which save may also
+        be writing to.
+        """
+        if isinstance(self.reduced_data, np.memmap):
+            self.reduced_data = np.array(self.reduced_data)
+        if self.index_config['index_type'] in IVF_INDEX_TYPES:
+            ivf = faiss.extract_index_ivf(self.index)
+            if isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists):
+                invlists = faiss.ArrayInvertedLists(ivf.nlist, ivf.code_size)
+                for list_no in range(ivf.nlist):
+                    size = ivf.invlists.list_size(list_no)
+                    if size:
+                        invlists.add_entries(list_no, size, ivf.invlists.get_ids(list_no),
+                                             ivf.invlists.get_codes(list_no))
+                ivf.replace_invlists(invlists, True)
+                invlists.this.disown()
+
+    def remove_songs(self, track_ids):
+        """
+        Remove songs from the index by Spotify track id.
+
+        IVF indexes drop the vectors. Flat and HNSW indexes cannot remove vectors without
+        renumbering them, so there the rows are only marked in removed_mask, which the
+        playlist builders skip. The rows of reduced_data are kept in both cases, so the
+        ids of the remaining songs do not change.
+
+        Args:
+            track_ids (list): Spotify track ids to remove
+
+        Returns:
+            np.ndarray: Rows of the removed songs
+
+        Raises:
+            KeyError: If a track id is not indexed
+        """
+        if self.index is None:
+            raise ValueError("No index. Call create_index or load first.")
+
+        track_ids = list(dict.fromkeys(track_ids))
+        track_rows = self.track_rows
+        rows = np.array([track_rows[track_id] for track_id in track_ids], dtype=np.int64)
+        self._load_into_memory()
+        if self.index_config['index_type'] in IVF_INDEX_TYPES:
+            self.index.remove_ids(rows)
+            self.ivf_stats['n_removed'] += len(rows)
+        self.removed_mask[rows] = True
+        for track_id in track_ids:
+            del track_rows[track_id]
+        # create_index leaves removed rows out of training, so the cached quantizers no longer fit
+        self.quantizers = {}
+        self.invalidate_neighbours()
+        logging.info(f"Removed {len(rows)} songs from the index")
+        return rows
+
+    def ivf_drift(self):
+        """
+        Measure how far an IVF index has drifted from the data its clustering was trained on.
+
+        Returns:
+            dict: 'error_ratio', the mean squared distance of the songs added since training
+                to their nearest centroid relative to that of the training data (1.0 means
+                they fit the clusters as well as the training data), 'changed_fraction', the
+                share of songs added or removed since training, and 'imbalance', the size of
+                the largest inverted list relative to the mean size
+        """
+        if self.ivf_stats is None:
+            raise ValueError("Drift is only tracked for IVF indexes.")
+
+        stats = self.ivf_stats
+        added_error = stats['added_error'] / stats['n_added'] if stats['n_added'] else stats['baseline_error']
+        invlists = faiss.extract_index_ivf(self.index).invlists
+        sizes = np.array([invlists.list_size(i) for i in range(invlists.nlist)])
+        return {
+            'error_ratio': added_error / stats['baseline_error'] if stats['baseline_error'] else 1.0,
+            'changed_fraction': (stats['n_added'] + stats['n_removed']) / max(stats['n_trained'], 1),
+            'imbalance': float(sizes.max() / sizes.mean()) if sizes.sum() else 1.0,
+        }
+
+    def needs_retrain(self, error_ratio=DRIFT_ERROR_RATIO, changed_fraction=DRIFT_CHANGED_FRACTION):
+        """Return whether the IVF drift warrants a full load_and_preprocess and create_index."""
+        drift = self.ivf_drift()
+        return drift['error_ratio'] > error_ratio or drift['changed_fraction'] > changed_fraction
+
+    def build_knn_graph(self, index=None, k=KNN_GRAPH_K, batch_size=KNN_BATCH_SIZE):
+        """
+        Precompute the k nearest neighbours of every song, for playlists without live searches.
+
+        All rows of reduced_data are searched in batches of batch_size queries, which
+        FAISS spreads over its OpenMP threads. Each song's own row is dropped from its
+        list. The table is stored as int32 rows (-1 where fewer than k neighbours were
+        found) and the distances as float16, in knn_neighbours and knn_distances.
+        Removed songs stay in the table and are skipped when it is walked. create_index,
+        add_songs and load_and_preprocess drop the table, see save_knn_graph to persist it.
+
+        Args:
+            index (faiss.Index): Index to search, defaults to the indexer's own index
+            k (int): Neighbours kept per song
+            batch_size (int): Songs searched per index.search call
+
+        Returns:
+            np.ndarray: The (n_songs, k) int32 neighbour table
+        """
+        index = self.index if index is None else index
+        if index is None:
+            raise ValueError("No index. Call create_index or load first.")
+
+        n_songs = len(self.reduced_data)
+        k = min(k, index.ntotal - 1)
+        neighbours = np.full((n_songs, k), -1, dtype=np.int32)
+        distances = np.zeros((n_songs, k), dtype=np.float16)
+        float16_max = np.finfo(np.float16).max
+        for start in range(0, n_songs, batch_size):
+            rows = np.arange(start, min(start + batch_size, n_songs))
+            batch_distances, batch_indices = index.search(np.ascontiguousarray(self.reduced_data[rows]), k + 1)
+
+            # Keep the first k results that are not the song itself, in their original order
+            keep = (batch_indices != rows[:, None]) & (batch_indices != -1)
+            keep &= np.cumsum(keep, axis=1) <= k
+            targets = np.cumsum(keep, axis=1) - 1
+            batch_rows = np.broadcast_to(np.arange(len(rows))[:, None], keep.shape)
+            neighbours[rows[batch_rows[keep]], targets[keep]] = batch_indices[keep]
+            distances[rows[batch_rows[keep]], targets[keep]] = np.clip(batch_distances[keep], -float16_max, float16_max)
+            logging.info(f"kNN graph: searched {rows[-1] + 1}/{n_songs} songs")
+
+        self.knn_neighbours, self.knn_distances = neighbours, distances
+        return neighbours
+
+    def _unused_table_neighbours(self, playlists, lengths, rows, candidates):
+        """
+        Pick the first candidate of each playlist that is neither in it nor removed.
+
+        Args:
+            playlists (np.ndarray): (n_playlists, playlist_size) song indices, filled up to lengths
+            lengths (np.ndarray): Current length of every playlist
+            rows (np.ndarray): Playlists to pick for
+            candidates (np.ndarray): (len(rows), k) candidate song indices, -1 for none
+
+        Returns:
+            tuple: Boolean mask of the rows with an unused candidate, and those candidates
+        """
+        # taken[i, j] is True when candidate j of playlist i is already in that playlist
+        filled = np.arange(playlists.shape[1])[None, :] < lengths[rows, None]
+        taken = ((candidates[:, :, None] == playlists[rows, None, :]) & filled[:, None, :]).any(axis=2)
+
+        free = ~taken & (candidates != -1) & ~self.removed_mask[candidates]
+        found = free.any(axis=1)
+        return found, candidates[found, free[found].argmax(axis=1)]
+
     def build_playlist(self, index, start_index, playlist_size):
         """
         Build a playlist using the provided index.
+
+        With a kNN graph (build_knn_graph) each step takes the first unused neighbour
+        from the table and only searches the index when all of them are already used.
         
         Args:
             index (faiss.Index): FAISS index to use for similarity search
@@ -99,26 +709,490 @@ class SongIndexer:
             playlist_size (int): Desired size of the playlist
             
         Returns:
-            list: List of song indices forming the playlist
+            list: List of song indices forming the playlist, shorter than playlist_size
+                only if every song reachable through the index is already in it
         """
         playlist = [start_index]
         added_indices = set(playlist)
         
         while len(playlist) < playlist_size:
-            last_vector = self.reduced_data[playlist[-1]].reshape(1, -1)
-            distances, indices = index.search(last_vector, 10)
-            
-            for idx in indices[0]:
-                if idx not in added_indices:
-                    playlist.append(int(idx))
-                    added_indices.add(idx)
-                    break
+            idx = None
+            if self.knn_neighbours is not None:
+                removed = self.removed_mask
+                idx = next((int(i) for i in self.knn_neighbours[playlist[-1]]
+                            if i != -1 and i not in added_indices and not removed[i]), None)
+            if idx is None:
+                idx = next_unused_neighbour(index, self.reduced_data[playlist[-1]], added_indices,
+                                            removed=self.removed,
+                                            search=lambda queries, k: self.search(index, queries, k))
+            if idx is None:
+                logging.warning(f"No unused neighbours left after {len(playlist)} songs, returning a shorter playlist")
+                break
+            playlist.append(idx)
+            added_indices.add(idx)
         
         return playlist
 
+    def build_playlists(self, index, start_indices, playlist_size):
+        """
+        Build one playlist per start index with a single batched search per step.
+
+        Each step sends the last song of every unfinished playlist to the index as one
+        (N, d) query and applies the same selection rule as build_playlist, with the
+        per-playlist exclusion check done as one broadcast comparison. Playlists whose
+        candidates are all taken are searched again, together, with k doubled. With a
+        kNN graph the table is checked first and only the playlists it has no unused
+        neighbour for are searched.
+
+        Args:
+            index (faiss.Index): FAISS index to use for similarity search
+            start_indices (list): Starting song index of each playlist
+            playlist_size (int): Desired size of each playlist
+
+        Returns:
+            list: One list of song indices per start index
+        """
+        start_indices = np.asarray(start_indices, dtype=np.int64)
+        playlists = np.empty((len(start_indices), playlist_size), dtype=np.int64)
+        playlists[:, 0] = start_indices
+        lengths = np.ones(len(start_indices), dtype=np.int64)
+        exhausted = np.zeros(len(start_indices), dtype=bool)
+
+        active = np.flatnonzero(lengths < playlist_size)
+        while active.size:
+            rows = active
+            if self.knn_neighbours is not None:
+                candidates = self.knn_neighbours[playlists[rows, lengths[rows] - 1]].astype(np.int64)
+                found, picks = self._unused_table_neighbours(playlists, lengths, rows, candidates)
+                done = rows[found]
+                playlists[done, lengths[done]] = picks
+                lengths[done] += 1
+                rows = rows[~found]
+
+            k = SEARCH_K
+            while rows.size:
+                k = min(k, index.ntotal)
+                last_vectors = np.ascontiguousarray(self.reduced_data[playlists[rows, lengths[rows] - 1]])
+                distances, indices = self.search(index, last_vectors, k)
+
+                found, picks = self._unused_table_neighbours(playlists, lengths, rows, indices)
+                done = rows[found]
+                playlists[done, lengths[done]] = picks
+                lengths[done] += 1
+
+                rows, indices = rows[~found], indices[~found]
+                if k >= index.ntotal:
+                    exhausted[rows] = True
+                    break
+                exhausted[rows[indices[:, -1] == -1]] = True
+                rows = rows[indices[:, -1] != -1]
+                k *= 2
+
+            active = np.flatnonzero((lengths < playlist_size) & ~exhausted)
+
+        if exhausted.any():
+            logging.warning(f"{exhausted.sum()} playlists ran out of unused neighbours and are shorter than {playlist_size}")
+        return [playlist[:length] for playlist, length in zip(playlists.tolist(), lengths)]
+
+    def build_diverse_playlist(self, index, start_index, playlist_size, diversity=0.3,
+                               pool_size=CANDIDATE_POOL_SIZE):
+        """
+        Build a playlist from one candidate pool with maximal marginal relevance reranking.
+
+        A single search retrieves the pool_size songs closest to the start song. Songs
+        are then picked from the pool one at a time by their MMR score,
+        (1 - diversity) * similarity to the start song - diversity * highest similarity
+        to a song already picked, using a pool-by-pool similarity matrix computed once.
+        Similarity is the inner product for FlatIP indexes and the negative squared
+        L2 distance otherwise. Unlike the greedy chain of build_playlist, every song stays
+        close to the start song.
+
+        Args:
+            index (faiss.Index): FAISS index to use for similarity search
+            start_index (int): Starting song index
+            playlist_size (int): Desired size of the playlist
+            diversity (float): Trade-off between relevance (0.0, plain nearest neighbours)
+                and diversity (1.0)
+            pool_size (int): Number of candidates retrieved, at least playlist_size
+
+        Returns:
+            list: List of song indices forming the playlist, shorter than playlist_size
+                only if the pool holds too few usable songs
+        """
+        k = min(max(pool_size, playlist_size) + 1, index.ntotal)
+        query = np.ascontiguousarray(self.reduced_data[start_index], dtype=np.float32).reshape(1, -1)
+        distances, indices = self.search(index, query, k)
+
+        candidates = indices[0]
+        usable = (candidates != -1) & (candidates != start_index)
+        usable[usable] = ~self.removed_mask[candidates[usable]]
+        candidates = candidates[usable]
+        vectors = np.asarray(self.reduced_data[candidates], dtype=np.float32)
+
+        if self.index_config and self.index_config['index_type'] == 'FlatIP':
+            relevance = vectors @ query[0]
+            similarity = vectors @ vectors.T
+        else:
+            relevance = -((vectors - query) ** 2).sum(axis=1)
+            norms = (vectors ** 2).sum(axis=1)
+            similarity = -(norms[:, None] + norms[None, :] - 2 * vectors @ vectors.T)
+
+        n_picks = min(playlist_size - 1, len(candidates))
+        picked = np.empty(n_picks, dtype=np.int64)
+        available = np.ones(len(candidates), dtype=bool)
+        redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+        for i in range(n_picks):
+            if i == 0:
+                scores = relevance
+            else:
+                scores = (1 - diversity) * relevance - diversity * redundancy
+            best = int(np.argmax(np.where(available, scores, -np.inf)))
+            picked[i] = best
+            available[best] = False
+            np.maximum(redundancy, similarity[best], out=redundancy)
+
+        if n_picks < playlist_size - 1:
+            logging.warning(f"Candidate pool only holds {n_picks} usable songs, returning a shorter playlist")
+        return [start_index] + candidates[picked].tolist()
+
+    def extend_playlist(self, index, seed_indices, n_songs, method='fusion'):
+        """
+        Continue a playlist from all of its songs at once, with a single batched search.
+
+        With method='centroid' the index is searched for the songs closest to the mean of
+        the seed vectors. With method='fusion' every seed is a query of its own and the
+        result lists are merged with reciprocal rank fusion, so songs close to several
+        seeds rank first. method='both' adds the centroid as one more query to the fusion.
+        Seeds and removed songs are excluded, and the search is repeated with k doubled
+        only if too few candidates are left.
+
+        Args:
+            index (faiss.Index): FAISS index to use for similarity search
+            seed_indices (list): Song indices of the playlist to extend
+            n_songs (int): Number of songs to add
+            method (str): 'centroid', 'fusion' or 'both'
+
+        Returns:
+            list: Up to n_songs song indices, best match first
+        """
+        return self.extend_playlists(index, [seed_indices], n_songs, method)[0]
+
+    def extend_playlists(self, index, seed_lists, n_songs, method='fusion'):
+        """
+        Continue several playlists with one batched search, see extend_playlist.
+
+        The queries of every playlist are sent to the index as one (N, d) search and
+        each playlist fuses its own rows of the result. Playlists left with too few
+        candidates are searched again, together, with their k doubled.
+
+        Args:
+            index (faiss.Index): FAISS index to use for similarity search
+            seed_lists (list): Song indices of each playlist to extend
+            n_songs (int): Number of songs to add to each playlist
+            method (str): 'centroid', 'fusion' or 'both'
+
+        Returns:
+            list: Up to n_songs song indices per playlist, best match first
+        """
+        if method not in ('centroid', 'fusion', 'both'):
+            raise ValueError(f"Unsupported extension method: {method}")
+
+        seeds = [np.unique(np.asarray(seed_indices, dtype=np.int64)) for seed_indices in seed_lists]
+        queries = []
+        for playlist_seeds in seeds:
+            seed_vectors = np.asarray(self.reduced_data[playlist_seeds], dtype=np.float32)
+            playlist_queries = []
+            if method in ('fusion', 'both'):
+                playlist_queries.append(seed_vectors)
+            if method in ('centroid', 'both'):
+                centroid = seed_vectors.mean(axis=0, keepdims=True)
+                if self.index_config and self.index_config['index_type'] == 'FlatIP':
+                    faiss.normalize_L2(centroid)
+                playlist_queries.append(centroid)
+            queries.append(np.concatenate(playlist_queries))
+        removed = self.removed_mask
+
+        results = [None] * len(seeds)
+        ks = np.array([n_songs + len(playlist_seeds) for playlist_seeds in seeds], dtype=np.int64)
+        pending = list(range(len(seeds)))
+        while pending:
+            ks[pending] = np.minimum(ks[pending], index.ntotal)
+            bounds = np.cumsum([0] + [len(queries[i]) for i in pending])
+            distances, indices = self.search(index, np.ascontiguousarray(np.concatenate([queries[i] for i in pending])),
+                                             int(ks[pending].max()))
+
+            retry = []
+            for position, i in enumerate(pending):
+                k = ks[i]
+                playlist_indices = indices[bounds[position]:bounds[position + 1], :k]
+
+                # Fused score of every candidate: sum over the queries of 1 / (RRF_K + rank)
+                ranks = np.broadcast_to(np.arange(k), playlist_indices.shape)
+                valid = playlist_indices != -1
+                candidates, inverse = np.unique(playlist_indices[valid], return_inverse=True)
+                scores = np.bincount(inverse, weights=1.0 / (RRF_K + 1 + ranks[valid]), minlength=len(candidates))
+
+                keep = ~np.isin(candidates, seeds[i]) & ~removed[candidates]
+                candidates, scores = candidates[keep], scores[keep]
+                if len(candidates) >= n_songs or k >= index.ntotal or (playlist_indices[:, -1] == -1).all():
+                    order = np.argsort(-scores, kind='stable')[:n_songs]
+                    results[i] = candidates[order].tolist()
+                else:
+                    ks[i] *= 2
+                    retry.append(i)
+            pending = retry
+        return results
+
+    def extend_track_playlist(self, index, track_ids, n_songs, method='fusion'):
+        """
+        Continue a playlist given as Spotify track ids, see extend_playlist.
+
+        Returns:
+            list: Up to n_songs Spotify track ids, best match first
+        """
+        return self.get_track_ids(self.extend_playlist(index, self.rows_of(track_ids), n_songs, method))
+
+    def build_track_playlist(self, index, track_id, playlist_size):
+        """
+        Build a playlist from a seed track, see build_playlist.
+
+        Args:
+            index (faiss.Index): FAISS index to use for similarity search
+            track_id (str): Spotify track id of the first song
+            playlist_size (int): Desired size of the playlist
+
+        Returns:
+            list: Spotify track ids of the playlist
+        """
+        return self.get_track_ids(self.build_playlist(index, self.track_rows[track_id], playlist_size))
+
+    def build_track_playlists(self, index, track_ids, playlist_size):
+        """
+        Build one playlist per seed track with batched searches, see build_playlists.
+
+        Args:
+            index (faiss.Index): FAISS index to use for similarity search
+            track_ids (list): Spotify track id of the first song of each playlist
+            playlist_size (int): Desired size of each playlist
+
+        Returns:
+            list: One list of Spotify track ids per seed track
+        """
+        playlists = self.build_playlists(index, self.rows_of(track_ids), playlist_size)
+        # Materialize all playlists with a single gather, then split them again
+        flat = self.get_track_ids(np.concatenate([np.asarray(p, dtype=np.int64) for p in playlists]))
+        ends = np.cumsum([len(p) for p in playlists])
+        return [flat[end - len(p):end] for p, end in zip(playlists, ends)]
+
     def get_song_names(self, playlist_indices):
         """Get song names for the given playlist indices."""
-        return [self.data.iloc[idx]['name'] for idx in playlist_indices]
+        return self.song_columns[1][np.asarray(playlist_indices, dtype=np.int64)].tolist()
+
+    def save(self, directory):
+        """
+        Persist the fitted scaler, PCA, reduced vectors and FAISS index.
+
+        The manifest is written last, so an interrupted save is treated as stale.
+
+        Args:
+            directory (str): Directory to write the artifacts to
+        """
+        if self.reduced_data is None or self.index is None:
+            raise ValueError("Nothing to save. Call load_and_preprocess and create_index first.")
+
+        os.makedirs(directory, exist_ok=True)
+        # Without a manifest the directory reads as stale until the new one is written
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        # Every file is written next to its target and moved over it, so the artifacts of a
+        # loaded indexer that are memory-mapped from this directory stay readable
+        replace_file(os.path.join(directory, SCALER_FILE), lambda f: pickle.dump(self.scaler, f))
+        replace_file(os.path.join(directory, PCA_FILE), lambda f: pickle.dump(self.pca, f))
+        replace_file(os.path.join(directory, VECTORS_FILE),
+                     lambda f: np.save(f, np.ascontiguousarray(self.reduced_data, dtype=np.float32)))
+        replace_file(os.path.join(directory, INDEX_FILE),
+                     lambda f: faiss.write_index(self.index, faiss.PyCallbackIOWriter(f.write)))
+        replace_file(os.path.join(directory, REMOVED_FILE), lambda f: np.save(f, self.removed_mask))
+        added_songs_path = os.path.join(directory, ADDED_SONGS_FILE)
+        if self.added_songs is not None:
+            replace_file(added_songs_path, self.added_songs.to_pickle)
+        elif os.path.exists(added_songs_path):
+            os.remove(added_songs_path)
+        self._write_knn_graph(directory)
+
+        manifest = {
+            'version': ARTIFACT_VERSION,
+            'n_components': self.n_components,
+            'features': self.features,
+            'filepath': self.filepath,
+            'source': file_fingerprint(self.filepath) if self.filepath else None,
+            'index_config': self.index_config,
+            'n_vectors': int(self.reduced_data.shape[0]),
+            'ivf_stats': self.ivf_stats,
+            'knn_k': None if self.knn_neighbours is None else int(self.knn_neighbours.shape[1]),
+        }
+        write_manifest(directory, manifest)
+        logging.info(f"Saved index artifacts to {directory}")
+
+    def _write_knn_graph(self, directory):
+        for name, table in ((KNN_NEIGHBOURS_FILE, self.knn_neighbours), (KNN_DISTANCES_FILE, self.knn_distances)):
+            path = os.path.join(directory, name)
+            if table is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            # Written next to the file and moved over it, so a memory-mapped old table stays readable
+            replace_file(path, lambda f, table=table: np.save(f, np.ascontiguousarray(table)))
+
+    def save_knn_graph(self, directory):
+        """
+        Add the kNN graph (build_knn_graph) to artifacts already saved in a directory.
+
+        Only the table files and the manifest are written, so this is the offline step
+        after load: load, build_knn_graph, save_knn_graph.
+        """
+        manifest = read_manifest(directory)
+        if manifest is None:
+            raise FileNotFoundError(f"No index artifacts found in {directory}")
+        if manifest['n_vectors'] != len(self.reduced_data):
+            raise ValueError(f"The artifacts in {directory} hold {manifest['n_vectors']} songs, "
+                             f"not the {len(self.reduced_data)} of this indexer")
+        self._write_knn_graph(directory)
+        manifest['knn_k'] = None if self.knn_neighbours is None else int(self.knn_neighbours.shape[1])
+        write_manifest(directory, manifest)
+        logging.info(f"Saved kNN graph to {directory}")
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load an indexer previously written with save.
+
+        Args:
+            directory (str): Directory holding the artifacts
+            mmap (bool): Memory-map the vectors and the FAISS index instead of reading them.
+                add_songs and remove_songs copy what they change into memory first.
+
+        Returns:
+            SongIndexer: Indexer ready for search, with the song table loaded on first use
+        """
+        manifest = read_manifest(directory)
+        if manifest is None:
+            raise FileNotFoundError(f"No index artifacts found in {directory}")
+
+        indexer = cls(n_components=manifest['n_components'])
+        with open(os.path.join(directory, SCALER_FILE), 'rb') as f:
+            indexer.scaler = pickle.load(f)
+        with open(os.path.join(directory, PCA_FILE), 'rb') as f:
+            indexer.pca = pickle.load(f)
+        indexer.reduced_data = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode='r' if mmap else None)
+        indexer.removed = np.load(os.path.join(directory, REMOVED_FILE))
+        added_songs_path = os.path.join(directory, ADDED_SONGS_FILE)
+        if os.path.exists(added_songs_path):
+            indexer.added_songs = pd.read_pickle(added_songs_path)
+        if manifest.get('knn_k'):
+            indexer.knn_neighbours = np.load(os.path.join(directory, KNN_NEIGHBOURS_FILE), mmap_mode='r' if mmap else None)
+            indexer.knn_distances = np.load(os.path.join(directory, KNN_DISTANCES_FILE), mmap_mode='r' if mmap else None)
+
+        index_path = os.path.join(directory, INDEX_FILE)
+        try:
+            indexer.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP if mmap else 0)
+        except RuntimeError:
+            # Not every index type supports memory-mapped reads
+            indexer.index = faiss.read_index(index_path)
+
+        indexer.filepath = manifest['filepath']
+        indexer.features = manifest['features']
+        indexer.index_config = manifest['index_config']
+        indexer.ivf_stats = manifest['ivf_stats']
+        if indexer.index_config['index_type'] in IVF_INDEX_TYPES:
+            indexer.index.nprobe = indexer.index_config['nprobe']
+        logging.info(f"Loaded {manifest['n_vectors']} vectors from {directory}")
+        return indexer
+
+    @classmethod
+    def is_stale(cls, directory, filepath, features, n_components=10, **index_params):
+        """
+        Check whether the artifacts in a directory are missing or out of date.
+
+        Artifacts are stale when the format version, configuration or source file differs.
+        The source file is only re-hashed when its size or modification time changed.
+
+        Returns:
+            bool: True if the artifacts must be rebuilt
+        """
+        manifest = read_manifest(directory)
+        if manifest is None or manifest.get('version') != ARTIFACT_VERSION:
+            return True
+        if (manifest['n_components'] != n_components
+                or manifest['features'] != list(features)
+                or manifest['index_config'] != resolve_index_config(**index_params)):
+            return True
+
+        source = manifest['source']
+        if source is None or not os.path.exists(filepath):
+            return True
+        stat = os.stat(filepath)
+        if stat.st_size == source['size'] and stat.st_mtime == source['mtime']:
+            return False
+        return file_fingerprint(filepath)['sha256'] != source['sha256']
+
+    @classmethod
+    def load_or_build(cls, directory, filepath, features, n_components=10, mmap=True, **index_params):
+        """
+        Warm-start from saved artifacts, rebuilding and saving them first if stale.
+
+        Args:
+            directory (str): Artifact directory
+            filepath (str): Source CSV file
+            features (list): Feature columns to index
+            n_components (int): Number of PCA components
+            mmap (bool): Memory-map the loaded artifacts
+            **index_params: Parameters forwarded to create_index
+
+        Returns:
+            SongIndexer: Indexer with its index attached as `indexer.index`
+        """
+        if cls.is_stale(directory, filepath, features, n_components, **index_params):
+            logging.info(f"Index artifacts in {directory} are missing or stale, rebuilding")
+            indexer = cls(n_components=n_components)
+            indexer.load_and_preprocess(filepath, features)
+            indexer.create_index(**index_params)
+            indexer.save(directory)
+            return indexer
+        return cls.load(directory, mmap=mmap)
+
+
+def write_manifest(directory, manifest):
+    """Write the artifact manifest of a directory atomically."""
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def read_manifest(directory):
+    """Read the artifact manifest from a directory, or return None if absent."""
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def precompute_knn_graph(directory, k=KNN_GRAPH_K):
+    """
+    Offline step: build the kNN graph of saved index artifacts and add it to them.
+
+    Run after every ingestion, playlists loaded from the directory then walk the table.
+
+    Returns:
+        SongIndexer: The loaded indexer with its kNN graph
+    """
+    indexer = SongIndexer.load(directory)
+    indexer.build_knn_graph(k=k)
+    indexer.save_knn_graph(directory)
+    return indexer
 
 
 def test_indices(filepath, features, start_song_index=0, playlist_size=10):
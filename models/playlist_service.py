@@ -0,0 +1,394 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import numpy as np
+from models.indexing import SongIndexer
+
+# Seconds a batch stays open for concurrent requests to join it
+BATCH_WINDOW = 0.002
+# Requests after which a batch is closed without waiting for the rest of the window
+MAX_BATCH_SIZE = 256
+# Batches of one kind run at the same time; requests arriving meanwhile join the next batch
+MAX_RUNNING_BATCHES = 2
+# Threads running batches and single diverse playlist requests
+REQUEST_WORKERS = 8
+MAX_PLAYLIST_SIZE = 1000
+# Latest request latencies kept for the p50/p99 of the stats endpoint
+LATENCY_WINDOW = 10000
+
+
+class MicroBatcher:
+    """
+    Coalesce requests arriving on the event loop into batch calls.
+
+    Requests are grouped by key, e.g. the playlist size. A group closes window seconds
+    after its first request, or as soon as it holds max_batch requests, and is then
+    handed to run_batch(key, items) in a thread pool; every request receives the result
+    at its position. At most max_running batches run at once, and a closed group keeps
+    taking requests until it can start, so batches grow with the load while an idle
+    service only adds the window to a request. With window=None every request is run
+    as a batch of its own right away.
+
+    Args:
+        run_batch (callable): Called with a key and a list of items, returns one result per item
+        executor (concurrent.futures.Executor): Pool running the batches
+        window (float): Seconds a group stays open after its first request, or None
+        max_batch (int): Requests that close a group early
+        max_running (int): Batches running at the same time
+    """
+
+    def __init__(self, run_batch, executor, window=BATCH_WINDOW, max_batch=MAX_BATCH_SIZE,
+                 max_running=MAX_RUNNING_BATCHES):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.max_running = max_running
+        self._groups = {}
+        self._ready = deque()
+        self._running = 0
+        self._counters = {'requests': 0, 'batches': 0}
+
+    async def submit(self, key, item):
+        """Queue one request and return its result once its batch has run."""
+        if self.window is None:
+            return (await self._run(key, [item]))[0]
+
+        loop = asyncio.get_running_loop()
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = {'items': [], 'futures': [], 'closed': False}
+            loop.call_later(self.window, self._close, key, group)
+        future = loop.create_future()
+        group['items'].append(item)
+        group['futures'].append(future)
+        if len(group['items']) >= self.max_batch:
+            # A full group takes no more requests, the next one opens a new group
+            del self._groups[key]
+            self._close(key, group)
+        return await future
+
+    def _close(self, key, group):
+        if group['closed']:
+            return
+        group['closed'] = True
+        self._ready.append((key, group))
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._ready and self._running < self.max_running:
+            key, group = self._ready.popleft()
+            if self._groups.get(key) is group:
+                del self._groups[key]
+            self._running += 1
+            task = asyncio.ensure_future(self._run(key, group['items']))
+            task.add_done_callback(functools.partial(self._finish, group['futures']))
+
+    def _finish(self, futures, task):
+        self._running -= 1
+        for i, future in enumerate(futures):
+            if future.done():
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result()[i])
+        self._dispatch()
+
+    async def _run(self, key, items):
+        self._counters['requests'] += len(items)
+        self._counters['batches'] += 1
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.run_batch, key, items)
+
+    def stats(self):
+        """Return the requests and batches so far and the mean batch size."""
+        stats = dict(self._counters)
+        stats['mean_batch_size'] = stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+
+def is_kind(value, kind):
+    """Check the type of a decoded JSON value: booleans are not numbers, integers are floats."""
+    if isinstance(value, bool):
+        return kind is bool
+    if kind is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, kind)
+
+
+def require(body, name, kind, item_kind=None):
+    """
+    Return a field of a request body, raising ValueError if it is missing or of the wrong type.
+
+    Values are checked, not converted, so "abc" is no list and 3.7 no int. With item_kind
+    the field must be a list of values of that type.
+    """
+    if name not in body:
+        raise ValueError(f"Missing field '{name}'")
+    value = body[name]
+    if item_kind is not None:
+        if not isinstance(value, list) or not all(is_kind(item, item_kind) for item in value):
+            raise ValueError(f"Field '{name}' must be a list of {item_kind.__name__}")
+        return value
+    if not is_kind(value, kind):
+        raise ValueError(f"Field '{name}' must be of type {kind.__name__}")
+    return float(value) if kind is float else value
+
+
+class PlaylistService:
+    """
+    Asyncio HTTP service generating and extending playlists with a SongIndexer.
+
+    Connections are served on the event loop. Playlist requests arriving within
+    batch_window seconds of each other are coalesced by a MicroBatcher into one
+    build_playlists or extend_playlists call, which sends a single batched FAISS
+    search per step for all of them. Diverse playlists are one search each and are
+    built one request at a time in the thread pool.
+
+    Endpoints (JSON in and out):
+        POST /playlist  {"track_id" or "start_index", "size", optional "diversity"}:
+            build_playlist, or build_diverse_playlist if diversity is given
+        POST /extend    {"track_ids" or "seed_indices", "size", optional "method"}:
+            extend_playlist
+        GET  /health    Number of songs and index configuration
+        GET  /stats     Requests, errors, throughput, p50/p99 latency, batching and neighbour cache counters
+
+    Args:
+        indexer (SongIndexer): Indexer with its index attached as indexer.index
+        batch_window (float): Batching window in seconds, None to serve every request on its own
+        workers (int): Batches worked on at the same time
+    """
+
+    def __init__(self, indexer, batch_window=BATCH_WINDOW, workers=REQUEST_WORKERS):
+        if indexer.index is None:
+            raise ValueError("The indexer has no index. Call create_index or load first.")
+        self.indexer = indexer
+        # Load the song table and the track id lookup now instead of in the first request
+        self.has_songs = indexer.table is not None
+        if self.has_songs:
+            indexer.track_rows
+        self.routes = {
+            ('POST', '/playlist'): self.generate,
+            ('POST', '/extend'): self.extend,
+            ('GET', '/health'): self.health,
+            ('GET', '/stats'): self.stats,
+        }
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='playlist')
+        self.playlists = MicroBatcher(
+            lambda size, start_indices: indexer.build_playlists(indexer.index, start_indices, size),
+            self._executor, batch_window)
+        self.extensions = MicroBatcher(
+            lambda key, seed_lists: indexer.extend_playlists(indexer.index, seed_lists, *key),
+            self._executor, batch_window)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {'requests': 0, 'errors': 0}
+        self._started = time.perf_counter()
+        self._server = None
+        # Handler task of every open connection by its writer, see stop
+        self._connections = {}
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """Start listening, port 0 picks a free port. Returns the service."""
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        self._started = time.perf_counter()
+        logging.info(f"Playlist service listening on {self.url}")
+        return self
+
+    @property
+    def url(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        self._server.close()
+        # Idle keep-alive connections are closed, so their handlers see EOF and return
+        connections = dict(self._connections)
+        for writer in connections:
+            writer.close()
+        await asyncio.gather(*connections.values(), return_exceptions=True)
+        await self._server.wait_closed()
+        self._executor.shutdown()
+
+    def _playlist_response(self, playlist):
+        response = {'indices': [int(i) for i in playlist]}
+        if self.has_songs:
+            response['track_ids'] = self.indexer.get_track_ids(playlist)
+            response['names'] = self.indexer.get_song_names(playlist)
+        return response
+
+    def _playlist_size(self, body):
+        size = require(body, 'size', int)
+        if not 1 <= size <= MAX_PLAYLIST_SIZE:
+            raise ValueError(f"Field 'size' must be between 1 and {MAX_PLAYLIST_SIZE}")
+        return size
+
+    def _require_songs(self, name):
+        if not self.has_songs:
+            raise ValueError(f"Field '{name}' is not supported: this index has no song table, use row indices")
+
+    def _row(self, start_index):
+        if not 0 <= start_index < len(self.indexer.reduced_data) or self.indexer.removed_mask[start_index]:
+            raise KeyError(start_index)
+        return start_index
+
+    async def generate(self, body):
+        size = self._playlist_size(body)
+        if 'track_id' in body:
+            self._require_songs('track_id')
+            start_index = self.indexer.track_rows[require(body, 'track_id', str)]
+        else:
+            start_index = self._row(require(body, 'start_index', int))
+        if 'diversity' in body:
+            diversity = require(body, 'diversity', float)
+            if not 0 <= diversity <= 1:
+                raise ValueError("Field 'diversity' must be between 0 and 1")
+            build = functools.partial(self.indexer.build_diverse_playlist, self.indexer.index, start_index, size,
+                                      diversity=diversity)
+            playlist = await asyncio.get_running_loop().run_in_executor(self._executor, build)
+        else:
+            playlist = await self.playlists.submit(size, start_index)
+        return self._playlist_response(playlist)
+
+    async def extend(self, body):
+        size = self._playlist_size(body)
+        if 'track_ids' in body:
+            self._require_songs('track_ids')
+            seeds = self.indexer.rows_of(require(body, 'track_ids', list, str))
+        else:
+            seeds = [self._row(i) for i in require(body, 'seed_indices', list, int)]
+        if len(seeds) == 0:
+            raise ValueError("A playlist needs at least one seed song")
+        method = body.get('method', 'fusion')
+        if method not in ('centroid', 'fusion', 'both'):
+            raise ValueError(f"Unsupported extension method: {method}")
+        playlist = await self.extensions.submit((size, method), seeds)
+        return self._playlist_response(playlist)
+
+    def health(self, body):
+        return {'songs': int(self.indexer.index.ntotal), 'index_config': self.indexer.index_config}
+
+    def stats(self, body=None):
+        """Requests and errors so far, throughput, p50/p99 latency in ms, batching and neighbour cache counters."""
+        elapsed = time.perf_counter() - self._started
+        latencies = np.array(self._latencies) * 1000
+        return {
+            **self._counters,
+            'elapsed': elapsed,
+            'requests_per_second': self._counters['requests'] / elapsed if elapsed else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'batching': {'playlist': self.playlists.stats(), 'extend': self.extensions.stats()},
+            'neighbour_cache': self.indexer.neighbour_cache.stats(),
+        }
+
+    async def handle(self, method, path, body):
+        """
+        Answer one request.
+
+        Returns:
+            tuple: (HTTP status, JSON serializable response)
+        """
+        handler = self.routes.get((method, path.split('?', 1)[0]))
+        if handler is None:
+            return HTTPStatus.NOT_FOUND, {'error': f'No endpoint {method} {path}'}
+        if method == 'GET':
+            return HTTPStatus.OK, handler({})
+
+        start = time.perf_counter()
+        try:
+            request = json.loads(body or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("The request body must be a JSON object")
+            response = await handler(request)
+            status = HTTPStatus.OK
+        except KeyError as e:
+            status, response = HTTPStatus.NOT_FOUND, {'error': f'Unknown song {e}'}
+        except ValueError as e:
+            status, response = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            logging.error(f"Error handling {method} {path}: {e}")
+            status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal server error'}
+        self._latencies.append(time.perf_counter() - start)
+        self._counters['requests'] += 1
+        self._counters['errors'] += status != HTTPStatus.OK
+        return status, response
+
+    async def _serve_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests of one keep-alive connection until the client closes it."""
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self.handle(method, path, body)
+                payload = json.dumps(response).encode()
+                writer.write(
+                    f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                    f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'.encode() + payload
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            del self._connections[writer]
+            writer.close()
+
+
+async def serve(indexer, host, port, batch_window=BATCH_WINDOW, workers=REQUEST_WORKERS):
+    service = await PlaylistService(indexer, batch_window, workers).start(host, port)
+    try:
+        await service.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Playlist generation service over a saved SongIndexer")
+    parser.add_argument('artifacts', help="Directory written by SongIndexer.save")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--batch-window-ms', type=float, default=BATCH_WINDOW * 1000,
+                        help="Batching window of concurrent requests, negative to disable batching")
+    parser.add_argument('--workers', type=int, default=REQUEST_WORKERS)
+    parser.add_argument('--no-mmap', action='store_true', help="Read the artifacts into memory")
+    args = parser.parse_args()
+
+    indexer = SongIndexer.load(args.artifacts, mmap=not args.no_mmap)
+    batch_window = args.batch_window_ms / 1000 if args.batch_window_ms >= 0 else None
+    try:
+        asyncio.run(serve(indexer, args.host, args.port, batch_window, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glob
+import hashlib
+import json
+import logging
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from models.feature_store import FeatureStore
+from models.indexing import (
+    ARTIFACT_VERSION, PCA_FILE, SCALER_FILE, SEARCH_K, SongIndexer,
+    file_fingerprint, read_manifest, resolve_index_config, write_manifest
+)
+
+SPACE_DIR = 'space'
+SHARDS_DIR = 'shards'
+# Written into a shard directory after its artifacts, names the shared space it was built in
+SHARD_SPACE_FILE = 'space.json'
+
+# Songs sampled across all genre files to fit the shared scaler and PCA
+SPACE_SAMPLE_SIZE = 200000
+
+
+def genre_files(data_dir='data'):
+    """Return the songs CSV of every genre written by the collector, by genre name."""
+    suffix = '_songs_features.csv'
+    return {
+        os.path.basename(path)[:-len(suffix)]: path
+        for path in sorted(glob.glob(os.path.join(data_dir, f'*{suffix}')))
+    }
+
+
+class ShardedSongIndex:
+    """
+    One SongIndexer per genre file, all projected into one shared scaler and PCA space.
+
+    The shared space is fitted once on a sample of every genre file and stays fixed, so
+    a shard can be built, rebuilt or reloaded on its own without touching the others,
+    and distances from different shards are comparable. Searches fan out to all or
+    selected shards in parallel threads (FAISS releases the GIL while searching) and
+    the per-shard top-k lists are merged into one. Songs are addressed as
+    (genre, row) pairs, where row is the row of the song in its shard.
+
+    Artifacts are written to <directory>/space (scaler, PCA and manifest) and
+    <directory>/shards/<genre> (a SongIndexer.save directory per shard).
+
+    Args:
+        directory (str): Artifact directory of the sharded index
+        features (list): Feature columns to index
+        n_components (int): Number of PCA components of the shared space
+        max_workers (int): Threads searching shards in parallel, defaults to the number of CPUs
+        **index_params: Parameters forwarded to create_index of every shard
+    """
+
+    def __init__(self, directory, features, n_components=10, max_workers=None, **index_params):
+        self.directory = directory
+        self.features = list(features)
+        self.n_components = n_components
+        self.index_config = resolve_index_config(**index_params)
+        self.scaler = None
+        self.pca = None
+        self.space_id = None
+        self.shards = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                            thread_name_prefix='shard-search')
+
+    @property
+    def space_dir(self):
+        return os.path.join(self.directory, SPACE_DIR)
+
+    def shard_dir(self, genre):
+        return os.path.join(self.directory, SHARDS_DIR, genre)
+
+    @property
+    def genres(self):
+        """Genres of the loaded shards."""
+        return list(self.shards)
+
+    @property
+    def inner_product(self):
+        """Whether larger distances are better (FlatIP shards)."""
+        return self.index_config['index_type'] == 'FlatIP'
+
+    def fit_space(self, filepaths, sample_size=SPACE_SAMPLE_SIZE, seed=0):
+        """
+        Fit the shared scaler and PCA on a sample of songs from every genre file and save them.
+
+        Every genre contributes in proportion to its number of songs. Refitting the
+        space makes every existing shard stale.
+
+        Args:
+            filepaths (list): Songs CSV files to sample from
+            sample_size (int): Total number of songs sampled
+            seed (int): Seed of the sample
+        """
+        stores = [FeatureStore.open(filepath) for filepath in filepaths]
+        n_total = sum(len(store) for store in stores)
+        if n_total == 0:
+            raise ValueError("No songs to fit the shared space on.")
+
+        rng = np.random.default_rng(seed)
+        samples = []
+        for store in stores:
+            features = store.features(self.features)
+            n_sample = min(len(features), int(np.ceil(len(features) * sample_size / n_total)))
+            samples.append(features[np.sort(rng.choice(len(features), n_sample, replace=False))])
+        sample = np.concatenate(samples)
+
+        indexer = SongIndexer(n_components=self.n_components)
+        indexer.pca.fit(indexer.scaler.fit_transform(sample))
+        self.scaler, self.pca = indexer.scaler, indexer.pca
+
+        os.makedirs(self.space_dir, exist_ok=True)
+        with open(os.path.join(self.space_dir, SCALER_FILE), 'wb') as f:
+            pickle.dump(self.scaler, f)
+        with open(os.path.join(self.space_dir, PCA_FILE), 'wb') as f:
+            pickle.dump(self.pca, f)
+        digest = hashlib.sha256()
+        for name in (SCALER_FILE, PCA_FILE):
+            digest.update(file_fingerprint(os.path.join(self.space_dir, name))['sha256'].encode())
+        self.space_id = digest.hexdigest()
+        self._write_manifest(n_sampled=len(sample))
+        logging.info(f"Fitted shared space on {len(sample)} songs from {len(stores)} files")
+
+    def _write_manifest(self, **extra):
+        manifest = read_manifest(self.space_dir) or {}
+        manifest.update(extra)
+        manifest.update({
+            'version': ARTIFACT_VERSION,
+            'n_components': self.n_components,
+            'features': self.features,
+            'index_config': self.index_config,
+            'space_id': self.space_id,
+        })
+        write_manifest(self.space_dir, manifest)
+
+    def load_space(self):
+        """
+        Load the saved shared space.
+
+        Returns:
+            bool: False if there is no saved space for these features and n_components
+        """
+        manifest = read_manifest(self.space_dir)
+        if (manifest is None or manifest.get('version') != ARTIFACT_VERSION
+                or manifest['n_components'] != self.n_components
+                or manifest['features'] != self.features):
+            return False
+        with open(os.path.join(self.space_dir, SCALER_FILE), 'rb') as f:
+            self.scaler = pickle.load(f)
+        with open(os.path.join(self.space_dir, PCA_FILE), 'rb') as f:
+            self.pca = pickle.load(f)
+        self.space_id = manifest['space_id']
+        if manifest['index_config'] != self.index_config:
+            self._write_manifest()
+        return True
+
+    def shard_space_id(self, genre):
+        """Return the id of the space a saved shard was built in, or None."""
+        path = os.path.join(self.shard_dir(genre), SHARD_SPACE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)['space_id']
+
+    def is_shard_stale(self, genre, filepath):
+        """Check whether a saved shard is missing, out of date or built in another space."""
+        return (self.shard_space_id(genre) != self.space_id
+                or SongIndexer.is_stale(self.shard_dir(genre), filepath, self.features,
+                                        self.n_components, **self.index_config))
+
+    def build_shard(self, genre, filepath):
+        """
+        Project one genre file into the shared space, index and save it as a shard.
+
+        Args:
+            genre (str): Shard name
+            filepath (str): Songs CSV of the genre
+
+        Returns:
+            SongIndexer: The shard
+        """
+        if self.pca is None:
+            raise ValueError("No shared space. Call fit_space or load_space first.")
+        indexer = SongIndexer(n_components=self.n_components)
+        indexer.scaler, indexer.pca = self.scaler, self.pca
+        indexer.load_and_preprocess(filepath, self.features, fit=False)
+        indexer.create_index(**self.index_config)
+
+        shard_dir = self.shard_dir(genre)
+        space_path = os.path.join(shard_dir, SHARD_SPACE_FILE)
+        if os.path.exists(space_path):
+            # An interrupted rebuild must not pass as built in the current space
+            os.remove(space_path)
+        indexer.save(shard_dir)
+        with open(space_path, 'w') as f:
+            json.dump({'space_id': self.space_id}, f)
+        self.shards[genre] = indexer
+        logging.info(f"Built shard {genre} with {len(indexer.reduced_data)} songs")
+        return indexer
+
+    def load_shard(self, genre, mmap=True):
+        """
+        Load a saved shard, replacing the loaded one of the same genre.
+
+        Raises:
+            ValueError: If the shard was built in another shared space
+        """
+        if self.shard_space_id(genre) != self.space_id:
+            raise ValueError(f"Shard {genre} was not built in the current shared space, rebuild it")
+        self.shards[genre] = SongIndexer.load(self.shard_dir(genre), mmap=mmap)
+        return self.shards[genre]
+
+    @classmethod
+    def load(cls, directory, genres=None, mmap=True, max_workers=None):
+        """
+        Load a saved sharded index.
+
+        Args:
+            directory (str): Artifact directory
+            genres (list): Shards to load, defaults to every saved shard
+            mmap (bool): Memory-map the shard artifacts
+            max_workers (int): Threads searching shards in parallel
+
+        Returns:
+            ShardedSongIndex: Index with the requested shards loaded
+        """
+        manifest = read_manifest(os.path.join(directory, SPACE_DIR))
+        if manifest is None:
+            raise FileNotFoundError(f"No sharded index found in {directory}")
+        sharded = cls(directory, manifest['features'], manifest['n_components'], max_workers,
+                      **manifest['index_config'])
+        sharded.load_space()
+        if genres is None:
+            genres = sorted(os.listdir(os.path.join(directory, SHARDS_DIR)))
+        for genre in genres:
+            sharded.load_shard(genre, mmap=mmap)
+        return sharded
+
+    @classmethod
+    def load_or_build(cls, directory, filepaths, features, n_components=10, mmap=True, max_workers=None,
+                      **index_params):
+        """
+        Warm-start every shard from its saved artifacts, building only the missing or stale ones.
+
+        The shared space is fitted on all filepaths when there is none yet. An existing
+        space is kept, so new or changed genre files are projected into it.
+
+        Args:
+            directory (str): Artifact directory
+            filepaths (dict): Songs CSV by genre, e.g. genre_files()
+            features (list): Feature columns to index
+            n_components (int): Number of PCA components
+            mmap (bool): Memory-map the loaded shard artifacts
+            max_workers (int): Threads searching shards in parallel
+            **index_params: Parameters forwarded to create_index of every shard
+
+        Returns:
+            ShardedSongIndex: Index with one shard per genre
+        """
+        sharded = cls(directory, features, n_components, max_workers, **index_params)
+        if not sharded.load_space():
+            logging.info(f"No shared space in {directory}, fitting it on {len(filepaths)} files")
+            sharded.fit_space(list(filepaths.values()))
+        for genre, filepath in filepaths.items():
+            if sharded.is_shard_stale(genre, filepath):
+                logging.info(f"Shard {genre} is missing or stale, rebuilding")
+                sharded.build_shard(genre, filepath)
+            else:
+                sharded.load_shard(genre, mmap=mmap)
+        return sharded
+
+    def project(self, features):
+        """Project raw feature rows into the shared space."""
+        vectors = self.pca.transform(self.scaler.transform(features)).astype(np.float32)
+        if self.inner_product:
+            faiss.normalize_L2(vectors)
+        return vectors
+
+    def vector(self, song):
+        """Return the vector of a (genre, row) song."""
+        genre, row = song
+        return self.shards[genre].reduced_data[row]
+
+    def _search_shard(self, genre, queries, k):
+        indexer = self.shards[genre]
+        distances, rows = indexer.index.search(queries, min(k, indexer.index.ntotal))
+        invalid = rows == -1
+        invalid[~invalid] = indexer.removed_mask[rows[~invalid]]
+        rows[invalid] = -1
+        distances[invalid] = -np.inf if self.inner_product else np.inf
+        return distances, rows
+
+    def search(self, queries, k=SEARCH_K, genres=None):
+        """
+        Search all or selected shards in parallel and merge their results.
+
+        Args:
+            queries (np.ndarray): (n_queries, n_components) vectors in the shared space
+            k (int): Number of neighbours per query
+            genres (list): Shards to search, defaults to all loaded shards
+
+        Returns:
+            tuple: (distances, genres, rows), each of shape (n_queries, k) and ordered best
+                first. genres is an object array of shard names, None (with row -1) where
+                fewer than k songs were found.
+        """
+        genres = self.genres if genres is None else list(genres)
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.n_components)
+        if len(genres) == 1:
+            results = [self._search_shard(genres[0], queries, k)]
+        else:
+            results = list(self._executor.map(lambda genre: self._search_shard(genre, queries, k), genres))
+
+        distances = np.concatenate([d for d, _ in results], axis=1)
+        rows = np.concatenate([r for _, r in results], axis=1)
+        shard_of = np.repeat(np.arange(len(genres)), [r.shape[1] for _, r in results])
+        order = np.argsort(-distances if self.inner_product else distances, axis=1, kind='stable')[:, :k]
+
+        distances = np.take_along_axis(distances, order, axis=1)
+        rows = np.take_along_axis(rows, order, axis=1)
+        names = np.array(genres + [None], dtype=object)[np.where(rows == -1, len(genres), shard_of[order])]
+        if rows.shape[1] < k:
+            pad = k - rows.shape[1]
+            distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.nan)
+            rows = np.pad(rows, ((0, 0), (0, pad)), constant_values=-1)
+            names = np.pad(names, ((0, 0), (0, pad)), constant_values=None)
+        return distances, names, rows
+
+    def build_playlist(self, genre, start_index, playlist_size, genres=None):
+        """
+        Build a playlist across shards, starting from a song of one genre.
+
+        Like SongIndexer.build_playlist, every step adds the nearest unused neighbour of
+        the last song and doubles k while all returned songs are already used.
+
+        Args:
+            genre (str): Shard of the first song
+            start_index (int): Row of the first song in its shard
+            playlist_size (int): Desired size of the playlist
+            genres (list): Shards to pick songs from, defaults to all loaded shards
+
+        Returns:
+            list: (genre, row) of every song of the playlist
+        """
+        genres = self.genres if genres is None else list(genres)
+        n_total = sum(self.shards[g].index.ntotal for g in genres)
+        playlist = [(genre, int(start_index))]
+        used = set(playlist)
+        while len(playlist) < playlist_size:
+            query = self.vector(playlist[-1])
+            k = SEARCH_K
+            song = None
+            while song is None:
+                k = min(k, n_total)
+                _, names, rows = self.search(query, k, genres)
+                song = next(((g, int(r)) for g, r in zip(names[0], rows[0])
+                             if r != -1 and (g, int(r)) not in used), None)
+                if k >= n_total:
+                    break
+                k *= 2
+            if song is None:
+                logging.warning(f"No unused neighbours left after {len(playlist)} songs, returning a shorter playlist")
+                break
+            playlist.append(song)
+            used.add(song)
+        return playlist
+
+    def locate(self, track_id):
+        """Return the (genre, row) of a Spotify track id, searching the shards in order."""
+        for genre, indexer in self.shards.items():
+            row = indexer.track_rows.get(track_id)
+            if row is not None:
+                return genre, row
+        raise KeyError(track_id)
+
+    def _gather(self, playlist, column):
+        values = [None] * len(playlist)
+        for genre in {g for g, _ in playlist}:
+            positions = [i for i, (g, _) in enumerate(playlist) if g == genre]
+            rows = np.array([playlist[i][1] for i in positions], dtype=np.int64)
+            for i, value in zip(positions, self.shards[genre].song_columns[column][rows]):
+                values[i] = value
+        return values
+
+    def get_track_ids(self, playlist):
+        """Spotify track ids of (genre, row) songs."""
+        return self._gather(playlist, 0)
+
+    def get_song_names(self, playlist):
+        """Song names of (genre, row) songs."""
+        return self._gather(playlist, 1)
+
+    def close(self):
+        """Stop the search threads."""
+        self._executor.shutdown()
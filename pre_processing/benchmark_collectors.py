@@ -0,0 +1,128 @@
+import argparse
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+import types
+
+try:
+    import keys  # noqa: F401
+except ImportError:
+    # The stand-in server accepts any credentials, so the collectors can be benchmarked without keys.py
+    sys.modules['keys'] = types.SimpleNamespace(client_id='standin', client_secret='standin',
+                                                genius_access_token='standin')
+
+import spotipy
+import lyrics_collector
+import spotify_data_collector as collector
+from lyrics_cache import LyricsCache
+from rate_limiter import RateLimiter
+from standin_api import StandinAPIServer
+
+SEQUENTIAL_WORKERS = {'search': 1, 'audio_features': 1, 'metadata': 1, 'lyrics': 1}
+
+
+def use_standin(server, spotify_rate, genius_rate, cache_path):
+    """
+    Point the collectors at a stand-in server instead of the real APIs.
+
+    Subjects are not extracted inline, so the benchmark measures ingestion without spaCy.
+
+    Args:
+        server (StandinAPIServer): The running stand-in server
+        spotify_rate (float): Spotify requests per second allowed by the rate limiter
+        genius_rate (float): Genius requests per second allowed by the rate limiter
+        cache_path (str): Lyrics cache file to use
+    """
+    collector.sp = spotipy.Spotify(auth='standin', requests_timeout=10,
+                                   requests_session=lyrics_collector.create_session(32))
+    collector.sp.prefix = f'{server.url}/v1/'
+    collector.spotify_limiter = RateLimiter('Spotify', rate=spotify_rate, burst=20)
+    collector.genius_limiter = lyrics_collector.genius_limiter = RateLimiter(
+        'Genius', rate=genius_rate, burst=lyrics_collector.DEFAULT_CONCURRENCY)
+    collector.INLINE_SUBJECTS = False
+    collector._artist_genres.clear()
+    lyrics_collector.GENIUS_BASE_URL = server.url
+    lyrics_collector._shared_cache = LyricsCache(cache_path)
+
+
+def benchmark_collection(server, n_tracks, workers=None, spotify_rate=1000, genius_rate=1000):
+    """
+    Collect a genre from the stand-in server and measure the end-to-end throughput.
+
+    Every run starts from an empty output, checkpoint and lyrics cache in a temporary directory.
+
+    Args:
+        server (StandinAPIServer): The running stand-in server
+        n_tracks (int): Number of tracks to collect
+        workers (dict): Worker count per pipeline stage, defaults to PIPELINE_WORKERS
+        spotify_rate (float): Spotify requests per second allowed by the rate limiter
+        genius_rate (float): Genius requests per second allowed by the rate limiter
+
+    Returns:
+        dict: Songs processed and written, elapsed seconds, songs per second, pipeline
+            statistics and the request counters of both rate limiters
+    """
+    n_queries = math.ceil(n_tracks / min(server.catalog_size, 1000))
+    subgenres = [f'standin{i}' for i in range(n_queries)]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, 'data'))
+        use_standin(server, spotify_rate, genius_rate, os.path.join(directory, 'lyrics_cache.sqlite'))
+        collector.GENRE_MAP = {'standin': subgenres}
+        os.chdir(directory)
+        try:
+            start = time.perf_counter()
+            stats = collector.process_genre_songs('standin', max_tracks=math.ceil(n_tracks / n_queries),
+                                                  resume=False, workers=workers)
+            elapsed = time.perf_counter() - start
+            with open('data/standin_songs_features.csv', encoding='utf-8') as f:
+                n_written = sum(1 for _ in f) - 1
+        finally:
+            os.chdir(cwd)
+            lyrics_collector._shared_cache.close()
+            lyrics_collector._shared_cache = None
+
+    n_songs = stats['stages']['writer']['items_in']
+    return {
+        'songs': n_songs,
+        'written': n_written,
+        'elapsed': elapsed,
+        'songs_per_second': n_songs / elapsed,
+        'pipeline': stats,
+        'spotify': collector.spotify_limiter.stats(),
+        'genius': collector.genius_limiter.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Songs/second benchmark of the collectors against a local stand-in API")
+    parser.add_argument('--tracks', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per request")
+    parser.add_argument('--error-rate', type=float, default=0.01, help="Fraction of requests answered with a 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.01, help="Fraction of requests answered with a 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds of a 429")
+    parser.add_argument('--spotify-rate', type=float, default=1000, help="Spotify requests per second allowed")
+    parser.add_argument('--genius-rate', type=float, default=1000, help="Genius requests per second allowed")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    # spotipy logs every injected error response itself
+    logging.getLogger('spotipy').setLevel(logging.CRITICAL)
+    server = StandinAPIServer(latency=args.latency, error_rate=args.error_rate,
+                              throttle_rate=args.throttle_rate, retry_after=args.retry_after).start()
+    try:
+        for name, workers in (('sequential', SEQUENTIAL_WORKERS), ('pipelined', None)):
+            result = benchmark_collection(server, args.tracks, workers, args.spotify_rate, args.genius_rate)
+            print(f"{name:10s} {result['songs']:6d} songs ({result['written']} written) "
+                  f"in {result['elapsed']:7.2f} s: {result['songs_per_second']:8.1f} songs/s")
+            for api in ('spotify', 'genius'):
+                print(f"           {api:8s} {result[api]}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import time
+import logging
+from collections import defaultdict
+from constants import SUBJECTS
+from lyrics_cache import LyricsCache
+from subject_extraction import get_nlp, score_subjects, RELEVANT_POS
+
+
+def score_subjects_reference(lyrics, subject_list):
+    """Per-token, per-subject scoring loop that score_subjects replaces, kept as the reference."""
+    nlp = get_nlp()
+    doc = nlp(lyrics.lower())
+    subject_docs = [nlp(subject.lower()) for subject in subject_list]
+
+    subject_scores = defaultdict(float)
+    meaningful_words = [token for token in doc
+                        if token.pos_ in RELEVANT_POS
+                        and not token.is_stop
+                        and token.has_vector]
+
+    for word in meaningful_words:
+        for subject_doc, subject in zip(subject_docs, subject_list):
+            subject_tokens = [token for token in subject_doc if token.has_vector]
+            if subject_tokens:
+                similarity = max(word.similarity(subject_token)
+                                 for subject_token in subject_tokens)
+                subject_scores[subject] += similarity
+
+    for subject in subject_scores:
+        subject_scores[subject] /= len(meaningful_words) if meaningful_words else 1
+    return dict(subject_scores)
+
+
+def benchmark_subject_scoring(corpus, subject_list=SUBJECTS):
+    """
+    Time the reference loop against the vectorized scoring over a corpus of lyrics.
+
+    Args:
+        corpus (list): Lyrics to score
+        subject_list (list): List of predefined subjects to match against
+
+    Returns:
+        dict: Timings, speedup, largest absolute score difference and number of equal top subjects
+    """
+    # Build the subject matrix outside the timed section, as it is computed once per process
+    score_subjects(subject_list[0], subject_list)
+
+    start = time.perf_counter()
+    reference = [score_subjects_reference(lyrics, subject_list) for lyrics in corpus]
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = [score_subjects(lyrics, subject_list) for lyrics in corpus]
+    vectorized_time = time.perf_counter() - start
+
+    max_difference = 0.0
+    same_subject = 0
+    for expected, actual in zip(reference, vectorized):
+        if expected:
+            max_difference = max(max_difference, max(abs(expected[s] - actual[s]) for s in expected))
+            same_subject += max(expected, key=expected.get) == max(actual, key=actual.get)
+        else:
+            same_subject += not actual
+
+    return {
+        'reference_time': reference_time,
+        'vectorized_time': vectorized_time,
+        'speedup': reference_time / vectorized_time,
+        'max_difference': max_difference,
+        'same_subject': same_subject,
+    }
+
+
+def main():
+    """Benchmark subject scoring over the lyrics in the lyrics cache."""
+    logging.getLogger().setLevel(logging.WARNING)
+    cache = LyricsCache()
+    corpus = [lyrics for _, lyrics in cache.iter_lyrics() if lyrics][:500]
+    if not corpus:
+        print("The lyrics cache is empty, run the collectors first.")
+        return
+
+    result = benchmark_subject_scoring(corpus)
+    print(f"Songs: {len(corpus)}")
+    print(f"Reference loop: {result['reference_time']:.2f} s")
+    print(f"Vectorized:     {result['vectorized_time']:.2f} s")
+    print(f"Speedup:        {result['speedup']:.1f}x")
+    print(f"Max score difference: {result['max_difference']:.2e}")
+    print(f"Same top subject: {result['same_subject']}/{len(corpus)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import csv
+import os
+import sqlite3
+import threading
+
+
+def checkpoint_path(output_file):
+    """Return the checkpoint file that belongs to a collector output CSV."""
+    return os.path.splitext(output_file)[0] + '.checkpoint.sqlite'
+
+
+def read_written_keys(output_file, key_columns):
+    """
+    Read the keys of the rows already written to a collector output CSV.
+
+    Args:
+        output_file (str): The output CSV, may not exist yet
+        key_columns (list): Columns whose values, joined, identify a row
+
+    Returns:
+        set: The keys of the complete rows in the file
+    """
+    if not os.path.exists(output_file):
+        return set()
+    with open(output_file, newline='', encoding='utf-8') as file:
+        reader = csv.DictReader(file)
+        if reader.fieldnames is None:
+            return set()
+        # A row cut short by a crash lacks its trailing columns and is written again
+        return {row_key(*(row[c] for c in key_columns)) for row in reader
+                if row.get(reader.fieldnames[-1]) is not None}
+
+
+def row_key(*parts):
+    """Join the parts identifying an output row into a single checkpoint key."""
+    return '\x1f'.join(parts)
+
+
+class IngestionCheckpoint:
+    """
+    On-disk SQLite record of the progress of one collector run.
+
+    It keeps the track IDs returned by every search page, so a rerun resumes each query
+    at its next offset without repeating searches, and the keys of the tracks that are
+    done (written, or skipped for lack of lyrics), so a rerun does not fetch them again.
+    """
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS searches (
+                query TEXT PRIMARY KEY,
+                next_offset INTEGER NOT NULL,
+                finished INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_results (
+                query TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                track_id TEXT NOT NULL,
+                PRIMARY KEY (query, position)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS done (
+                key TEXT PRIMARY KEY,
+                written INTEGER NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def search_progress(self, query):
+        """
+        Look up how far a search query got.
+
+        Returns:
+            tuple: (track_ids, next_offset, finished) for the query, ([], 0, False) if it never ran
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT next_offset, finished FROM searches WHERE query = ?', (query,)
+            ).fetchone()
+            track_ids = [track_id for track_id, in self._conn.execute(
+                'SELECT track_id FROM search_results WHERE query = ? ORDER BY position', (query,)
+            )]
+        if row is None:
+            return [], 0, False
+        return track_ids, row[0], bool(row[1])
+
+    def record_search_page(self, query, track_ids, next_offset, finished=False):
+        """
+        Store the track IDs of one search page together with the offset of the next page.
+
+        Args:
+            query (str): The search query
+            track_ids (list): Track IDs of the page
+            next_offset (int): Offset the next page of the query starts at
+            finished (bool): Whether the query has no further pages to fetch
+        """
+        with self._lock:
+            start = self._conn.execute(
+                'SELECT COUNT(*) FROM search_results WHERE query = ?', (query,)
+            ).fetchone()[0]
+            self._conn.executemany(
+                'INSERT INTO search_results VALUES (?, ?, ?)',
+                [(query, start + i, track_id) for i, track_id in enumerate(track_ids)]
+            )
+            self._conn.execute('INSERT OR REPLACE INTO searches VALUES (?, ?, ?)',
+                               (query, next_offset, int(finished)))
+            self._conn.commit()
+
+    def done_keys(self):
+        """Return the keys of every track that is done."""
+        with self._lock:
+            return {key for key, in self._conn.execute('SELECT key FROM done')}
+
+    def mark_done(self, keys, written=True):
+        """
+        Record tracks as done.
+
+        Args:
+            keys (list): Keys of the tracks, see row_key
+            written (bool): Whether the tracks were written to the output, or skipped
+        """
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO done VALUES (?, ?)',
+                                   [(key, int(written)) for key in keys])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
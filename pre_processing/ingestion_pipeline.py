@@ -0,0 +1,182 @@
+import logging
+import queue
+import threading
+import time
+
+DEFAULT_QUEUE_SIZE = 1000
+REPORT_INTERVAL = 30  # seconds between progress reports
+BATCH_LINGER = 0.2  # seconds a batching worker waits for its batch to fill up
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a Pipeline.
+
+    Args:
+        name (str): Name used in the progress reports
+        func (callable): Called with one input item, or with a list of up to batch_size
+            items if batch_size is set, and returns an iterable of output items (or None)
+        workers (int): Number of threads running func
+        batch_size (int): If set, func receives lists of items instead of single items
+    """
+
+    def __init__(self, name, func, workers=1, batch_size=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items_in, items_out, busy_time, failed=False):
+        with self._lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy_time += busy_time
+            self.errors += failed
+
+
+class Pipeline:
+    """
+    Run items through a chain of stages, each with its own worker threads.
+
+    Stages are connected by bounded queues, so every stage works on its own items while
+    the others wait on the network, and a slow stage holds the stages before it back
+    instead of letting its input pile up in memory. The output items of the last stage
+    are discarded. An item, or batch, whose stage function raises is logged and dropped.
+    """
+
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE, report_interval=REPORT_INTERVAL):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.report_interval = report_interval
+        self._remaining_workers = [stage.workers for stage in stages]
+        self._lock = threading.Lock()
+        self._start_time = None
+
+    def run(self, source):
+        """
+        Feed the items of source into the first stage and wait until every stage is done.
+
+        Args:
+            source (iterable): Input items of the first stage
+
+        Returns:
+            dict: Per stage statistics, see stats
+        """
+        self._start_time = time.perf_counter()
+        threads = [threading.Thread(target=self._feed, args=(source,), daemon=True)]
+        for position, stage in enumerate(self.stages):
+            threads += [threading.Thread(target=self._work, args=(position,), daemon=True,
+                                         name=f'{stage.name}-{i}')
+                        for i in range(stage.workers)]
+        for thread in threads:
+            thread.start()
+
+        stop = threading.Event()
+        reporter = threading.Thread(target=self._report_until, args=(stop,), daemon=True)
+        reporter.start()
+        for thread in threads:
+            thread.join()
+        stop.set()
+        reporter.join()
+
+        stats = self.stats()
+        logging.info(f"Pipeline finished in {stats['elapsed']:.1f} s: {self.format_stats(stats)}")
+        return stats
+
+    def _feed(self, source):
+        try:
+            for item in source:
+                self.queues[0].put(item)
+        except Exception as e:
+            logging.error(f"Error reading pipeline input: {e}")
+        finally:
+            for _ in range(self.stages[0].workers):
+                self.queues[0].put(_DONE)
+
+    def _work(self, position):
+        stage = self.stages[position]
+        inbox = self.queues[position]
+        outbox = self.queues[position + 1] if position + 1 < len(self.stages) else None
+
+        finished = False
+        while not finished:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            if stage.batch_size:
+                item = [item]
+                deadline = time.monotonic() + BATCH_LINGER
+                while len(item) < stage.batch_size:
+                    try:
+                        extra = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if extra is _DONE:
+                        finished = True
+                        break
+                    item.append(extra)
+
+            start = time.perf_counter()
+            n_out = 0
+            failed = False
+            try:
+                for output in stage.func(item) or ():
+                    if outbox is not None:
+                        outbox.put(output)
+                    n_out += 1
+            except Exception as e:
+                logging.error(f"Error in pipeline stage {stage.name}: {e}")
+                failed = True
+            stage.record(len(item) if stage.batch_size else 1, n_out, time.perf_counter() - start, failed)
+
+        with self._lock:
+            self._remaining_workers[position] -= 1
+            last = self._remaining_workers[position] == 0
+        if last and outbox is not None:
+            for _ in range(self.stages[position + 1].workers):
+                outbox.put(_DONE)
+
+    def _report_until(self, stop):
+        while not stop.wait(self.report_interval):
+            logging.info(f"Pipeline progress: {self.format_stats(self.stats())}")
+
+    def stats(self):
+        """
+        Return the statistics of every stage so far.
+
+        Returns:
+            dict: 'elapsed' seconds and, under 'stages', per stage name the items in and
+                out, errors, busy seconds, throughput (items in per second) and the
+                current depth of its input queue
+        """
+        elapsed = time.perf_counter() - self._start_time if self._start_time else 0.0
+        return {
+            'elapsed': elapsed,
+            'stages': {
+                stage.name: {
+                    'items_in': stage.items_in,
+                    'items_out': stage.items_out,
+                    'errors': stage.errors,
+                    'busy_time': stage.busy_time,
+                    'throughput': stage.items_in / elapsed if elapsed else 0.0,
+                    'queue_depth': inbox.qsize(),
+                }
+                for stage, inbox in zip(self.stages, self.queues)
+            },
+        }
+
+    @staticmethod
+    def format_stats(stats):
+        """Format stats as one line per stage for the log."""
+        return ''.join(
+            f"\n  {name:15s} in {s['items_in']:8d}  out {s['items_out']:8d}  "
+            f"{s['throughput']:8.1f}/s  queued {s['queue_depth']:5d}  errors {s['errors']}"
+            for name, s in stats['stages'].items()
+        )
@@ -0,0 +1,143 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = 'data/lyrics_cache.sqlite'
+MISS_TTL = 7 * 24 * 3600  # seconds before a song without lyrics is looked up again
+
+
+def normalize_key(song_title, artist_name):
+    """Build the cache key of a song from its case-folded, whitespace-collapsed title and artist."""
+    def normalize(text):
+        return re.sub(r'\s+', ' ', (text or '').casefold()).strip()
+    return f"{normalize(song_title)}\x1f{normalize(artist_name)}"
+
+
+class LyricsCache:
+    """
+    On-disk SQLite cache of Genius results keyed by normalized (title, artist).
+
+    Hits keep the raw lyrics next to the language, release date and computed subject,
+    so subjects can be recomputed without refetching. The subject list a subject was
+    computed with is stored alongside it. Misses (no lyrics found) are stored too and
+    expire after miss_ttl seconds.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, miss_ttl=MISS_TTL):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.miss_ttl = miss_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS lyrics (
+                key TEXT PRIMARY KEY,
+                title TEXT,
+                artist TEXT,
+                found INTEGER NOT NULL,
+                lyrics TEXT,
+                language TEXT,
+                release_date TEXT,
+                subject TEXT,
+                subject_list TEXT,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, song_title, artist_name):
+        """
+        Look up a song.
+
+        Returns:
+            dict: The cached entry with a 'found' flag, or None if the song is not
+                cached or its miss has expired
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT found, lyrics, language, release_date, subject, subject_list, fetched_at '
+                'FROM lyrics WHERE key = ?',
+                (normalize_key(song_title, artist_name),)
+            ).fetchone()
+        if row is None:
+            return None
+        found, lyrics, language, release_date, subject, subject_list, fetched_at = row
+        if not found and time.time() - fetched_at > self.miss_ttl:
+            return None
+        return {
+            'found': bool(found),
+            'lyrics': lyrics,
+            'language': language,
+            'release_date': release_date,
+            'subject': subject,
+            'subject_list': subject_list.split(',') if subject_list is not None else None,
+        }
+
+    def put_hit(self, song_title, artist_name, lyrics, language, release_date, subject, subject_list):
+        """Store the Genius data of a song whose lyrics were found."""
+        self._put(song_title, artist_name, True, lyrics, language, release_date, subject, subject_list)
+
+    def put_miss(self, song_title, artist_name):
+        """Store that no lyrics were found for a song."""
+        self._put(song_title, artist_name, False, None, None, None, None, None)
+
+    def _put(self, song_title, artist_name, found, lyrics, language, release_date, subject, subject_list):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO lyrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (normalize_key(song_title, artist_name), song_title, artist_name, int(found),
+                 lyrics, language, release_date, subject,
+                 ','.join(subject_list) if subject_list is not None else None, time.time())
+            )
+            self._conn.commit()
+
+    def iter_lyrics(self, batch_size=1000, stale_for=None):
+        """
+        Yield (key, lyrics) for every cached hit.
+
+        Args:
+            batch_size (int): Number of rows read from the database at a time
+            stale_for (list): If given, only yield hits whose subject was not computed
+                with this subject list
+        """
+        last_key = ''
+        joined = ','.join(stale_for) if stale_for is not None else None
+        while True:
+            with self._lock:
+                if joined is None:
+                    rows = self._conn.execute(
+                        'SELECT key, lyrics FROM lyrics WHERE found = 1 AND key > ? ORDER BY key LIMIT ?',
+                        (last_key, batch_size)
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        'SELECT key, lyrics FROM lyrics WHERE found = 1 AND key > ? '
+                        'AND (subject_list IS NULL OR subject_list != ?) ORDER BY key LIMIT ?',
+                        (last_key, joined, batch_size)
+                    ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_key = rows[-1][0]
+
+    def set_subjects(self, subjects, subject_list):
+        """
+        Overwrite the stored subject of cached hits.
+
+        Args:
+            subjects (list): (key, subject) pairs
+            subject_list (list): Subject list the subjects were computed with
+        """
+        joined = ','.join(subject_list)
+        with self._lock:
+            self._conn.executemany('UPDATE lyrics SET subject = ?, subject_list = ? WHERE key = ?',
+                                   [(subject, joined, key) for key, subject in subjects])
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,33 +1,82 @@
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 import re
 from bs4 import BeautifulSoup
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from keys import genius_access_token
-import spacy
-from collections import defaultdict
 from constants import SUBJECTS
+from lyrics_cache import LyricsCache
+from rate_limiter import RateLimiter
+from subject_extraction import extract_subject_with_spacy
 
-# Load spaCy model at module level (only happens once)
-try:
-    nlp = spacy.load('en_core_web_md')  # Medium-sized model with word vectors
-except OSError:
-    # If model isn't installed, provide instructions
-    raise OSError("Please install the spaCy model by running: python -m spacy download en_core_web_md")
+GENIUS_BASE_URL = 'https://api.genius.com'
+REQUEST_TIMEOUT = 10  # seconds
+DEFAULT_CONCURRENCY = 8
 
-def get_lyrics_genius(song_title, artist_name, subject_list=SUBJECTS):
+# Shared by every thread calling Genius, for both the API and the lyrics pages
+GENIUS_RATE = 5  # requests per second
+genius_limiter = RateLimiter('Genius', rate=GENIUS_RATE, burst=DEFAULT_CONCURRENCY)
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+_shared_cache = None
+
+def create_session(pool_size=DEFAULT_CONCURRENCY):
     """
-    Get language, release date, and subject using Genius API and web scraping
+    Create an HTTP session whose keep-alive connection pool fits pool_size concurrent workers.
+    
+    Args:
+        pool_size (int): Maximum number of pooled connections per host
+        
+    Returns:
+        requests.Session: The pooled session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_shared_session():
+    """Return the module-wide pooled session, creating it on first use."""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+def genius_get(session, url, **kwargs):
+    """
+    GET a Genius URL through genius_limiter, raising on error statuses.
+    
+    Returns:
+        requests.Response: The successful response
+    """
+    def get():
+        response = session.get(url, timeout=REQUEST_TIMEOUT, **kwargs)
+        response.raise_for_status()
+        return response
+    return genius_limiter.call(get)
+
+def fetch_genius_lyrics(song_title, artist_name, session):
+    """
+    Fetch the lyrics, language and release date of a song from Genius.
     
     Args:
         song_title (str): The song title
         artist_name (str): The artist name
-        subject_list (list): List of predefined subjects to match against
+        session (requests.Session): Session used for the HTTP calls
         
     Returns:
-        tuple: (language, release_date, subject) or (None, None, None) if not found
+        tuple: (lyrics, language, release_date) or None if no lyrics were found
+        
+    Raises:
+        Exception: On network or response errors, so they are not mistaken for a miss
     """
-    base_url = 'https://api.genius.com'
+    base_url = GENIUS_BASE_URL
     headers = {'Authorization': f'Bearer {genius_access_token}'}
     search_url = f"{base_url}/search"
     
@@ -35,85 +84,128 @@ def get_lyrics_genius(song_title, artist_name, subject_list=SUBJECTS):
         'q': f"{song_title} {artist_name}"
     }
     
-    try:
-        response = requests.get(search_url, headers=headers, params=params)
-        json_data = response.json()
-        
-        for hit in json_data['response']['hits']:
-            if artist_name.lower() in hit['result']['primary_artist']['name'].lower():
-                song_url = hit['result']['url']
-                
-                # Get song details to extract language and release date
-                song_api_path = hit['result']['api_path']
-                song_response = requests.get(f"{base_url}{song_api_path}", headers=headers)
-                song_data = song_response.json()
-                language = song_data['response']['song'].get('language', 'unknown')
-                release_date = song_data['response']['song'].get('release_date', 'unknown')
-                
-                # Get lyrics from webpage
-                page = requests.get(song_url)
-                soup = BeautifulSoup(page.content, 'html.parser')
-                
-                lyrics_containers = soup.select('div[class*="Lyrics__Container"]')
-                if lyrics_containers:
-                    lyrics = '\n'.join([container.get_text() for container in lyrics_containers])
-                    lyrics = re.sub(r'[\(\[].*?[\)\]]', '', lyrics)
-                    lyrics = os.linesep.join([s for s in lyrics.splitlines() if s.strip()])
-                    
-                    # Extract subject using spaCy if subject_list is provided
-                    subject = None
-                    if subject_list and lyrics:
-                        subject = extract_subject_with_spacy(lyrics, subject_list)
-                    
-                    return language, release_date, subject
-                
-        return None, None, None
-        
-    except Exception as e:
-        logging.error(f"Error fetching lyrics: {e}")
-        return None, None, None
+    response = genius_get(session, search_url, headers=headers, params=params)
+    json_data = response.json()
+    
+    for hit in json_data['response']['hits']:
+        if artist_name.lower() in hit['result']['primary_artist']['name'].lower():
+            song_url = hit['result']['url']
+            
+            # Get song details to extract language and release date
+            song_api_path = hit['result']['api_path']
+            song_response = genius_get(session, f"{base_url}{song_api_path}", headers=headers)
+            song_data = song_response.json()
+            language = song_data['response']['song'].get('language', 'unknown')
+            release_date = song_data['response']['song'].get('release_date', 'unknown')
+            
+            # Get lyrics from webpage
+            page = genius_get(session, song_url)
+            soup = BeautifulSoup(page.content, 'html.parser')
+            
+            lyrics_containers = soup.select('div[class*="Lyrics__Container"]')
+            if lyrics_containers:
+                lyrics = '\n'.join([container.get_text() for container in lyrics_containers])
+                lyrics = re.sub(r'[\(\[].*?[\)\]]', '', lyrics)
+                lyrics = os.linesep.join([s for s in lyrics.splitlines() if s.strip()])
+                return lyrics, language, release_date
+            
+    return None
 
-def extract_subject_with_spacy(lyrics, subject_list):
-    """
-    Extract the most relevant subject from lyrics using spaCy's word vectors
+def get_shared_cache():
+    """Return the module-wide lyrics cache, opening it on first use."""
+    global _shared_cache
+    with _shared_session_lock:
+        if _shared_cache is None:
+            _shared_cache = LyricsCache()
+        return _shared_cache
+
+def has_lyrics(song_title, artist_name, cache=None):
+    """Return whether lyrics of a song were found and cached by get_lyrics_genius."""
+    entry = (cache or get_shared_cache()).get(song_title, artist_name)
+    return bool(entry and entry['found'])
+
+def is_cached(song_title, artist_name, cache=None):
+    """Return whether get_lyrics_genius cached a result for a song, lyrics or a genuine miss."""
+    return (cache or get_shared_cache()).get(song_title, artist_name) is not None
+
+def get_lyrics_genius(song_title, artist_name, subject_list=SUBJECTS, session=None, cache=None):
     """
-    doc = nlp(lyrics.lower())
-    
-    # Create spaCy docs for subjects
-    subject_docs = [nlp(subject.lower()) for subject in subject_list]
+    Get language, release date, and subject using Genius API and web scraping
     
-    subject_scores = defaultdict(float)
-    relevant_pos = {'NOUN', 'VERB', 'ADJ', 'PROPN'}
+    Results, including songs without lyrics, are served from the lyrics cache when
+    available. A cached subject computed with another subject list is recomputed
+    from the cached lyrics without refetching.
     
-    # Only process words that have vectors
-    meaningful_words = [token for token in doc 
-                       if token.pos_ in relevant_pos 
-                       and not token.is_stop 
-                       and token.has_vector]
+    Args:
+        song_title (str): The song title
+        artist_name (str): The artist name
+        subject_list (list): List of predefined subjects to match against
+        session (requests.Session): Pooled session to use, defaults to the shared session
+        cache (LyricsCache): Cache to use, defaults to the shared cache
+        
+    Returns:
+        tuple: (language, release_date, subject) or (None, None, None) if not found
+    """
+    cache = cache or get_shared_cache()
+    cached = cache.get(song_title, artist_name)
+    if cached is not None:
+        if not cached['found']:
+            return None, None, None
+        subject = cached['subject']
+        if not subject_list:
+            subject = None
+        elif cached['subject_list'] != list(subject_list):
+            subject = extract_subject_with_spacy(cached['lyrics'], subject_list) if cached['lyrics'] else None
+            cache.put_hit(song_title, artist_name, cached['lyrics'], cached['language'],
+                          cached['release_date'], subject, subject_list)
+        return cached['language'], cached['release_date'], subject
     
-    # Calculate similarity scores
-    for word in meaningful_words:
-        for subject_doc, subject in zip(subject_docs, subject_list):
-            # Only consider subject tokens with vectors
-            subject_tokens = [token for token in subject_doc if token.has_vector]
-            if subject_tokens:  # Only proceed if we have valid tokens
-                similarity = max(word.similarity(subject_token) 
-                               for subject_token in subject_tokens)
-                subject_scores[subject] += similarity
+    try:
+        result = fetch_genius_lyrics(song_title, artist_name, session or get_shared_session())
+    except Exception as e:
+        logging.error(f"Error fetching lyrics: {e}")
+        return None, None, None
     
-    if not subject_scores:
-        return None
+    if result is None:
+        cache.put_miss(song_title, artist_name)
+        return None, None, None
     
-    # Normalize scores
-    for subject in subject_scores:
-        subject_scores[subject] /= len(meaningful_words) if meaningful_words else 1
+    lyrics, language, release_date = result
     
-    # Lower threshold since we're being more selective with words
-    best_subject, best_score = max(subject_scores.items(), key=lambda x: x[1])
-    threshold = 0.2  # Adjusted threshold
+    # Extract subject using spaCy if subject_list is provided
+    subject = None
+    if subject_list and lyrics:
+        subject = extract_subject_with_spacy(lyrics, subject_list)
     
-    return best_subject if best_score > threshold else None
+    cache.put_hit(song_title, artist_name, lyrics, language, release_date, subject,
+                  list(subject_list) if subject_list else None)
+    return language, release_date, subject
 
+def get_lyrics_genius_batch(songs, subject_list=SUBJECTS, max_workers=DEFAULT_CONCURRENCY, session=None, cache=None):
+    """
+    Fetch Genius data for many songs concurrently over one pooled session.
+    
+    Args:
+        songs (list): (song_title, artist_name) pairs
+        subject_list (list): List of predefined subjects to match against
+        max_workers (int): Maximum number of songs fetched at the same time
+        session (requests.Session): Pooled session to use, defaults to the shared session,
+            whose pool fits DEFAULT_CONCURRENCY workers. Pass a session from create_session
+            for more workers.
+        cache (LyricsCache): Cache to use, defaults to the shared cache
+        
+    Returns:
+        list: (language, release_date, subject) per song, in input order
+    """
+    songs = list(songs)
+    if not songs:
+        return []
+    session = session or get_shared_session()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda song: get_lyrics_genius(song[0], song[1], subject_list, session=session, cache=cache),
+            songs
+        ))
 
 if __name__ == "__main__":
 
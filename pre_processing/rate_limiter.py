@@ -0,0 +1,144 @@
+import logging
+import random
+import threading
+import time
+import requests
+
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+
+
+def http_status(error):
+    """Return the HTTP status of a spotipy or requests error, or None if it has none."""
+    status = getattr(error, 'http_status', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = error.response.status_code
+    return status
+
+
+def retry_after(error):
+    """Return the Retry-After of the response behind an error in seconds, or None."""
+    headers = getattr(error, 'headers', None)
+    if not headers and getattr(error, 'response', None) is not None:
+        headers = error.response.headers
+    try:
+        return float(headers['Retry-After'])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """
+    Decide how to handle a failed API call.
+
+    Returns:
+        str: 'throttled' for 429 responses, 'retryable' for server errors, timeouts and
+            connection errors, 'fatal' for everything else (bad requests, missing
+            resources, authentication errors, malformed responses)
+    """
+    status = http_status(error)
+    if status == 429:
+        return 'throttled'
+    if status in TRANSIENT_STATUSES:
+        return 'retryable'
+    if status is None and isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return 'retryable'
+    return 'fatal'
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread calling one API.
+
+    Calls are spaced to at most rate per second with bursts of up to burst calls. A 429
+    response pauses all callers for its Retry-After, other transient errors are retried
+    after a jittered exponential backoff, and fatal errors are raised right away.
+
+    Args:
+        name (str): API name used in the logs
+        rate (float): Sustained calls per second
+        burst (int): Calls that may be made at once after an idle period
+        max_retries (int): Retries of a call before its last error is raised
+        base_delay (float): Backoff of the first retry in seconds, doubled on every retry
+        max_delay (float): Upper bound of the backoff and of an honored Retry-After
+    """
+
+    def __init__(self, name, rate, burst=1, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'throttles': 0, 'retries': 0, 'failures': 0}
+
+    def acquire(self):
+        """Block until a call may be made, then take its token."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self._counters['requests'] += 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller for the given number of seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # The bucket refills from the end of the pause, not from its start
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+    def backoff(self, attempt):
+        """Return a full-jitter exponential backoff delay for a retry attempt (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func once a token is available, retrying throttled and transient failures.
+
+        Raises:
+            Exception: The error of the call if it is fatal or still failing after max_retries
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == 'fatal' or attempt >= self.max_retries:
+                    self._count('failures')
+                    raise
+                if kind == 'throttled':
+                    self._count('throttles')
+                    delay = retry_after(e)
+                    delay = self.backoff(attempt) if delay is None else min(delay, self.max_delay)
+                    logging.warning(f"{self.name} rate limit hit, pausing for {delay:.1f} s")
+                    self.pause(delay)
+                else:
+                    self._count('retries')
+                    delay = self.backoff(attempt)
+                    logging.warning(f"{self.name} call failed ({e}), retrying in {delay:.1f} s")
+                    time.sleep(delay)
+                attempt += 1
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self):
+        """Return the number of requests, throttles, retries and failures so far."""
+        with self._lock:
+            return dict(self._counters)
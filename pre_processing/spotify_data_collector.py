@@ -1,19 +1,57 @@
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
 import csv
-import time
+import os
+import threading
 import logging
 from keys import client_id, client_secret
 from constants import GENRE_MAP, SUBJECTS
-from lyrics_collector import get_lyrics_genius
+from lyrics_collector import (DEFAULT_CONCURRENCY, create_session, genius_limiter, get_lyrics_genius_batch,
+                              has_lyrics, is_cached)
+from ingestion_pipeline import Pipeline, Stage
+from rate_limiter import RateLimiter
+from ingestion_checkpoint import IngestionCheckpoint, checkpoint_path, read_written_keys, row_key
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Set up Spotify credentials
 client_credentials_manager = SpotifyClientCredentials(client_id=client_id, client_secret=client_secret)
-sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager, requests_timeout=10)
+# A plain pooled session, so throttling and retries are left to spotify_limiter instead of
+# spotipy's built-in urllib3 retries, which drop the Retry-After of 429 responses.
+# The pool leaves room for every pipeline worker thread.
+sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager, requests_timeout=10,
+                     requests_session=create_session(32))
 
+# Shared by every thread calling the Spotify API
+SPOTIFY_RATE = 10  # requests per second
+spotify_limiter = RateLimiter('Spotify', rate=SPOTIFY_RATE, burst=20)
+
+# Number of tracks whose lyrics are fetched concurrently before their rows are written
+LYRICS_BATCH_SIZE = 50
+
+# Extract subjects while collecting, with spaCy running in the lyrics threads. When False,
+# rows with lyrics are written without a subject and subject_extraction.py fills them in
+# afterwards from the lyrics cache.
+INLINE_SUBJECTS = False
+
+# Bytes read per step when looking for the last complete row of an output CSV
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# Maximum number of IDs the Spotify tracks and artists endpoints accept per request
+TRACKS_PER_REQUEST = 50
+ARTISTS_PER_REQUEST = 50
+
+# Worker threads per collection pipeline stage, the writer always runs on one thread
+PIPELINE_WORKERS = {
+    'search': 2,
+    'audio_features': 2,
+    'metadata': 2,
+    'lyrics': 2,
+}
+
+# First genre of every artist fetched so far, by artist ID
+_artist_genres = {}
 
 
 def get_audio_features(track_ids):
@@ -24,24 +62,60 @@ def get_audio_features(track_ids):
         track_ids (list): A list of track IDs.
         
     Returns:
-        list: A list of audio features.
+        list: The audio features in input order, None for tracks whose features could not be retrieved.
     """
     features = []
     for i in range(0, len(track_ids), 100):
-        retries = 3
-        while retries > 0:
-            try:
-                audio_features = sp.audio_features(track_ids[i:i+100])
-                features.extend(audio_features)
-                break
-            except Exception as e:
-                logging.error(f"Error retrieving audio features: {e}")
-                retries -= 1
-                time.sleep(5)
-        time.sleep(1)
+        chunk = track_ids[i:i+100]
+        try:
+            features.extend(spotify_limiter.call(sp.audio_features, chunk))
+        except Exception as e:
+            logging.error(f"Error retrieving audio features: {e}")
+            features.extend([None] * len(chunk))
     return features
 
-def search_tracks(query, limit, max_tracks):
+def iter_search_pages(query, limit, max_tracks, checkpoint=None):
+    """
+    Search for tracks on Spotify using a query string, page by page.
+
+    Args:
+        query (str): The query string to search for.
+        limit (int): The number of tracks to retrieve per page.
+        max_tracks (int): Maximum number of tracks to retrieve.
+        checkpoint (IngestionCheckpoint): If given, every page is recorded and a query
+            that ran before first yields the recorded track IDs, then continues from
+            its next offset.
+        
+    Yields:
+        list: The track IDs of a page.
+    """
+    track_ids, offset, finished = checkpoint.search_progress(query) if checkpoint else ([], 0, False)
+    n_tracks = len(track_ids)
+    if track_ids:
+        yield track_ids[:max_tracks]
+    genre_name = query.split(':')[1] if ':' in query else query
+    
+    while n_tracks < max_tracks and not finished:
+        try:
+            results = spotify_limiter.call(sp.search, q=query, type='track', limit=limit, offset=offset)
+        except Exception as e:
+            # Give up on the query for this run, a rerun retries it from the same offset
+            logging.error(f"Error searching tracks for {genre_name}: {e}")
+            return
+        page = [item['id'] for item in results['tracks']['items']]
+        offset += limit
+        finished = not page
+        if checkpoint:
+            checkpoint.record_search_page(query, page, offset, finished or offset >= 1000)
+        if page:
+            yield page[:max_tracks - n_tracks]
+            n_tracks += len(page)
+            logging.info(f"Collected {n_tracks} track IDs so far for {genre_name}.")
+        if offset >= 1000:
+            logging.info(f"Reached maximum offset limit of 1000 for {genre_name}. Moving to next query.")
+            return
+
+def search_tracks(query, limit, max_tracks, checkpoint=None):
     """
     Search for tracks on Spotify using a query string.
 
@@ -49,35 +123,13 @@ def search_tracks(query, limit, max_tracks):
         query (str): The query string to search for.
         limit (int): The number of tracks to retrieve.
         max_tracks (int): Maximum number of tracks to retrieve.
+        checkpoint (IngestionCheckpoint): If given, every page is recorded and a query
+            that ran before continues from its next offset.
         
     Returns:
         list: A list of track IDs.
     """
-    track_ids = []
-    offset = 0
-    genre_name = query.split(':')[1] if ':' in query else query
-    
-    while len(track_ids) < max_tracks:
-        retries = 3
-        while retries > 0:
-            try:
-                results = sp.search(q=query, type='track', limit=limit, offset=offset)
-                items = results['tracks']['items']
-                if not items:
-                    break
-                track_ids.extend([item['id'] for item in items])
-                offset += limit
-                logging.info(f"Collected {len(track_ids)} track IDs so far for {genre_name}.")
-                if offset >= 1000:
-                    logging.info(f"Reached maximum offset limit of 1000 for {genre_name}. Moving to next query.")
-                    break
-                break
-            except Exception as e:
-                logging.error(f"Error searching tracks for {genre_name}: {e}")
-                retries -= 1
-                time.sleep(5)
-        time.sleep(1)
-    return track_ids[:max_tracks]
+    return [track_id for page in iter_search_pages(query, limit, max_tracks, checkpoint) for track_id in page]
 
 def get_top_playlists(query, limit=10):
     """
@@ -90,18 +142,13 @@ def get_top_playlists(query, limit=10):
     Returns:
         list: A list of playlists.
     """
-    playlists = []
-    retries = 3
-    while retries > 0:
-        try:
-            results = sp.search(q=query, type='playlist', limit=limit)
-            playlists = results['playlists']['items']
-            logging.info(f"Retrieved {len(playlists)} playlists for query '{query}'.")
-            break
-        except Exception as e:
-            logging.error(f"Error retrieving playlists: {e}")
-            retries -= 1
-            time.sleep(5)
+    try:
+        results = spotify_limiter.call(sp.search, q=query, type='playlist', limit=limit)
+    except Exception as e:
+        logging.error(f"Error retrieving playlists: {e}")
+        return []
+    playlists = results['playlists']['items']
+    logging.info(f"Retrieved {len(playlists)} playlists for query '{query}'.")
     return playlists
 
 def get_tracks_from_playlist(playlist_id):
@@ -114,178 +161,327 @@ def get_tracks_from_playlist(playlist_id):
     Returns:
         list: A list of track IDs (max 30).
     """
-    track_ids = []
-    retries = 3
-    while retries > 0:
+    try:
+        results = spotify_limiter.call(sp.playlist_tracks, playlist_id, limit=30)
+    except Exception as e:
+        logging.error(f"Error retrieving tracks from playlist: {e}")
+        return []
+    track_ids = [item['track']['id'] for item in results['items'] if item['track'] is not None]
+    logging.info(f"Retrieved {len(track_ids)} tracks from playlist {playlist_id}.")
+    return track_ids[:30]
+
+def get_tracks(track_ids):
+    """
+    Retrieve track metadata for a list of track IDs from Spotify API.
+
+    Args:
+        track_ids (list): A list of track IDs.
+        
+    Returns:
+        list: The tracks in input order, None for tracks that could not be retrieved.
+    """
+    tracks = []
+    for i in range(0, len(track_ids), TRACKS_PER_REQUEST):
+        chunk = track_ids[i:i+TRACKS_PER_REQUEST]
         try:
-            results = sp.playlist_tracks(playlist_id, limit=30)
-            track_ids = [item['track']['id'] for item in results['items'] if item['track'] is not None]
-            logging.info(f"Retrieved {len(track_ids)} tracks from playlist {playlist_id}.")
-            break
+            tracks.extend(spotify_limiter.call(sp.tracks, chunk)['tracks'])
         except Exception as e:
-            logging.error(f"Error retrieving tracks from playlist: {e}")
-            retries -= 1
-            time.sleep(5)
-    return track_ids[:30]
+            logging.error(f"Error retrieving tracks: {e}")
+            tracks.extend([None] * len(chunk))
+    return tracks
+
+def get_artist_genres(artist_ids):
+    """
+    Retrieve the first genre of every artist in a list of artist IDs from Spotify API.
+
+    Artists are fetched in batches and remembered in _artist_genres, so every artist
+    is requested at most once per process.
+
+    Args:
+        artist_ids (list): A list of artist IDs, may contain duplicates.
+        
+    Returns:
+        dict: Genre by artist ID, 'unknown' for artists without genres or that could not be retrieved.
+    """
+    missing = list(dict.fromkeys(a for a in artist_ids if a not in _artist_genres))
+    for i in range(0, len(missing), ARTISTS_PER_REQUEST):
+        chunk = missing[i:i+ARTISTS_PER_REQUEST]
+        try:
+            artists = spotify_limiter.call(sp.artists, chunk)['artists']
+        except Exception as e:
+            logging.error(f"Error retrieving artists: {e}")
+            continue
+        for artist_id, artist in zip(chunk, artists):
+            _artist_genres[artist_id] = artist['genres'][0] if artist and artist['genres'] else 'unknown'
+    return {artist_id: _artist_genres.get(artist_id, 'unknown') for artist_id in artist_ids}
+
+def attach_lyrics(songs, session=None):
+    """
+    Fetch the Genius data of songs with track metadata concurrently.
+
+    Sets 'genius' to (language, release_date, subject), 'found' to whether the song
+    is written and 'settled' to whether it is done for good. Songs without lyrics (or,
+    with INLINE_SUBJECTS, without a subject) are not found. They are settled only when
+    their result is cached, not when the Genius request failed, so they are retried.
 
-def process_genre_songs(genre_key, max_tracks=100):
+    Args:
+        songs (list): Songs with a 'track'.
+        session (requests.Session): Pooled session for the Genius requests.
+        
+    Returns:
+        list: The songs.
+    """
+    pairs = [(song['track']['name'], song['track']['artists'][0]['name']) for song in songs]
+    lyrics = get_lyrics_genius_batch(pairs, SUBJECTS if INLINE_SUBJECTS else None, session=session)
+    for song, (title, artist), genius in zip(songs, pairs, lyrics):
+        song['genius'] = genius
+        song['found'] = genius[2] is not None if INLINE_SUBJECTS else has_lyrics(title, artist)
+        song['settled'] = song['found'] or is_cached(title, artist)
+    return songs
+
+def truncate_partial_row(output_file):
+    """Cut a row left half-written by a crash off the end of an output CSV."""
+    if not os.path.exists(output_file):
+        return
+    with open(output_file, 'rb+') as file:
+        end = file.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        file.seek(end - 1)
+        if file.read(1) == b'\n':
+            return
+        # Scan backwards block by block for the end of the last complete row
+        position = end
+        while position > 0:
+            start = max(0, position - TAIL_BLOCK_SIZE)
+            file.seek(start)
+            newline = file.read(position - start).rfind(b'\n')
+            if newline != -1:
+                file.truncate(start + newline + 1)
+                return
+            position = start
+        file.truncate(0)
+
+def open_output(output_file, header, key_columns, resume=True):
+    """
+    Open a collector output CSV for appending, together with its ingestion checkpoint.
+
+    Args:
+        output_file (str): The output CSV.
+        header (list): Column names, written when the file is new or empty.
+        key_columns (list): Columns identifying a row, used to find the rows already written.
+        resume (bool): Continue a previous run. When False the output and checkpoint are
+            started over.
+        
+    Returns:
+        tuple: (file, writer, checkpoint, done) where done holds the keys of the tracks
+            a previous run already wrote or skipped.
+    """
+    path = checkpoint_path(output_file)
+    if not resume:
+        for stale in (output_file, path, path + '-wal', path + '-shm'):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    truncate_partial_row(output_file)
+    checkpoint = IngestionCheckpoint(path)
+    # Rows written just before a crash may not have been checkpointed yet
+    done = checkpoint.done_keys() | read_written_keys(output_file, key_columns)
+
+    file = open(output_file, mode='a', newline='', encoding='utf-8')
+    writer = csv.writer(file)
+    if file.tell() == 0:
+        writer.writerow(header)
+    return file, writer, checkpoint, done
+
+def collection_stages(find_songs, output_file, header, key_columns, song_row,
+                      artist_genres=False, resume=True, workers=None):
+    """
+    Build the pipeline stages collecting songs into an output CSV.
+
+    The stages are search (find_songs), audio_features, metadata, lyrics and writer.
+    Songs are dicts carrying their checkpoint 'key' and Spotify 'id', which the stages
+    extend with 'features', 'track', 'genre', 'genius', 'found' and 'settled'. After
+    flushing its rows the writer marks the written and the settled songs as done in the
+    checkpoint, so a song dropped on the way or whose Genius request failed is retried
+    by the next run.
+
+    Args:
+        find_songs (callable): Called with a pipeline input item and the checkpoint,
+            returns the songs to collect.
+        output_file (str): The output CSV.
+        header (list): Column names of the output CSV.
+        key_columns (list): Columns identifying a row.
+        song_row (callable): Builds the CSV row of a found song.
+        artist_genres (bool): Set 'genre' from the first genre of the song's artist.
+        resume (bool): Continue a previous run instead of starting the output over.
+        workers (dict): Worker count per stage name, overriding PIPELINE_WORKERS.
+        
+    Returns:
+        tuple: (stages, checkpoint, file)
+    """
+    workers = {**PIPELINE_WORKERS, **(workers or {})}
+    file, writer, checkpoint, done = open_output(output_file, header, key_columns, resume)
+    seen = set(done)
+    seen_lock = threading.Lock()
+    session = create_session(workers['lyrics'] * DEFAULT_CONCURRENCY)
+
+    def search(item):
+        for song in find_songs(item, checkpoint):
+            with seen_lock:
+                if song['key'] in seen:
+                    continue
+                seen.add(song['key'])
+            yield song
+
+    def add_audio_features(songs):
+        for song, features in zip(songs, get_audio_features([song['id'] for song in songs])):
+            if features:
+                song['features'] = features
+                yield song
+
+    def add_metadata(songs):
+        fetched = [(song, track) for song, track in zip(songs, get_tracks([song['id'] for song in songs])) if track]
+        genres = get_artist_genres([track['artists'][0]['id'] for _, track in fetched]) if artist_genres else {}
+        for song, track in fetched:
+            song['track'] = track
+            if artist_genres:
+                song['genre'] = genres[track['artists'][0]['id']]
+            yield song
+
+    def write(songs):
+        for song in songs:
+            track = song['track']
+            if not song['found']:
+                logging.info(f"Skipping {track['name']} by {track['artists'][0]['name']} - No lyrics found")
+                continue
+            writer.writerow(song_row(song))
+            logging.info(f"Written to CSV: {track['name']} by {track['artists'][0]['name']}")
+        file.flush()
+        checkpoint.mark_done([song['key'] for song in songs if song['found']])
+        checkpoint.mark_done([song['key'] for song in songs if song['settled'] and not song['found']], written=False)
+
+    stages = [
+        Stage('search', search, workers['search']),
+        Stage('audio_features', add_audio_features, workers['audio_features'], batch_size=100),
+        Stage('metadata', add_metadata, workers['metadata'], batch_size=TRACKS_PER_REQUEST),
+        Stage('lyrics', lambda songs: attach_lyrics(songs, session), workers['lyrics'], batch_size=LYRICS_BATCH_SIZE),
+        Stage('writer', write, 1, batch_size=LYRICS_BATCH_SIZE),
+    ]
+    return stages, checkpoint, file
+
+def run_collection(source, stages, checkpoint, file):
+    """Run the collection stages over the pipeline input items, then close the output and checkpoint."""
+    try:
+        return Pipeline(stages).run(source)
+    finally:
+        file.close()
+        checkpoint.close()
+        for limiter in (spotify_limiter, genius_limiter):
+            logging.info(f"{limiter.name} API calls: {limiter.stats()}")
+
+def feature_values(features):
+    """Return the audio feature columns of an output row."""
+    return [features[name] for name in (
+        'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness', 'acousticness',
+        'instrumentalness', 'liveness', 'valence', 'tempo', 'duration_ms', 'time_signature'
+    )]
+
+def process_genre_songs(genre_key, max_tracks=100, resume=True, workers=None):
     """
     Process songs for a specific genre and its subgenres.
 
+    Searching, audio features, track metadata, lyrics and writing run as concurrent
+    pipeline stages. Progress is checkpointed next to the output CSV, so an interrupted
+    run picks up where it stopped: finished search pages are not repeated and tracks
+    already written or skipped are not fetched again.
+
     Args:
         genre_key (str): The key for the genre to process.
-        max_tracks (int): Maximum number of tracks to process for the genre.
+        max_tracks (int): Maximum number of tracks to process for each subgenre.
+        resume (bool): Continue a previous run instead of starting the output over.
+        workers (dict): Worker count per stage name, overriding PIPELINE_WORKERS.
+        
+    Returns:
+        dict: Pipeline statistics, see Pipeline.stats.
     """
     if genre_key not in GENRE_MAP:
         logging.error(f"Genre '{genre_key}' not found in GENRE_MAP")
         return
 
-    track_ids = []
-    for subgenre in GENRE_MAP[genre_key]:
-        query = f"genre:{subgenre}"
-        track_ids.extend(search_tracks(query, limit=50, max_tracks=max_tracks))
+    def find_songs(subgenre, checkpoint):
+        for page in iter_search_pages(f"genre:{subgenre}", limit=50, max_tracks=max_tracks, checkpoint=checkpoint):
+            for track_id in page:
+                yield {'key': row_key(track_id), 'id': track_id, 'genre': genre_key}
 
-    audio_features = get_audio_features(track_ids[:max_tracks*len(GENRE_MAP[genre_key])])
+    def song_row(song):
+        track, (language, release_date, subject) = song['track'], song['genius']
+        return ([song['id'], track['name'], track['artists'][0]['name'], song['genre']]
+                + feature_values(song['features'])
+                + [subject, language, release_date, track['popularity']])
 
-    output_file = f'data/{genre_key}_songs_features.csv'
-    with open(output_file, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow([
+    stages, checkpoint, file = collection_stages(
+        find_songs, f'data/{genre_key}_songs_features.csv', [
             'id', 'name', 'artist', 'genre', 'danceability', 'energy', 'key', 'loudness', 
             'mode', 'speechiness', 'acousticness', 'instrumentalness', 'liveness', 
             'valence', 'tempo', 'duration_ms', 'time_signature', 'subject', 'language', 
             'release_date', 'popularity'
-        ])
-        
-        for features in audio_features:
-            if features:
-                retries = 3
-                while retries > 0:
-                    try:
-                        track = sp.track(features['id'])
-                        language, release_date, subject = get_lyrics_genius(track['name'], track['artists'][0]['name'], SUBJECTS)
-                        
-                        # Skip if no lyrics found
-                        if subject is None:
-                            logging.info(f"Skipping {track['name']} by {track['artists'][0]['name']} - No lyrics found")
-                            break
-                        
-                        writer.writerow([
-                            features['id'],
-                            track['name'],
-                            track['artists'][0]['name'],
-                            genre_key,
-                            features['danceability'],
-                            features['energy'],
-                            features['key'],
-                            features['loudness'],
-                            features['mode'],
-                            features['speechiness'],
-                            features['acousticness'],
-                            features['instrumentalness'],
-                            features['liveness'],
-                            features['valence'],
-                            features['tempo'],
-                            features['duration_ms'],
-                            features['time_signature'],
-                            subject,
-                            language,
-                            release_date,
-                            track['popularity']
-                        ])
-                        logging.info(f"Written to CSV: {track['name']} by {track['artists'][0]['name']}")
-                        break
-                    except Exception as e:
-                        logging.error(f"Error writing to CSV: {e}")
-                        retries -= 1
-                        time.sleep(5)
-
-def process_playlists(playlist_type="top hits", limit=10):
+        ], ['id'], song_row, resume=resume, workers=workers)
+    return run_collection(GENRE_MAP[genre_key], stages, checkpoint, file)
+
+def process_playlists(playlist_type="top hits", limit=10, resume=True, workers=None):
     """
     Process top playlists, collecting audio features for their tracks.
 
+    The tracks of the playlists run through the same pipeline stages as in
+    process_genre_songs. Progress is checkpointed next to the output CSV, so an
+    interrupted run does not fetch tracks it already wrote or skipped again.
+
     Args:
         playlist_type (str): Type of playlist to process.
         limit (int): Number of playlists to process.
+        resume (bool): Continue a previous run instead of starting the output over.
+        workers (dict): Worker count per stage name, overriding PIPELINE_WORKERS.
+        
+    Returns:
+        dict: Pipeline statistics, see Pipeline.stats.
     """
     top_playlists = get_top_playlists(playlist_type, limit=limit)
-    
-    with open('data/playlist_songs_features.csv', mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow([
+
+    def find_songs(playlist, checkpoint):
+        for track_id in get_tracks_from_playlist(playlist['id']):
+            yield {'key': row_key(playlist['name'], track_id), 'id': track_id, 'playlist_name': playlist['name']}
+
+    def song_row(song):
+        track, (language, release_date, subject) = song['track'], song['genius']
+        return ([song['playlist_name'], song['id'], track['name'], track['artists'][0]['name'], song['genre']]
+                + feature_values(song['features'])
+                + [subject, language, release_date, track['popularity']])
+
+    stages, checkpoint, file = collection_stages(
+        find_songs, 'data/playlist_songs_features.csv', [
             'playlist_name', 'track_id', 'track_name', 'artist', 'genre', 'danceability', 
             'energy', 'key', 'loudness', 'mode', 'speechiness', 'acousticness', 
             'instrumentalness', 'liveness', 'valence', 'tempo', 'duration_ms', 
             'time_signature', 'subject', 'language', 'release_date', 'popularity'
-        ])
-        
-        for playlist in top_playlists:
-            playlist_name = playlist['name']
-            playlist_id = playlist['id']
-            track_ids = get_tracks_from_playlist(playlist_id)
-            audio_features = get_audio_features(track_ids)
-            
-            for features in audio_features:
-                if features:
-                    retries = 3
-                    while retries > 0:
-                        try:
-                            track = sp.track(features['id'])
-                            artist_id = track['artists'][0]['id']
-                            artist = sp.artist(artist_id)
-                            genres = artist['genres'][0] if artist['genres'] else 'unknown'
-                            language, release_date, subject = get_lyrics_genius(track['name'], track['artists'][0]['name'], SUBJECTS)
-                            
-                            # Skip if no lyrics found
-                            if subject is None:
-                                logging.info(f"Skipping {track['name']} by {track['artists'][0]['name']} - No subject found")
-                                break
-                            
-                            writer.writerow([
-                                playlist_name,
-                                features['id'],
-                                track['name'],
-                                track['artists'][0]['name'],
-                                genres,
-                                features['danceability'],
-                                features['energy'],
-                                features['key'],
-                                features['loudness'],
-                                features['mode'],
-                                features['speechiness'],
-                                features['acousticness'],
-                                features['instrumentalness'],
-                                features['liveness'],
-                                features['valence'],
-                                features['tempo'],
-                                features['duration_ms'],
-                                features['time_signature'],
-                                subject,
-                                language,
-                                release_date,
-                                track['popularity']
-                            ])
-                            logging.info(f"Written to CSV: {track['name']} by {track['artists'][0]['name']} ({genres}) from playlist {playlist_name}")
-                            break
-                        except Exception as e:
-                            logging.error(f"Error writing to CSV: {e}")
-                            retries -= 1
-                            time.sleep(5)
-
-def process_genre_list(genre_list=None, max_tracks=100):
+        ], ['playlist_name', 'track_id'], song_row, artist_genres=True, resume=resume, workers=workers)
+    return run_collection(top_playlists, stages, checkpoint, file)
+
+def process_genre_list(genre_list=None, max_tracks=100, resume=True):
     """
     Process songs for a list of genres.
 
     Args:
         genre_list (list): List of genres to process. If None, all genres in GENRE_MAP will be processed.
         max_tracks (int): Maximum number of tracks to process for each genre.
+        resume (bool): Continue previous runs instead of starting the outputs over.
     """
     if genre_list is None:
         genre_list = list(GENRE_MAP.keys())
     
     for genre in genre_list:
         logging.info(f"Processing {genre} songs...")
-        process_genre_songs(genre, max_tracks=max_tracks)
+        process_genre_songs(genre, max_tracks=max_tracks, resume=resume)
 
 def main():
     """
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FEATURE_NAMES = [
+    'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness', 'acousticness',
+    'instrumentalness', 'liveness', 'valence', 'tempo', 'duration_ms', 'time_signature'
+]
+
+
+def fake_id(*parts):
+    """Build a deterministic 22 character ID the length of a Spotify ID, made of hex digits."""
+    return hashlib.sha1(':'.join(map(str, parts)).encode()).hexdigest()[:22]
+
+
+class StandinAPIServer(ThreadingHTTPServer):
+    """
+    Local HTTP server imitating the Spotify and Genius endpoints the collectors use.
+
+    Spotify: /v1/search (tracks and playlists), /v1/audio-features, /v1/tracks, /v1/artists
+    and /v1/playlists/<id>/items (or /tracks). Genius: /search, /songs/<id> and the
+    /lyrics/<id> pages. Every response is generated from the requested IDs, so the same
+    request always returns the same data.
+
+    Args:
+        address (tuple): (host, port) to listen on, port 0 picks a free port
+        latency (float): Seconds every request takes before it is answered
+        error_rate (float): Fraction of requests answered with a 500
+        throttle_rate (float): Fraction of requests answered with a 429
+        retry_after (int): Retry-After seconds sent with a 429
+        lyrics_rate (float): Fraction of songs Genius has lyrics for
+        catalog_size (int): Number of tracks every search query matches
+        seed (int): Seed of the injected errors and throttles
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.05, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, lyrics_rate=0.8, catalog_size=1000, seed=0):
+        super().__init__(address, StandinRequestHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.lyrics_rate = lyrics_rate
+        self.catalog_size = catalog_size
+        self.requests = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Serve in a background thread and return the server."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def inject_fault(self, endpoint):
+        """Count a request and decide whether it fails: returns 429, 500 or None."""
+        with self._lock:
+            self.requests[endpoint] += 1
+            draw = self._random.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def search_tracks(self, query, limit, offset):
+        positions = range(offset, min(offset + limit, self.catalog_size))
+        return {'tracks': {'items': [{'id': fake_id('track', query, p)} for p in positions]}}
+
+    def search_playlists(self, query, limit):
+        return {'playlists': {'items': [
+            {'id': fake_id('playlist', query, i), 'name': f'{query} playlist {i}'} for i in range(limit)
+        ]}}
+
+    def playlist_items(self, playlist_id, limit):
+        return {'items': [{'track': {'id': fake_id('track', playlist_id, i)}} for i in range(limit)]}
+
+    @staticmethod
+    def audio_features(track_id):
+        draws = random.Random(track_id)
+        features = {name: draws.random() for name in FEATURE_NAMES}
+        features.update({
+            'id': track_id,
+            'key': draws.randrange(-1, 12),
+            'loudness': -60 * draws.random(),
+            'mode': draws.randrange(2),
+            'tempo': 60 + 140 * draws.random(),
+            'duration_ms': draws.randrange(90000, 400000),
+            'time_signature': draws.randrange(3, 8),
+        })
+        return features
+
+    @staticmethod
+    def track(track_id):
+        artist = int(track_id[:6], 16) % 500
+        return {
+            'id': track_id,
+            'name': f'Song {track_id[:8]}',
+            'artists': [{'id': fake_id('artist', artist), 'name': f'Artist {artist}'}],
+            'popularity': int(track_id[6:8], 16) % 101,
+        }
+
+    @staticmethod
+    def artist(artist_id):
+        return {'id': artist_id, 'genres': [f'genre {int(artist_id[:4], 16) % 20}']}
+
+    def genius_search(self, query):
+        match = re.match(r'^(?P<title>.*) (?P<artist>Artist \d+)$', query)
+        if match is None:
+            return {'response': {'hits': []}}
+        song_id = fake_id('genius', query)
+        if random.Random(song_id).random() >= self.lyrics_rate:
+            return {'response': {'hits': []}}
+        return {'response': {'hits': [{'result': {
+            'primary_artist': {'name': match['artist']},
+            'url': f'{self.url}/lyrics/{song_id}',
+            'api_path': f'/songs/{song_id}',
+        }}]}}
+
+    @staticmethod
+    def genius_song(song_id):
+        return {'response': {'song': {'language': 'en', 'release_date': f'{1960 + int(song_id[:4], 16) % 65}-01-01'}}}
+
+    @staticmethod
+    def lyrics_page(song_id):
+        words = random.Random(song_id).choices(
+            ['love', 'heart', 'night', 'dance', 'road', 'home', 'fire', 'dream', 'rain', 'time'], k=80)
+        lines = '<br/>'.join(' '.join(words[i:i + 8]) for i in range(0, len(words), 8))
+        return f'<html><body><div class="Lyrics__Container-sc-1">{lines}</div></body></html>'
+
+
+class StandinRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+        endpoint = re.sub(r'/[0-9a-f]{22}', '/<id>', path)
+
+        time.sleep(server.latency)
+        fault = server.inject_fault(endpoint)
+        if fault == 429:
+            return self._send(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                              {'Retry-After': str(server.retry_after)})
+        if fault == 500:
+            return self._send(500, {'error': {'status': 500, 'message': 'Server error'}})
+
+        ids = params['ids'].split(',') if params.get('ids') else []
+        limit = int(params.get('limit', 10))
+        if path == '/v1/search' and params.get('type') == 'playlist':
+            return self._send(200, server.search_playlists(params['q'], limit))
+        if path == '/v1/search':
+            return self._send(200, server.search_tracks(params['q'], limit, int(params.get('offset', 0))))
+        if path == '/v1/audio-features':
+            return self._send(200, {'audio_features': [server.audio_features(i) for i in ids]})
+        if path == '/v1/tracks':
+            return self._send(200, {'tracks': [server.track(i) for i in ids]})
+        if path == '/v1/artists':
+            return self._send(200, {'artists': [server.artist(i) for i in ids]})
+        match = re.fullmatch(r'/v1/playlists/(\w+)/(items|tracks)', path)
+        if match:
+            return self._send(200, server.playlist_items(match[1], limit))
+        if path == '/search':
+            return self._send(200, server.genius_search(params.get('q', '')))
+        match = re.fullmatch(r'/songs/(\w+)', path)
+        if match:
+            return self._send(200, server.genius_song(match[1]))
+        match = re.fullmatch(r'/lyrics/(\w+)', path)
+        if match:
+            return self._send(200, server.lyrics_page(match[1]), content_type='text/html')
+        return self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+    def _send(self, status, body, headers=None, content_type='application/json'):
+        payload = (body if isinstance(body, str) else json.dumps(body)).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,250 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import csv
+import glob
+import logging
+import threading
+import spacy
+import numpy as np
+from constants import SUBJECTS
+from lyrics_cache import LyricsCache
+from models.feature_store import FeatureStore
+
+RELEVANT_POS = {'NOUN', 'VERB', 'ADJ', 'PROPN'}
+SUBJECT_THRESHOLD = 0.2  # Adjusted threshold
+
+# Subject extraction only needs POS tags and word vectors
+EXCLUDED_COMPONENTS = ['parser', 'ner', 'lemmatizer']
+
+_nlp = None
+_nlp_lock = threading.Lock()
+# Precomputed subject vectors by subject list, see get_subject_matrix
+_subject_matrices = {}
+
+
+def get_nlp():
+    """Load the spaCy model on first use, without the components subject extraction does not need."""
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            try:
+                _nlp = spacy.load('en_core_web_md', exclude=EXCLUDED_COMPONENTS)  # Medium-sized model with word vectors
+            except OSError:
+                # If model isn't installed, provide instructions
+                raise OSError("Please install the spaCy model by running: python -m spacy download en_core_web_md")
+        return _nlp
+
+
+def unit_rows(matrix):
+    """Scale every row of a matrix to unit length, leaving all-zero rows at zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def get_subject_matrix(subject_list):
+    """
+    Precompute the word vectors of a subject list, once per list.
+
+    Returns:
+        tuple: (subjects, matrix, starts, orths) where subjects are the subjects that have
+            vectors, matrix holds the unit-normalized vectors of their tokens row by row,
+            starts[i] is the first row of subjects[i] and orths are the token ids of the rows
+    """
+    key = tuple(subject_list)
+    if key not in _subject_matrices:
+        nlp = get_nlp()
+        subjects, starts, vectors, orths = [], [], [], []
+        for subject in subject_list:
+            # Only consider subject tokens with vectors
+            subject_tokens = [token for token in nlp(subject.lower()) if token.has_vector]
+            if subject_tokens:
+                subjects.append(subject)
+                starts.append(len(vectors))
+                vectors.extend(token.vector for token in subject_tokens)
+                orths.extend(token.orth for token in subject_tokens)
+        matrix = unit_rows(np.array(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        _subject_matrices[key] = (subjects, matrix, np.array(starts, dtype=np.intp), np.array(orths, dtype=np.uint64))
+    return _subject_matrices[key]
+
+
+def score_doc_subjects(doc, subject_list):
+    """
+    Score every subject against the meaningful words of a parsed lyrics doc.
+
+    A subject's score is the mean, over the meaningful words, of the best cosine similarity
+    between the word and one of the subject's tokens. All similarities come from a single
+    matrix multiply against the precomputed subject matrix.
+
+    Returns:
+        dict: Score per subject that has a word vector, or an empty dict if the lyrics have
+            no meaningful words
+    """
+    subjects, subject_matrix, starts, subject_orths = get_subject_matrix(subject_list)
+
+    # Only process words that have vectors
+    meaningful_words = [token for token in doc
+                        if token.pos_ in RELEVANT_POS
+                        and not token.is_stop
+                        and token.has_vector]
+    if not meaningful_words or not subjects:
+        return {}
+
+    word_matrix = unit_rows(np.array([word.vector for word in meaningful_words], dtype=np.float32))
+    similarities = word_matrix @ subject_matrix.T
+    # Identical words count as a perfect match, as in Token.similarity
+    word_orths = np.array([word.orth for word in meaningful_words], dtype=np.uint64)
+    similarities[word_orths[:, None] == subject_orths[None, :]] = 1.0
+
+    best_per_subject = np.maximum.reduceat(similarities, starts, axis=1)
+    scores = best_per_subject.sum(axis=0, dtype=np.float64) / len(meaningful_words)
+    return dict(zip(subjects, scores.tolist()))
+
+
+def score_subjects(lyrics, subject_list):
+    """Score every subject against the meaningful words of the lyrics, see score_doc_subjects."""
+    return score_doc_subjects(get_nlp()(lyrics.lower()), subject_list)
+
+
+def best_subject(subject_scores):
+    """Return the highest scoring subject if it clears SUBJECT_THRESHOLD, else None."""
+    if not subject_scores:
+        return None
+
+    # Lower threshold since we're being more selective with words
+    subject, score = max(subject_scores.items(), key=lambda x: x[1])
+    return subject if score > SUBJECT_THRESHOLD else None
+
+
+def extract_subject_with_spacy(lyrics, subject_list):
+    """
+    Extract the most relevant subject from lyrics using spaCy's word vectors
+    """
+    return best_subject(score_subjects(lyrics, subject_list))
+
+
+def extract_subjects(lyrics_stream, subject_list=SUBJECTS, batch_size=64, n_process=1):
+    """
+    Extract subjects for a stream of lyrics with nlp.pipe.
+
+    Args:
+        lyrics_stream (iterable): Lyrics texts
+        subject_list (list): List of predefined subjects to match against
+        batch_size (int): Number of texts parsed per batch
+        n_process (int): Number of worker processes parsing the texts
+
+    Yields:
+        str: The subject of each text, in input order (None if none clears the threshold)
+    """
+    # Built in the parent process, which scores the docs returned by the workers
+    get_subject_matrix(subject_list)
+    docs = get_nlp().pipe((lyrics.lower() for lyrics in lyrics_stream),
+                          batch_size=batch_size, n_process=n_process)
+    for doc in docs:
+        yield best_subject(score_doc_subjects(doc, subject_list))
+
+
+def classify_cached_lyrics(cache=None, subject_list=SUBJECTS, batch_size=64, n_process=1,
+                           recompute=False, write_every=1000):
+    """
+    Compute subjects for the cached lyrics and store them in the cache.
+
+    Args:
+        cache (LyricsCache): Cache holding the lyrics, defaults to the default cache file
+        subject_list (list): List of predefined subjects to match against
+        batch_size (int): Number of texts parsed per batch
+        n_process (int): Number of worker processes parsing the texts
+        recompute (bool): Also recompute subjects already computed with subject_list
+        write_every (int): Number of subjects written to the cache at a time
+
+    Returns:
+        int: Number of songs classified
+    """
+    cache = cache or LyricsCache()
+    get_subject_matrix(subject_list)
+    # iter_lyrics pages by key, so subjects written for earlier keys do not affect later pages
+    rows = cache.iter_lyrics(stale_for=None if recompute else subject_list)
+    docs = get_nlp().pipe(((lyrics.lower(), key) for key, lyrics in rows), as_tuples=True,
+                          batch_size=batch_size, n_process=n_process)
+
+    n_classified = 0
+    pending = []
+    for doc, key in docs:
+        pending.append((key, best_subject(score_doc_subjects(doc, subject_list))))
+        if len(pending) >= write_every:
+            cache.set_subjects(pending, subject_list)
+            n_classified += len(pending)
+            pending = []
+    if pending:
+        cache.set_subjects(pending, subject_list)
+        n_classified += len(pending)
+    logging.info(f"Classified {n_classified} cached songs")
+    return n_classified
+
+
+def recompute_subjects(subject_list=SUBJECTS, cache=None):
+    """
+    Recompute the subject of every cached song from its cached lyrics, without network calls.
+
+    Returns:
+        int: Number of songs updated
+    """
+    return classify_cached_lyrics(cache, subject_list, recompute=True)
+
+
+def write_subjects_to_csv(path, cache=None, subject_list=SUBJECTS):
+    """
+    Write the cached subjects into the 'subject' column of a songs CSV.
+
+    The CSV is the source of its feature store, so the subjects survive every later
+    reconversion of the store, e.g. after the collectors append to the CSV. It is
+    streamed row by row into a file next to it, which then replaces it, and the store
+    is reconverted. Rows without cached lyrics or whose cached subject was computed
+    with another subject list keep their current subject.
+
+    Args:
+        path (str): Songs CSV file
+        cache (LyricsCache): Cache holding the subjects
+        subject_list (list): Subject list the cached subjects must have been computed with
+
+    Returns:
+        int: Number of rows whose subject was written
+    """
+    cache = cache or LyricsCache()
+    subject_list = list(subject_list)
+    n_rows = n_written = 0
+    with open(path, newline='', encoding='utf-8') as source, \
+            open(path + '.tmp', 'w', newline='', encoding='utf-8') as target:
+        reader = csv.reader(source)
+        writer = csv.writer(target)
+        header = next(reader)
+        writer.writerow(header)
+        subject_index = header.index('subject')
+        title_index = header.index('name' if 'name' in header else 'track_name')
+        artist_index = header.index('artist')
+        for row in reader:
+            n_rows += 1
+            entry = cache.get(row[title_index], row[artist_index])
+            if entry and entry['found'] and entry['subject_list'] == subject_list:
+                row[subject_index] = entry['subject'] or ''
+                n_written += 1
+            writer.writerow(row)
+    os.replace(path + '.tmp', path)
+    FeatureStore.open(path)
+
+    logging.info(f"Wrote {n_written}/{n_rows} subjects into {path}")
+    return n_written
+
+
+def main():
+    """Classify all cached lyrics and write the subjects into the song CSVs."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    cache = LyricsCache()
+    classify_cached_lyrics(cache, n_process=os.cpu_count() or 1)
+    for path in sorted(glob.glob('data/*_songs_features.csv')):
+        write_subjects_to_csv(path, cache)
+
+
+if __name__ == "__main__":
+    main()